@@ -0,0 +1,66 @@
+import argparse
+import hashlib
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import hash_key, split_meta, format_meta
+
+
+def legacy_hash_key(key):
+    # utils.hash_key before hashes were memoized and forwarded
+    key = key.lower().strip()
+    return int(hashlib.sha1(key.encode()).hexdigest(), 16) % (2 ** 64)
+
+
+def load_keys(directory):
+    keys = []
+    for filename in sorted(os.listdir(directory)):
+        if filename.startswith("insert_") and filename.endswith(".txt"):
+            with open(os.path.join(directory, filename), 'r', encoding='utf-8') as file:
+                keys.extend(f'"{line.strip()}"' for line in file if line.strip())
+    return keys
+
+
+def per_key_ns(func, keys, repeat):
+    number = max(1, 200000 // len(keys))
+    best = min(timeit.repeat(lambda: [func(key) for key in keys], number=number, repeat=repeat))
+    return best / (number * len(keys)) * 1e9
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-request hashing cost along a forwarding route")
+    parser.add_argument("--insert-dir", type=str, default="insert", help="Directory with insert_*.txt key files")
+    parser.add_argument("--hops", type=int, nargs="+", default=[1, 3, 5, 10], help="Route lengths to measure")
+    parser.add_argument("--repeat", type=int, default=7, help="Timing repetitions, best one is reported")
+    args = parser.parse_args()
+
+    keys = load_keys(args.insert_dir)
+    if not keys:
+        print(f"No keys found in '{args.insert_dir}'.")
+        sys.exit(1)
+
+    plain = {key: f"insert {key} 1" for key in keys}
+    tagged = {key: f"insert {key} 1" + format_meta(hash=hash_key(key)) for key in keys}
+    memo = {key: hash_key(key) for key in keys}
+
+    # every node strips the metadata, so the plain split is paid on the legacy route too
+    legacy_hop = per_key_ns(lambda key: (split_meta(plain[key]), legacy_hash_key(key)), keys, args.repeat)
+    entry_hash = per_key_ns(lambda key: (split_meta(plain[key]), hash_key(key)), keys, args.repeat)
+    entry_memo = per_key_ns(lambda key: (split_meta(plain[key]), memo.get(key)), keys, args.repeat)
+    forwarded_hop = per_key_ns(lambda key: int(split_meta(tagged[key])[1]["hash"]), keys, args.repeat)
+
+    print(f"{len(keys)} keys, best of {args.repeat} runs\n")
+    print(f"legacy hash per hop:       {legacy_hop:8.0f} ns")
+    print(f"entry hash (cold):         {entry_hash:8.0f} ns")
+    print(f"entry hash (memo hit):     {entry_memo:8.0f} ns")
+    print(f"forwarded hash per hop:    {forwarded_hop:8.0f} ns\n")
+
+    print(f"{'hops':>5} {'legacy (us)':>12} {'cold (us)':>12} {'memo (us)':>12} {'saved (us)':>12}")
+    for hops in args.hops:
+        legacy = hops * legacy_hop / 1000
+        cold = (entry_hash + (hops - 1) * forwarded_hop) / 1000
+        warm = (entry_memo + (hops - 1) * forwarded_hop) / 1000
+        print(f"{hops:>5} {legacy:>12.2f} {cold:>12.2f} {warm:>12.2f} {legacy - cold:>12.2f}")
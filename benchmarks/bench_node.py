@@ -0,0 +1,248 @@
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import hash_key, custom_split
+from logger import ERROR
+from node import Node
+
+# one node, no sockets: a replication factor of 1 keeps inserts, queries and deletes local.
+# inserts append to existing keys, so inserts and deletes walk through fresh keys
+new_keys, deleted_keys = itertools.count(), itertools.count()
+DISPATCH_COMMANDS = {
+    "insert": lambda: f'insert "new song {next(new_keys)}" 42',
+    "query": 'query "song 1"',
+    "query_miss": 'query "Stairway to Heaven"',
+    "delete": lambda: f'delete "new song {next(deleted_keys)}"',
+    "get_network_config": "get_network_config",
+    "get_ring": "get_ring",
+    "get_predecessor": "get_predecessor",
+    "overlay": "overlay",
+    "stats": "stats",
+    "load_report": "load_report",
+    "bloom_stats": "bloom_stats",
+    "increment_hop": 'increment_hop ["Stairway to Heaven"]',
+    "transfer_keys": "transfer_keys 0",
+}
+
+
+class FakeClient:
+    # the parts of a client socket handle_request uses
+    def __init__(self, request):
+        self.request = request.encode()
+        self.sent = b""
+
+    def settimeout(self, timeout):
+        pass
+
+    def recv(self, size):
+        data, self.request = self.request[:size], self.request[size:]
+        return data
+
+    def fileno(self):
+        return 0
+
+    def sendall(self, data):
+        self.sent = data
+
+    def send(self, data):
+        self.sent = data
+
+    def close(self):
+        pass
+
+
+def make_node(keys=0, replication_factor=1):
+    node = Node("127.0.0.1", 7999, bootstrap=True, replication_factor=replication_factor, consistency="chain",
+                log_level=ERROR)
+    for i in range(keys):
+        key = f"song {i}"
+        node.data[key] = {"value": str(i), "hop": i % replication_factor}
+        node.index_key(key, hash_key(key))
+        node.track_bytes(key, node.data[key])
+    return node
+
+
+def lazy(build):
+    # a fixture built on first use and shared after that, a filtered run builds only what it times
+    built = []
+
+    def get():
+        if not built:
+            built.append(build())
+        return built[0]
+    return get
+
+
+def time_it(func, min_time, runs, setup=None):
+    # pyperf style: calibrate the loop count so one run takes min_time, then report the spread of the runs
+    loops = 1
+    while True:
+        if setup is not None:
+            setup()
+        began = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - began
+        if elapsed >= min_time or setup is not None:
+            break
+        loops *= 2 if elapsed < min_time / 10 else max(2, int(min_time / max(elapsed, 1e-9)))
+    timings = []
+    for _ in range(runs):
+        if setup is not None:
+            setup()
+        began = time.perf_counter()
+        for _ in range(loops):
+            func()
+        timings.append((time.perf_counter() - began) / loops * 1e9)
+    return {
+        "mean_ns": round(statistics.mean(timings), 1),
+        "median_ns": round(statistics.median(timings), 1),
+        "min_ns": round(min(timings), 1),
+        "stdev_ns": round(statistics.stdev(timings), 1) if len(timings) > 1 else 0.0,
+        "runs": runs,
+        "loops": loops
+    }
+
+
+def benchmarks(sizes):
+    # name -> build; build() makes the fixture and returns (func, setup), setup runs before every timed run
+    # for benchmarks that consume or change their input
+    def ring_node():
+        node = make_node(1000)
+        node.predecessor = Node("127.0.0.1", 7998, log_level=ERROR)
+        return node
+    ring = lazy(ring_node)
+    key_hashes = [hash_key(f"song {i}") for i in range(1000)]
+
+    def responsible_for():
+        node = ring()
+        return lambda: [node.responsible_for(h) for h in key_hashes], None
+
+    cases = {
+        "hash_key": lambda: (lambda: hash_key('"Bohemian Rhapsody"'), None),
+        "custom_split/command": lambda: (lambda: custom_split('insert "Bohemian Rhapsody" 42'), None),
+        "custom_split/json": lambda: (lambda: custom_split(
+            'receive_keys {"Bohemian Rhapsody": {"value": "42", "hop": 0}, "Imagine": {"value": "7", "hop": 1}}'), None),
+        "responsible_for": responsible_for,
+    }
+
+    dispatch = lazy(lambda: make_node(1000))
+
+    def dispatch_case(make_command):
+        node = dispatch()
+        return lambda: node.handle_request(FakeClient(make_command())), None
+
+    def transfer_case(command):
+        # transfer_keys hands keys over and drops them, so it gets a store of its own, fresh for every run
+        nodes = []
+
+        def fresh():
+            nodes[:] = [make_node(1000)]
+        return lambda: nodes[0].handle_request(FakeClient(command)), fresh
+
+    for name, command in DISPATCH_COMMANDS.items():
+        if name == "transfer_keys":
+            cases[f"handle_request/{name}"] = lambda command=command: transfer_case(command)
+            continue
+        make_command = command if callable(command) else (lambda command=command: command)
+        cases[f"handle_request/{name}"] = lambda make_command=make_command: dispatch_case(make_command)
+
+    for size in sizes:
+        # transfer_keys and query * only read the big store, increment_hop changes it and gets its own
+        big = lazy(lambda size=size: make_node(size, replication_factor=3))
+        hop_big = lazy(lambda size=size: make_node(size, replication_factor=3))
+
+        def transfer(big=big):
+            node = big()
+            # selection against the middle of the id space, so about half the primaries move
+            return lambda: node.select_transfer(2 ** 63), None
+
+        def increment_hop(hop_big=hop_big, size=size):
+            node = hop_big()
+            hop_keys = [f"song {i}" for i in range(0, size, 10)]
+
+            def reset_hops():
+                for i in range(size):
+                    key = f"song {i}"
+                    record = node.data.get(key)
+                    if record is None:
+                        node.data[key] = {"value": str(i), "hop": i % 3}
+                        node.track_bytes(key, node.data[key])
+                    else:
+                        record["hop"] = i % 3
+            # a tenth of the keys move one hop further, those past the replication factor are dropped
+            return lambda: node.increment_hops(hop_keys), reset_hops
+
+        def query_star(big=big):
+            node = big()
+            return lambda: node.query("*"), None
+
+        cases[f"transfer_keys/{size}"] = transfer
+        cases[f"increment_hop/{size}"] = increment_hop
+        cases[f"query_star_json/{size}"] = query_star
+    return cases
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print(f"\n{'benchmark':<32} {'baseline':>12} {'now':>12} {'ratio':>8}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        ratio = result["median_ns"] / before["median_ns"] if before["median_ns"] else 0.0
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print(f"{name:<32} {before['median_ns']:>12.0f} {result['median_ns']:>12.0f} {ratio:>8.2f}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the node's hot paths, no network involved")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="Stored key counts for the transfer_keys, increment_hop and query * benchmarks")
+    parser.add_argument("--runs", type=int, default=7, help="Timed runs per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.1, help="Seconds one run should take at least")
+    parser.add_argument("--filter", type=str, help="Only run the benchmarks whose name contains this text")
+    parser.add_argument("--output", type=str, default="bench_node.json", help="File the JSON results are written to")
+    parser.add_argument("--compare", type=str, help="Earlier JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Median slowdown ratio reported as a regression (default: 1.2)")
+    args = parser.parse_args()
+
+    results = {}
+    for name, build in benchmarks(args.sizes).items():
+        if args.filter and args.filter not in name:
+            continue
+        func, setup = build()
+        results[name] = time_it(func, args.min_time, args.runs, setup)
+        result = results[name]
+        print(f"{name:<32} {result['median_ns']:>14.0f} ns  +- {result['stdev_ns']:.0f} ({result['loops']} loops)")
+
+    report = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "results": results
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=4)
+    print(f"\nResults saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file)["results"], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
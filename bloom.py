@@ -0,0 +1,79 @@
+import base64
+import zlib
+
+
+class BloomFilter:
+    def __init__(self, size=16384, hashes=4):
+        self.size = size
+        self.hashes = hashes
+        # counting filter, so that deletes can clear bits again
+        self.counters = bytearray(size)
+        self.bits = bytearray((size + 7) // 8)
+        self.set_bits = 0
+        self.count = 0
+
+    def positions(self, key_hash):
+        # double hashing over the two halves of the 64-bit key hash
+        h1 = key_hash & 0xFFFFFFFF
+        h2 = (key_hash >> 32) | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key_hash):
+        for pos in self.positions(key_hash):
+            if self.counters[pos] == 0:
+                self.bits[pos >> 3] |= 1 << (pos & 7)
+                self.set_bits += 1
+            if self.counters[pos] < 255:
+                self.counters[pos] += 1
+        self.count += 1
+
+    def remove(self, key_hash):
+        for pos in self.positions(key_hash):
+            # saturated counters stay set, we can no longer tell how many keys share them
+            if 0 < self.counters[pos] < 255:
+                self.counters[pos] -= 1
+                if self.counters[pos] == 0:
+                    self.bits[pos >> 3] &= ~(1 << (pos & 7)) & 0xFF
+                    self.set_bits -= 1
+        self.count = max(0, self.count - 1)
+
+    def might_contain(self, key_hash):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self.positions(key_hash))
+
+    def clear(self):
+        self.counters = bytearray(self.size)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.set_bits = 0
+        self.count = 0
+
+    def false_positive_rate(self):
+        # probability that all probed bits of an absent key are set
+        return (self.set_bits / self.size) ** self.hashes
+
+    def memory_bytes(self):
+        return {"counters": len(self.counters), "published": len(self.bits)}
+
+    def encode(self):
+        return base64.b64encode(zlib.compress(bytes(self.bits))).decode()
+
+    @classmethod
+    def decode(cls, size, hashes, encoded, count=0):
+        # read-only copy of a neighbour's published filter (no counters)
+        bloom = cls.__new__(cls)
+        bloom.size = size
+        bloom.hashes = hashes
+        bloom.counters = bytearray()
+        bloom.bits = bytearray(zlib.decompress(base64.b64decode(encoded)))
+        bloom.set_bits = sum(bin(byte).count("1") for byte in bloom.bits)
+        bloom.count = count
+        return bloom
+
+    def stats(self):
+        return {
+            "bits": self.size,
+            "hashes": self.hashes,
+            "keys": self.count,
+            "fill_ratio": round(self.set_bits / self.size, 4),
+            "false_positive_rate": round(self.false_positive_rate(), 6),
+            "memory_bytes": self.memory_bytes()
+        }
@@ -0,0 +1,410 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import queue
+import time
+
+from colorama import Fore, Style, init
+from tqdm import tqdm
+
+from client import answers_of, batch_command, insert_failed, send_once, shared_client
+from ring import TokenRing
+from utils import hash_key
+
+init(autoreset=True)
+
+CHECKPOINT_FORMAT = 1
+# a quote would end the quoted key early and a line break the request; "::" starts request metadata
+UNSUPPORTED = ('"', "\r", "\n", "::")
+
+
+def input_format(path, forced=None):
+    if forced:
+        return forced
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    if extension in (".csv", ".tsv", ".txt"):
+        return "csv"
+    raise ValueError(f"Cannot tell the format of {path}, give it with --format")
+
+
+def column_of(header, field, path):
+    # a column name, or a column number when the file has no header or no column by that name
+    if header is not None and field in header:
+        return header.index(field)
+    if field.isdigit():
+        return int(field)
+    if header is None:
+        raise ValueError(f"{path} has no header, the fields must be column numbers")
+    raise ValueError(f"{path} has no column {field!r}")
+
+
+def read_csv(path, key_field=None, value_field=None, header=True, delimiter=None):
+    delimiter = delimiter or ("\t" if path.lower().endswith(".tsv") else ",")
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        names = next(reader, None) if header else None
+        key_column = column_of(names, key_field or ("key" if header else "0"), path)
+        value_column = column_of(names, value_field or ("value" if header else "1"), path)
+        for row in reader:
+            if not row:
+                continue
+            if max(key_column, value_column) >= len(row):
+                yield None, None
+            else:
+                yield row[key_column], row[value_column]
+
+
+def read_jsonl(path, key_field=None, value_field=None):
+    key_field, value_field = key_field or "key", value_field or "value"
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                yield None, None
+                continue
+            if not isinstance(record, dict) or key_field not in record or value_field not in record:
+                yield None, None
+            else:
+                yield record[key_field], record[value_field]
+
+
+def read_records(paths, forced_format=None, key_field=None, value_field=None, header=True, delimiter=None):
+    # (key, value) of every record, file after file, one line at a time; (None, None) for unreadable records
+    for path in paths:
+        if input_format(path, forced_format) == "jsonl":
+            yield from read_jsonl(path, key_field, value_field)
+        else:
+            yield from read_csv(path, key_field, value_field, header, delimiter)
+
+
+def as_text(field):
+    return field if isinstance(field, str) else json.dumps(field, separators=(",", ":"))
+
+
+def insert_command(key, value):
+    # the insert for a record and its key's hash, None for records the text protocol cannot carry
+    if key is None or value is None:
+        return None
+    key, value = as_text(key).strip(), as_text(value).strip()
+    text = key + value
+    if not key or not value or any(part in text for part in UNSUPPORTED) or ("[" in text and "]" in text):
+        # with both brackets the node reads the request as a JSON list
+        return None
+    if any(char.isspace() for char in value):
+        # the node reads an unquoted value up to the first space, a quoted one is stored with its quotes
+        value = f'"{value}"'
+    key = f'"{key}"'
+    # the node hashes the key as sent, quotes included
+    return f"insert {key} {value}", hash_key(key)
+
+
+def load_checkpoint(path, inputs):
+    with open(path, encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("format") != CHECKPOINT_FORMAT or checkpoint.get("inputs") != inputs:
+        raise ValueError(f"{path} is the checkpoint of another import")
+    return checkpoint
+
+
+def save_checkpoint(path, inputs, records, complete=False):
+    # written aside and renamed, so a crash leaves the previous checkpoint whole
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump({"format": CHECKPOINT_FORMAT, "inputs": inputs, "records": records, "complete": complete,
+                   "updated": time.time()}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+class BulkImport:
+    # streams records straight to the nodes that own them: keys are hashed and placed on the client with the
+    # ring of the entry node, buffered per owner and sent as one batch request per owner, with at most window
+    # batches in flight and at most buffer_limit records buffered, so memory stays flat whatever the input size.
+    # Records are numbered in input order; the position is the count before the first one not yet acknowledged.
+    def __init__(self, host="127.0.0.1", port=5000, batch_size=500, window=16, buffer_limit=20000, retries=3,
+                 timeout=30.0, linger=1.0):
+        self.entry = f"{host}:{port}"
+        self.host = host
+        self.port = port
+        self.batch_size = max(1, batch_size)
+        self.window = max(1, window)
+        self.buffer_limit = max(self.batch_size, buffer_limit)
+        self.retries = retries
+        self.timeout = timeout
+        # seconds a record may wait for its owner's batch to fill
+        self.linger = linger
+        self.ring = None
+        self.refreshed = 0.0
+        # owner -> [(number, command, key hash, attempt)], and when its first record was buffered
+        self.buffers = {}
+        self.oldest = {}
+        self.buffered = 0
+        # request number -> (owner, records, future, sent at)
+        self.in_flight = {}
+        self.completed = queue.Queue()
+        self.requests = itertools.count()
+        # (ready at, records) waiting for their backoff to pass
+        self.waiting = []
+        # numbers of the records read and not yet acknowledged
+        self.pending = set()
+        self.next_number = 0
+        self.imported = 0
+        self.skipped = 0
+        self.retried = 0
+        self.skipped_records = []
+        self.failed = []
+
+    @property
+    def position(self):
+        return min(self.pending) if self.pending else self.next_number
+
+    def refresh_ring(self):
+        try:
+            self.ring = TokenRing.from_json(json.loads(send_once("get_ring", self.host, self.port, self.timeout)))
+        except (OSError, ValueError):
+            # keep placing keys on the ring we have, the nodes forward what is no longer theirs
+            pass
+        self.refreshed = time.monotonic()
+
+    def owner(self, key_hash):
+        owner = self.ring.owner(key_hash) if self.ring is not None else None
+        return owner or self.entry
+
+    def add(self, key, value):
+        number = self.next_number
+        self.next_number += 1
+        insert = insert_command(key, value)
+        if insert is None:
+            self.skipped += 1
+            if len(self.skipped_records) < 5:
+                self.skipped_records.append((number, key))
+            return
+        self.pending.add(number)
+        self.route((number, insert[0], insert[1], 0))
+
+    def route(self, record):
+        owner = self.owner(record[2])
+        buffer = self.buffers.setdefault(owner, [])
+        if not buffer:
+            self.oldest[owner] = time.monotonic()
+        buffer.append(record)
+        self.buffered += 1
+        if len(buffer) >= self.batch_size:
+            self.flush(owner)
+        elif self.buffered >= self.buffer_limit:
+            self.flush(max(self.buffers, key=lambda endpoint: len(self.buffers[endpoint])))
+
+    def flush(self, owner):
+        records = self.buffers.pop(owner)
+        del self.oldest[owner]
+        self.buffered -= len(records)
+        number = next(self.requests)
+        commands = [record[1] for record in records]
+        host, port = owner.rsplit(":", 1)
+        try:
+            future = shared_client(host, int(port)).submit(commands[0] if len(commands) == 1 else batch_command(commands))
+        except OSError as e:
+            self.in_flight[number] = (owner, records, None, time.monotonic())
+            self.completed.put((number, e))
+            return
+        self.in_flight[number] = (owner, records, future, time.monotonic())
+        future.add_done_callback(lambda f, number=number: self.completed.put((number, f)))
+
+    def flush_stale(self):
+        now = time.monotonic()
+        for owner in [owner for owner, since in self.oldest.items() if now - since >= self.linger]:
+            if len(self.in_flight) >= self.window:
+                break
+            self.flush(owner)
+
+    def collect(self, wait=0.2):
+        # the answers that came back, and the requests that got none in time
+        done = []
+        try:
+            done.append(self.completed.get(timeout=wait) if wait else self.completed.get_nowait())
+            while True:
+                done.append(self.completed.get_nowait())
+        except queue.Empty:
+            pass
+        now = time.monotonic()
+        for number, (_, _, future, sent) in list(self.in_flight.items()):
+            if future is not None and not future.done() and now - sent > self.timeout:
+                if future.connection is not None:
+                    future.connection.forget(future)
+                done.append((number, TimeoutError(f"no answer within {self.timeout}s")))
+
+        for number, outcome in done:
+            if number not in self.in_flight:
+                continue
+            owner, records, _, _ = self.in_flight.pop(number)
+            if not isinstance(outcome, Exception):
+                try:
+                    outcome = outcome.result()
+                except OSError as e:
+                    outcome = e
+            if isinstance(outcome, Exception) and time.monotonic() - self.refreshed > 1.0:
+                # the owner may have left or failed, place its keys again on the ring as it is now
+                self.refresh_ring()
+            again = []
+            commands = [record[1] for record in records]
+            for record, answer in zip(records, answers_of(commands, outcome)):
+                if not insert_failed(answer):
+                    self.pending.discard(record[0])
+                    self.imported += 1
+                elif record[3] < self.retries:
+                    # safe to send again: inserting a value the key already holds changes nothing
+                    again.append(record[:3] + (record[3] + 1,))
+                else:
+                    self.failed.append((record[1], owner, answer))
+            if again:
+                self.retried += len(again)
+                self.waiting.append((time.monotonic() + 0.1 * 2 ** max(record[3] for record in again), again))
+                self.waiting.sort(key=lambda item: item[0])
+
+    def run(self, records, progress=None, checkpoint=None, checkpoint_interval=5.0):
+        # checkpoint(position) is called every checkpoint_interval seconds; stops at the first record that
+        # still fails after all retries, once the requests in flight are answered
+        self.refresh_ring()
+        records = iter(records)
+        exhausted = False
+        saved = shown = lingered = time.monotonic()
+        reported = 0
+        while True:
+            if self.failed:
+                # no new requests, wait for the ones in flight to settle the position
+                if not self.in_flight:
+                    break
+                self.collect()
+            elif len(self.in_flight) >= self.window:
+                self.collect()
+            elif self.waiting and self.waiting[0][0] <= time.monotonic():
+                # one record at a time, a retried batch may be spread over several owners by now
+                ready = self.waiting[0][1]
+                self.route(ready.pop())
+                if not ready:
+                    self.waiting.pop(0)
+            elif not exhausted:
+                record = next(records, None)
+                if record is None:
+                    exhausted = True
+                else:
+                    self.add(*record)
+                if not self.completed.empty():
+                    self.collect(0)
+            elif self.buffers:
+                self.flush(next(iter(self.buffers)))
+            elif self.in_flight or self.waiting:
+                self.collect(0.05 if self.waiting else 0.2)
+            else:
+                break
+
+            now = time.monotonic()
+            if self.oldest and not exhausted and now - lingered >= 0.1:
+                self.flush_stale()
+                lingered = now
+            if progress is not None and (self.imported + self.skipped - reported >= 1000 or now - shown >= 0.5):
+                progress(self.imported + self.skipped - reported, self)
+                reported = self.imported + self.skipped
+                shown = now
+            if checkpoint is not None and now - saved >= checkpoint_interval:
+                checkpoint(self.position)
+                saved = now
+        if progress is not None:
+            progress(self.imported + self.skipped - reported, self)
+        if checkpoint is not None:
+            checkpoint(self.position)
+        return not self.failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream key-value records from CSV or JSONL files into the ring, "
+                                                 "batched per owning node, resuming from a checkpoint")
+    parser.add_argument("inputs", nargs="+", help="CSV/TSV or JSONL files, imported in the given order")
+    parser.add_argument("--server-ip", type=str, default="127.0.0.1", help="The IP address of the entry node (default: 127.0.0.1)")
+    parser.add_argument("--server-port", type=int, default=5000, help="The port of the entry node (default: 5000)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Input format (default: from the file extension)")
+    parser.add_argument("--key-field", type=str,
+                        help="Column name or number, or JSON field, of the key (default: key, or column 0 with --no-header)")
+    parser.add_argument("--value-field", type=str,
+                        help="Column name or number, or JSON field, of the value (default: value, or column 1 with --no-header)")
+    parser.add_argument("--no-header", action="store_true", help="The CSV files have no header row")
+    parser.add_argument("--delimiter", type=str, help="CSV delimiter (default: tab for .tsv files, comma otherwise)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Keys per batch request to a node (default: 500)")
+    parser.add_argument("--window", type=int, default=16, help="Batch requests in flight (default: 16)")
+    parser.add_argument("--buffer", type=int, default=20000,
+                        help="Most keys buffered for their owners before the fullest batch is sent early (default: 20000)")
+    parser.add_argument("--linger", type=float, default=1.0,
+                        help="Seconds a key waits for its owner's batch to fill (default: 1)")
+    parser.add_argument("--retries", type=int, default=3, help="Retries of a failed key (default: 3)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for a batch's answer (default: 30)")
+    parser.add_argument("--checkpoint", type=str, default="bulk_import.checkpoint",
+                        help="File the import position is saved to (default: bulk_import.checkpoint)")
+    parser.add_argument("--checkpoint-interval", type=float, default=5.0,
+                        help="Seconds between checkpoint saves (default: 5)")
+    parser.add_argument("--resume", action="store_true", help="Skip the records the checkpoint says are imported")
+    args = parser.parse_args()
+
+    inputs = [os.path.abspath(path) for path in args.inputs]
+    try:
+        for path in inputs:
+            input_format(path, args.format)
+        start = load_checkpoint(args.checkpoint, inputs) if args.resume else None
+    except (OSError, ValueError) as e:
+        print(f"{Fore.RED}{e}{Style.RESET_ALL}")
+        exit(1)
+    if start is not None and start.get("complete"):
+        print(f"{Fore.GREEN}The checkpoint says all {start['records']} records are imported.{Style.RESET_ALL}")
+        exit(0)
+    first = start["records"] if start is not None else 0
+
+    importer = BulkImport(args.server_ip, args.server_port, args.batch_size, args.window, args.buffer, args.retries,
+                          args.timeout, args.linger)
+    importer.next_number = first
+    records = itertools.islice(read_records(inputs, args.format, args.key_field, args.value_field,
+                                            not args.no_header, args.delimiter), first, None)
+    print(f"{Fore.CYAN}Importing {len(inputs)} file(s) through {args.server_ip}:{args.server_port}"
+          f"{f', resuming after record {first}' if first else ''}, {args.batch_size} keys per batch, "
+          f"{args.window} batches in flight{Style.RESET_ALL}")
+
+    def show(count, state):
+        pbar.update(count)
+        pbar.set_postfix(skipped=state.skipped, retried=state.retried, buffered=state.buffered, refresh=False)
+
+    def checkpoint(position):
+        save_checkpoint(args.checkpoint, inputs, position)
+
+    started = time.monotonic()
+    try:
+        with tqdm(desc="Importing", unit="key", ncols=100) as pbar:
+            succeeded = importer.run(records, progress=show, checkpoint=checkpoint,
+                                     checkpoint_interval=args.checkpoint_interval)
+    except (OSError, ValueError) as e:
+        # an unreadable input: the position is where the import can go on once it is fixed
+        checkpoint(importer.position)
+        print(f"{Fore.RED}{e}{Style.RESET_ALL}")
+        exit(1)
+    except KeyboardInterrupt:
+        checkpoint(importer.position)
+        print(f"{Fore.YELLOW}Interrupted after record {importer.position}, run again with --resume to go on.{Style.RESET_ALL}")
+        exit(1)
+    elapsed = time.monotonic() - started
+
+    for number, key in importer.skipped_records:
+        print(f"{Fore.YELLOW}Skipped record {number}: {key!r} cannot be sent as an insert{Style.RESET_ALL}")
+    if not succeeded:
+        print(f"{Fore.RED}{len(importer.failed)} keys could not be inserted after {args.retries} retries:{Style.RESET_ALL}")
+        for command, owner, answer in importer.failed[:10]:
+            print(f"  {command} ({owner}): {answer}")
+        print(f"{Fore.RED}Stopped at record {importer.position}, run again with --resume to go on.{Style.RESET_ALL}")
+        exit(1)
+    save_checkpoint(args.checkpoint, inputs, importer.next_number, complete=True)
+    print(f"{Fore.GREEN}Imported {importer.imported} keys, skipped {importer.skipped}, in {elapsed:.1f}s "
+          f"({importer.imported / max(elapsed, 1e-9):.0f} keys/s){Style.RESET_ALL}")
@@ -0,0 +1,277 @@
+import argparse
+import json
+import time
+
+import numpy as np
+from colorama import Fore, Style
+from tabulate import tabulate
+
+from ring import TokenRing, vnode_ids, split_endpoint, load_stats
+from utils import hash_key
+from workloads import ZIPFIAN_CONSTANT, record_key
+
+REQUEST_COMMANDS = ("insert", "query", "delete")
+
+
+def made_up_endpoints(count):
+    # the same addresses as the simulator, so the first n nodes of a bigger plan are the nodes of a smaller one
+    return [f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}:5000" for i in range(count)]
+
+
+def topology(endpoints, vnodes=1):
+    ring = TokenRing()
+    for endpoint in endpoints:
+        ip, port = split_endpoint(endpoint)
+        for token in vnode_ids(ip, port, vnodes):
+            ring.owners[token] = endpoint
+    ring.refresh()
+    return ring
+
+
+def read_lines(paths):
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield line.strip()
+
+
+def request_key(line):
+    # "insert, <key>, <value>" / "query, <key>" lines of the request files, or a bare key
+    command, sep, rest = line.partition(",")
+    if sep and command.strip().lower() in REQUEST_COMMANDS:
+        return rest.split(",")[0].strip() if command.strip().lower() == "insert" else rest.strip()
+    return line
+
+
+def hash_keys(keys):
+    # sha1 cannot be vectorised, the digests are collected straight into one uint64 array;
+    # the node hashes the key as sent, quotes included, as every client sends it
+    return np.fromiter((hash_key(f'"{key}"') for key in keys), dtype=np.uint64, count=len(keys))
+
+
+def fnv_hashes(values):
+    # workloads.fnv_hash over a whole array, uint64 arithmetic wraps like the & 0xFFFFFFFFFFFFFFFF there
+    result = np.full(len(values), 0xCBF29CE484222325, dtype=np.uint64)
+    values = values.astype(np.uint64)
+    for _ in range(8):
+        result ^= values & np.uint64(0xFF)
+        result *= np.uint64(0x100000001B3)
+        values >>= np.uint64(8)
+    return result
+
+
+def key_weights(count, distribution):
+    # expected share of the requests every key gets, the way workloads.py picks them
+    if distribution == "uniform":
+        return np.full(count, 1.0 / count)
+    ranks = np.arange(count, dtype=np.uint64)
+    popularity = 1.0 / (ranks + 1.0) ** ZIPFIAN_CONSTANT
+    if distribution == "latest":
+        weights = popularity[::-1].copy()
+    else:
+        weights = np.bincount((fnv_hashes(ranks) % np.uint64(count)).astype(np.int64), weights=popularity,
+                              minlength=count)
+    return weights / weights.sum()
+
+
+class Placement:
+    # where every key of the sample lives on one topology
+    def __init__(self, ring, key_hashes, replication_factor, index):
+        self.ring = ring
+        self.endpoints = ring.endpoints()
+        self.replication_factor = min(replication_factor, len(self.endpoints))
+        tokens = np.array(ring.tokens, dtype=np.uint64)
+        # the first token at or after the hash, wrapping past the end, as TokenRing.token_for
+        self.token_index = np.searchsorted(tokens, key_hashes, side="left") % len(tokens)
+        owners = np.array([index[ring.owners[token]] for token in ring.tokens])
+        if ring.virtual:
+            # the keys of a token share its preference list, so the walk runs once per token and not per key
+            self.replicas = np.array([[index[endpoint] for endpoint in ring.preference_list(token, self.replication_factor)]
+                                      for token in ring.tokens])
+        else:
+            # plain chord placement: the owner followed by its successors
+            steps = np.arange(self.replication_factor)
+            self.replicas = owners[(np.arange(len(tokens))[:, None] + steps) % len(tokens)]
+        self.nodes = np.array([index[endpoint] for endpoint in self.endpoints])
+
+    def per_node(self, per_token, primary_only=False):
+        # sums a per-token value over the nodes holding the token's keys
+        columns = 1 if primary_only else self.replication_factor
+        totals = np.zeros(self.nodes.max() + 1)
+        for column in range(columns):
+            totals += np.bincount(self.replicas[:, column], weights=per_token, minlength=len(totals))
+        return totals[self.nodes]
+
+    def report(self, weights, top):
+        keys_per_token = np.bincount(self.token_index, minlength=len(self.ring.tokens)).astype(float)
+        load_per_token = np.bincount(self.token_index, weights=weights, minlength=len(self.ring.tokens))
+        ownership = self.ring.ownership()
+        columns = {
+            "primary_keys": self.per_node(keys_per_token, primary_only=True),
+            "stored_keys": self.per_node(keys_per_token),
+            "ownership": np.array([ownership[endpoint] for endpoint in self.endpoints]),
+            # every request enters at the key's primary; chain replication passes it along all replicas
+            "primary_load": self.per_node(load_per_token, primary_only=True),
+            "replica_load": self.per_node(load_per_token),
+        }
+        balance = {}
+        for name, values in columns.items():
+            balance[name] = dict(load_stats(values.tolist()), min=round(float(values.min()), 6),
+                                 max=round(float(values.max()), 6))
+        hottest = np.argsort(-columns["primary_load"], kind="stable")[:top]
+        return {
+            "nodes": len(self.endpoints),
+            "tokens": len(self.ring.tokens),
+            "replication_factor": self.replication_factor,
+            "balance": balance,
+            "hottest": [{"endpoint": self.endpoints[i], **{name: round(float(values[i]), 6)
+                                                          for name, values in columns.items()}} for i in hottest],
+        }
+
+    def key_replicas(self, width):
+        replicas = self.replicas[self.token_index]
+        if replicas.shape[1] < width:
+            replicas = np.hstack([replicas, np.full((len(replicas), width - replicas.shape[1]), -1)])
+        return replicas
+
+
+def movement(before, after, endpoints, bytes_per_key):
+    # what changing the topology moves: new primaries, and replica copies that have to be sent to a new holder
+    width = max(before.replication_factor, after.replication_factor)
+    old, new = before.key_replicas(width), after.key_replicas(width)
+    gained = np.zeros(len(endpoints), dtype=np.int64)
+    lost = np.zeros(len(endpoints), dtype=np.int64)
+    for column in range(width):
+        added = (new[:, column] >= 0) & ~np.any(new[:, [column]] == old, axis=1)
+        removed = (old[:, column] >= 0) & ~np.any(old[:, [column]] == new, axis=1)
+        gained += np.bincount(new[added, column], minlength=len(endpoints))
+        lost += np.bincount(old[removed, column], minlength=len(endpoints))
+    keys = len(old)
+    primaries_moved = int(np.count_nonzero(old[:, 0] != new[:, 0]))
+    copies_moved = int(gained.sum())
+    changed = [{"endpoint": endpoint, "gained": int(gained[i]), "lost": int(lost[i])}
+               for i, endpoint in enumerate(endpoints) if gained[i] or lost[i]]
+    return {
+        "keys": keys,
+        "primaries_moved": primaries_moved,
+        "primaries_moved_share": round(primaries_moved / keys, 4) if keys else 0,
+        "copies_moved": copies_moved,
+        "copies_moved_share": round(copies_moved / old[old >= 0].size, 4) if keys else 0,
+        "bytes_moved": int(copies_moved * bytes_per_key),
+        "nodes": sorted(changed, key=lambda node: -(node["gained"] + node["lost"])),
+    }
+
+
+def plan(keys, weights, endpoints, vnodes=1, replication_factor=3, to_endpoints=None, to_vnodes=None,
+         value_size=100, top=10):
+    started = time.perf_counter()
+    key_hashes = hash_keys(keys)
+    hashed = time.perf_counter()
+    rings = [topology(endpoints, vnodes)]
+    if to_endpoints is not None:
+        rings.append(topology(to_endpoints, to_vnodes or vnodes))
+    # one index over the nodes of both topologies, so placements compare node by node
+    union = sorted(set(endpoints) | set(to_endpoints or []))
+    index = {endpoint: i for i, endpoint in enumerate(union)}
+    placements = [Placement(ring, key_hashes, replication_factor, index) for ring in rings]
+    placed = time.perf_counter()
+
+    report = {
+        "keys": len(keys),
+        "hash_s": round(hashed - started, 3),
+        "placement_s": round(placed - hashed, 3),
+        "topologies": [placement.report(weights, top) for placement in placements],
+    }
+    if len(placements) == 2:
+        bytes_per_key = (sum(len(key) for key in keys) / len(keys) if keys else 0) + value_size
+        report["movement"] = movement(placements[0], placements[1], union, bytes_per_key)
+        report["movement"]["nodes"] = report["movement"]["nodes"][:top] if top else report["movement"]["nodes"]
+    return report
+
+
+def print_report(report):
+    print(f"{Fore.CYAN}Placed {report['keys']} keys, hashing took {report['hash_s']}s and placement "
+          f"{report['placement_s']}s{Style.RESET_ALL}")
+    for name, topo in zip(["Current", "Planned"], report["topologies"]):
+        print(f"\n{Fore.GREEN}{name} topology: {topo['nodes']} nodes, {topo['tokens']} tokens, "
+              f"replication factor {topo['replication_factor']}{Style.RESET_ALL}")
+        print(tabulate([[metric, stats["mean"], stats["stddev"], stats["min"], stats["max"], stats["max_over_mean"]]
+                        for metric, stats in topo["balance"].items()],
+                       headers=["Load Balance", "Mean", "Stddev", "Min", "Max", "Max / Mean"], tablefmt="pipe"))
+        print(f"\n{Fore.YELLOW}Hottest nodes by primary load{Style.RESET_ALL}")
+        print(tabulate([[node["endpoint"], node["primary_keys"], node["stored_keys"], node["ownership"],
+                         node["primary_load"], node["replica_load"]] for node in topo["hottest"]],
+                       headers=["Node", "Primary Keys", "Stored Keys", "Ownership", "Primary Load", "Replica Load"],
+                       tablefmt="pipe"))
+    if "movement" in report:
+        moved = report["movement"]
+        print(f"\n{Fore.GREEN}Moving to the planned topology: {moved['primaries_moved']} keys "
+              f"({moved['primaries_moved_share']:.2%}) change primary, {moved['copies_moved']} replica copies "
+              f"({moved['copies_moved_share']:.2%}, about {moved['bytes_moved'] / 1e6:.1f} MB) are sent to a new "
+              f"node{Style.RESET_ALL}")
+        if moved["nodes"]:
+            print(tabulate([[node["endpoint"], node["gained"], node["lost"]] for node in moved["nodes"]],
+                           headers=["Node", "Copies Gained", "Copies Lost"], tablefmt="pipe"))
+
+
+def parse_nodes(nodes, count):
+    if nodes:
+        return list(dict.fromkeys(nodes))
+    return made_up_endpoints(count)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Predict key placement, replica counts and request load per node "
+                                                 "for a planned ring, and what moves between two rings, without "
+                                                 "starting any node")
+    parser.add_argument("--nodes", type=str, nargs="+", help="The ring's nodes as ip:port")
+    parser.add_argument("--count", type=int, default=10, help="Number of made-up nodes when --nodes is not given "
+                                                              "(default: 10)")
+    parser.add_argument("--vnodes", type=int, default=1, help="Virtual ids per node (default: 1)")
+    parser.add_argument("--to-nodes", type=str, nargs="+", help="Nodes of the planned ring to compare against")
+    parser.add_argument("--to-count", type=int, help="Number of made-up nodes of the planned ring")
+    parser.add_argument("--to-vnodes", type=int, help="Virtual ids per node of the planned ring (default: --vnodes)")
+    parser.add_argument("--replication-factor", type=int, default=3, help="Replication factor (default: 3)")
+    parser.add_argument("--keys", type=str, nargs="+", help="Files with one key per line, or request files "
+                                                            "(insert, <key>, <value> / query, <key>)")
+    parser.add_argument("--records", type=int, default=1000000,
+                        help="YCSB-style keys user0000000000... placed when --keys is not given (default: 1000000)")
+    parser.add_argument("--distribution", type=str, choices=["uniform", "zipfian", "latest"], default="zipfian",
+                        help="Request popularity of the keys, in key order (default: zipfian)")
+    parser.add_argument("--requests", type=str, nargs="+",
+                        help="Request files whose key counts give the load instead of --distribution")
+    parser.add_argument("--value-size", type=int, default=100, help="Value bytes per key, to estimate data moved "
+                                                                   "(default: 100)")
+    parser.add_argument("--top", type=int, default=10, help="Nodes listed per table (default: 10)")
+    parser.add_argument("--output", type=str, help="File the JSON report is written to")
+    args = parser.parse_args()
+
+    if args.keys:
+        keys = list(dict.fromkeys(request_key(line) for line in read_lines(args.keys)))
+    else:
+        keys = [record_key(i) for i in range(args.records)]
+    if args.requests:
+        counts = {}
+        for line in read_lines(args.requests):
+            key = request_key(line)
+            counts[key] = counts.get(key, 0) + 1
+        # keys only seen in the requests get inserted by them
+        known = set(keys)
+        keys += [key for key in counts if key not in known]
+        weights = np.array([counts.get(key, 0) for key in keys], dtype=float)
+        weights /= weights.sum()
+    else:
+        weights = key_weights(len(keys), args.distribution)
+
+    to_endpoints = None
+    if args.to_nodes or args.to_count:
+        to_endpoints = parse_nodes(args.to_nodes, args.to_count)
+    report = plan(keys, weights, parse_nodes(args.nodes, args.count), vnodes=args.vnodes,
+                  replication_factor=args.replication_factor, to_endpoints=to_endpoints, to_vnodes=args.to_vnodes,
+                  value_size=args.value_size, top=args.top)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport saved to {args.output}")
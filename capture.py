@@ -0,0 +1,91 @@
+import json
+import queue
+import threading
+import time
+
+CAPTURE_FORMAT = 1
+
+
+class TrafficCapture:
+    # JSONL log of the client commands entering a node: a header line, then one line per command with its
+    # arrival offset in seconds ("t"), the command ("c"), the time the node took to answer ("ms") and
+    # whether the answer was an error ("err"); written by a background thread, like the logger
+    def __init__(self, queue_size=100000):
+        self.queue_size = queue_size
+        self.queue = None
+        self.lock = threading.Lock()
+        self.path = None
+        self.file = None
+        self.writer = None
+        self.started = None
+        self.captured = 0
+        self.dropped = 0
+
+    @property
+    def active(self):
+        return self.file is not None
+
+    def start(self, path, endpoint):
+        with self.lock:
+            if self.file is not None:
+                return False
+            self.path = path
+            self.file = open(path, "w", encoding="utf-8")
+            self.started = time.perf_counter()
+            self.captured = self.dropped = 0
+            # a queue of its own for every capture, the writer of a stopping one still drains the previous queue
+            self.queue = queue.Queue(self.queue_size)
+            self.file.write(json.dumps({"capture": endpoint, "format": CAPTURE_FORMAT, "started": time.time()}) + "\n")
+            self.writer = threading.Thread(target=self.write, args=(self.file, self.queue), daemon=True)
+            self.writer.start()
+            return True
+
+    def stop(self):
+        with self.lock:
+            if self.file is None:
+                return False
+            writer, self.file = self.writer, None
+            self.queue.put(None)
+        writer.join()
+        return True
+
+    def record(self, arrived, command, seconds, error):
+        # arrived is the perf_counter of the request's arrival
+        started, records = self.started, self.queue
+        if self.file is None or started is None:
+            return
+        try:
+            records.put_nowait((arrived - started, command, seconds, error))
+            self.captured += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def write(self, file, records):
+        while True:
+            item = records.get()
+            if item is None:
+                break
+            offset, command, seconds, error = item
+            file.write(json.dumps({"t": round(offset, 6), "c": command, "ms": round(seconds * 1000, 3),
+                                   "err": int(error)}, separators=(",", ":")) + "\n")
+        file.close()
+
+    def status(self):
+        return {
+            "capturing": self.active,
+            "path": self.path,
+            "captured": self.captured,
+            "dropped": self.dropped,
+            "elapsed": round(time.perf_counter() - self.started, 3) if self.active else None
+        }
+
+
+def read_capture(path):
+    # the header and the captured commands, ordered by arrival
+    with open(path, encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("format") != CAPTURE_FORMAT:
+            raise ValueError(f"{path} is not a traffic capture")
+        records = [json.loads(line) for line in f if line.strip()]
+    records.sort(key=lambda record: record["t"])
+    return header, records
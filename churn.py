@@ -0,0 +1,119 @@
+import time
+
+from cluster import Cluster
+from loadgen import SteadyLoad, run_load
+from workloads import Workload
+
+
+# joining nodes pull their keys with transfer_keys, departing nodes push theirs with receive_keys
+HANDOFF_COMMANDS = ("transfer_keys", "receive_keys")
+
+
+def transfer_stats(stats):
+    # key handoffs across the ring since the last stats reset. receive_keys forwards itself along the ring
+    # and each hop waits for the next, so the longest call is the duration of the whole handoff
+    count, total, longest = 0, 0.0, 0.0
+    for node in stats.values():
+        for command in HANDOFF_COMMANDS:
+            entry = node.get("commands", {}).get(command)
+            if not entry:
+                continue
+            latency = entry["latency_ms"]
+            count += latency["count"]
+            total += latency["mean"] * latency["count"]
+            longest = max(longest, latency["max"])
+    return count, round(total, 3), longest
+
+
+def key_counts(cluster):
+    return {node["port"]: node["key_count"] for node in cluster.overlay().values()}
+
+
+def churn_plan(min_nodes, max_nodes, step):
+    # grow from min_nodes to max_nodes, then shrink back, step nodes at a time
+    plan = []
+    nodes = min_nodes
+    while nodes < max_nodes:
+        count = min(step, max_nodes - nodes)
+        plan.append(("join", count))
+        nodes += count
+    while nodes > min_nodes:
+        count = min(step, nodes - min_nodes)
+        plan.append(("depart", count))
+        nodes -= count
+    return plan
+
+
+def run_scalability(min_nodes=2, max_nodes=8, step=2, step_duration=5.0, replication_factor=3, consistency="chain",
+                    records=1000, workload="B", workers=8, rate=None, base_port=6000, mode="subprocess",
+                    log_dir=None, timeout=30.0, network=None, on_step=None):
+    # a steady load runs throughout; every step joins or departs nodes, then measures the settled ring
+    cluster = Cluster(min_nodes, replication_factor, consistency, base_port, mode=mode,
+                      node_options={"log_level": "warning"}, log_dir=log_dir, network=network).start()
+    rows, events = [], []
+    load = None
+    try:
+        ycsb = Workload(workload, records, records * 10, 20, seed=11)
+        run_load(ycsb.load_commands(), workers=8, host=cluster.host, port=cluster.bootstrap_port)
+        load = SteadyLoad([commands for _, commands in ycsb.operations()], workers, rate, cluster.host,
+                          cluster.bootstrap_port).start()
+
+        def measure(index, action, transition, transition_seconds, keys_moved):
+            cluster.reset_stats()
+            time.sleep(step_duration)
+            steady = load.phase()
+            count, total, longest = transfer_stats(transition["transfer_stats"]) if transition else (0, 0.0, 0.0)
+            row = {
+                "step": index,
+                "action": action,
+                "nodes": len(cluster.ports),
+                "transition_s": round(transition_seconds, 3),
+                "keys_moved": keys_moved,
+                "transfer_calls": count,
+                "transfer_ms": total,
+                "transfer_max_ms": longest,
+                "transition_throughput": transition["summary"]["throughput"] if transition else None,
+                "transition_p99_ms": transition["summary"]["p99_ms"] if transition else None,
+                "transition_errors": transition["summary"]["errors"] if transition else 0,
+                "transition_misses": transition["summary"]["misses"] if transition else 0,
+                "summary": steady
+            }
+            rows.append(row)
+            if on_step is not None:
+                on_step(row)
+
+        load.phase()
+        measure(0, "baseline", None, 0.0, 0)
+        for index, (action, count) in enumerate(churn_plan(min_nodes, max_nodes, step), start=1):
+            cluster.reset_stats()
+            before = key_counts(cluster)
+            began = time.perf_counter()
+            events.append((began - load.started, f"{action} x{count}"))
+            load.phase()
+            try:
+                if action == "join":
+                    ports = [cluster.add_node(timeout) for _ in range(count)]
+                    after = key_counts(cluster)
+                    # the keys the new nodes took over
+                    keys_moved = sum(after.get(port, 0) for port in ports)
+                else:
+                    ports = [cluster.remove_node(timeout=timeout) for _ in range(count)]
+                    # the keys the departing nodes handed over
+                    keys_moved = sum(before.get(port, 0) for port in ports)
+            except TimeoutError as e:
+                # the ring did not close again under load, later steps would measure a broken ring
+                events.append((time.perf_counter() - load.started, f"{action} failed"))
+                failed = {"step": index, "action": action, "nodes": len(cluster.ports), "error": str(e),
+                          "transition_s": round(time.perf_counter() - began, 3), "summary": load.phase()}
+                rows.append(failed)
+                if on_step is not None:
+                    on_step(failed)
+                break
+            transition_seconds = time.perf_counter() - began
+            transition = {"summary": load.phase(), "transfer_stats": cluster.stats()}
+            measure(index, action, transition, transition_seconds, keys_moved)
+        return rows, events, load.throughput_timeline()
+    finally:
+        if load is not None:
+            load.stop()
+        cluster.stop()
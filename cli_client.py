@@ -5,6 +5,13 @@ from tqdm import tqdm
 import readline
 from colorama import Fore, Style, init
 import os
+import itertools
+import queue
+import time
+
+from client import shared_client, batch_command, answers_of, insert_failed
+from workloads import read_inserts, read_request_keys, request_files
+from ring import load_stats
 
 init(autoreset=True)
 
@@ -13,21 +20,7 @@ server_port = None
 
 def send_command(command, timeout=1):
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
-            client.settimeout(timeout)
-            client.connect((server_ip, server_port))
-            client.sendall(command.encode())
-
-            response = []
-            while True:
-                # read in chunks
-                chunk = client.recv(4096).decode()
-                # stop when no more data arrives
-                if not chunk:
-                    break
-                response.append(chunk)
-
-            return ''.join(response)
+        return shared_client(server_ip, server_port).send(command, timeout=timeout)
 
     except socket.timeout:
         print(f"{Fore.YELLOW}Error: Connection timed out after {timeout} seconds.{Style.RESET_ALL}")
@@ -62,6 +55,14 @@ def insert_data(key, value):
     else:
         print("Please enter both a key and a value.")
 
+def update_data(key, value):
+    if key.strip() and value.strip():
+        command = f'update "{key}" {value}'
+        response = send_command(command)
+        print(f"Response: {response}")
+    else:
+        print("Please enter both a key and a value.")
+
 def query_data(key):
     if key.strip():
         command = f'query "{key}"'
@@ -91,7 +92,51 @@ def fetch_overlay():
         successor = details.get("successor")
         predecessor = details.get("predecessor")
         key_count = details.get("key_count")
-        print(f"Predecessor: {str(predecessor)[-4:]} <= Node: {str(node_id)[-4:]} (Key Count: {key_count}) => Successor: {str(successor)[-4:]}")
+        vnodes = details.get("vnodes", 1)
+        memory = details.get("memory", {})
+        rss = f"{memory['rss'] / 1024 / 1024:.1f} MB" if "rss" in memory else "?"
+        print(f"Predecessor: {str(predecessor)[-4:]} <= Node: {str(node_id)[-4:]} (Key Count: {key_count}, VNodes: {vnodes}, RSS: {rss}) => Successor: {str(successor)[-4:]}")
+
+    print_load_balance(nodes)
+
+
+def print_load_balance(nodes):
+    # the same figures as the simulator and the capacity planner report
+    details = list(nodes.values())
+    keys = load_stats(d.get("key_count", 0) for d in details)
+    print(f"Key count: mean {keys['mean']:.1f}, variance {keys['variance']:.1f}, stddev {keys['stddev']:.1f}")
+
+    # expected primary load share of every node, with a single id per node and with the current virtual ids
+    if all("ownership" in d for d in details):
+        single = load_stats(d["single_token_ownership"] for d in details)
+        vnode = load_stats(d["ownership"] for d in details)
+        print(f"Ring ownership stddev: single id {single['stddev']:.4f} => virtual ids {vnode['stddev']:.4f}")
+
+
+def fetch_stats():
+    response = send_command("stats")
+    try:
+        stats = json.loads(response)
+    except (TypeError, json.JSONDecodeError):
+        print(f"Response: {response}")
+        return
+
+    print(f"Node {stats['endpoint']} up {stats['uptime']}s, {stats['active_handlers']} active handlers, "
+          f"{stats['bytes_in']} bytes in / {stats['bytes_out']} bytes out")
+    print(f"{'Command':<20}{'Requests':>10}{'Errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for command, entry in stats["commands"].items():
+        latency = entry["latency_ms"]
+        print(f"{command:<20}{entry['requests']:>10}{entry['errors']:>8}{latency['p50']:>10}"
+              f"{latency['p95']:>10}{latency['p99']:>10}{latency['max']:>10}")
+    print(f"Forwards: {stats['forwards']}")
+    print(f"Data: {stats['data']}")
+
+
+def rebalance(action, args):
+    # plans sample the request rates over a window, so wait longer than the default timeout
+    window = float(args[0]) if args else 2.0
+    response = send_command(" ".join(["rebalance", action] + args), timeout=window + 10)
+    print(f"Response: {response}")
 
 
 def validate_command(command):
@@ -99,18 +144,24 @@ def validate_command(command):
     if len(parts) == 0:
         return False, "Command cannot be empty."
 
-    if parts[0].lower() not in ["insert", "query", "delete", "overlay", "help"]:
+    if parts[0].lower() not in ["insert", "update", "query", "delete", "overlay", "stats", "rebalance", "help"]:
         return False, f"Unknown command: {parts[0]}"
 
     if parts[0].lower() == "insert" and len(parts) != 3:
         return False, "Insert command requires two arguments: <key> <value>"
 
+    if parts[0].lower() == "update" and len(parts) != 3:
+        return False, "Update command requires two arguments: <key> <value>"
+
     if parts[0].lower() == "query" and len(parts) != 2:
         return False, "Query command requires one argument: <key>"
 
     if parts[0].lower() == "delete" and len(parts) != 2:
         return False, "Delete command requires one argument: <key>"
 
+    if parts[0].lower() == "rebalance" and (len(parts) < 2 or parts[1].lower() not in ["plan", "run", "status"]):
+        return False, "Rebalance command requires an action: plan|run|status [window] [max_moves]"
+
     return True, ""
 
 
@@ -119,48 +170,139 @@ def process_command(command):
 
     if parts[0].lower() == "insert":
         insert_data(parts[1], parts[2])
+    elif parts[0].lower() == "update":
+        update_data(parts[1], parts[2])
     elif parts[0].lower() == "query":
         query_data(parts[1])
     elif parts[0].lower() == "delete":
         delete_data(parts[1])
     elif parts[0].lower() == "overlay":
         fetch_overlay()
+    elif parts[0].lower() == "stats":
+        fetch_stats()
+    elif parts[0].lower() == "rebalance":
+        rebalance(parts[1].lower(), parts[2:])
     elif parts[0].lower() == "help":
-        print("Commands: insert <key> <value>, query <key>, delete <key>, help")
+        print("Commands: insert <key> <value>, update <key> <value>, query <key>, delete <key>, overlay, stats, rebalance plan|run|status [window] [max_moves], help")
+
+
+def count_inserts(directory):
+    return sum(1 for _ in read_request_keys(directory, "insert_"))
+
+
+def chunked(commands, size):
+    chunk = []
+    for command in commands:
+        chunk.append(command)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
 
-def process_insert_directory(directory):
+def process_insert_directory(directory, window=64, batch_size=1, retries=3, timeout=10.0):
     if not os.path.exists(directory) or not os.path.isdir(directory):
         print(f"Error: Directory '{directory}' does not exist.")
         return
 
-    insert_files = sorted(f for f in os.listdir(directory) if f.startswith("insert_") and f.endswith(".txt"))
-
-    total_files = len(insert_files)
-    if total_files == 0:
+    total = count_inserts(directory)
+    if total == 0:
         print("No insert files found.")
         return
 
-    print(f"Processing {total_files} insert files...\n")
-
-    for filename in tqdm(insert_files, desc="Processing Files", unit="file", ncols=80):
-        filepath = os.path.join(directory, filename)
-        try:
-            with open(filepath, 'r', encoding='utf-8') as file:
-                value = filename.split('_')[1]
-                keys = [line.strip() for line in file if line.strip()]
-
-                for key in tqdm(keys, desc=f"Inserting keys from {filename}", unit="key", leave=False, ncols=80):
-                    command = f"insert \"{key}\" {value}"
-                    response = send_command(command)
-
-                    if not response or "error" in response.lower() or "400" in response or "failed" in response:
-                        print(f"\nError while inserting {key}: {response}")
-                        print("Batch insert failed! Exiting...")
-                        os._exit(1)
+    print(f"Inserting {total} keys from {len(request_files(directory, 'insert_'))} files, {window} requests in flight"
+          f"{f', {batch_size} keys per batch' if batch_size > 1 else ''}...\n")
+
+    client = shared_client(server_ip, server_port)
+    requests = chunked(read_inserts(directory), max(1, batch_size))
+    completed = queue.Queue()
+    # request number -> (commands, attempt, future, sent at)
+    in_flight = {}
+    # (ready at, commands, attempt) waiting for their backoff to pass
+    waiting = []
+    failed = []
+    counter = itertools.count()
+    exhausted = False
+    retried = 0
+
+    with tqdm(total=total, desc="Inserting", unit="key", ncols=100) as progress:
+        while True:
+            # keep the window full, retries first
+            while len(in_flight) < window:
+                now = time.monotonic()
+                if waiting and waiting[0][0] <= now:
+                    _, commands, attempt = waiting.pop(0)
+                elif not exhausted:
+                    commands, attempt = next(requests, None), 0
+                    if commands is None:
+                        exhausted = True
+                        continue
+                else:
+                    break
+                number = next(counter)
+                message = commands[0] if len(commands) == 1 else batch_command(commands)
+                try:
+                    future = client.submit(message)
+                except OSError as e:
+                    completed.put((number, e))
+                    in_flight[number] = (commands, attempt, None, now)
+                    continue
+                in_flight[number] = (commands, attempt, future, now)
+                future.add_done_callback(lambda f, number=number: completed.put((number, f)))
+
+            if not in_flight:
+                if not waiting:
+                    break
+                time.sleep(max(0.0, waiting[0][0] - time.monotonic()))
+                continue
 
-        except Exception as e:
-            print(f"Error processing {filename}: {e}")
+            try:
+                number, outcome = completed.get(timeout=0.2)
+                if number not in in_flight:
+                    continue
+                if not isinstance(outcome, Exception):
+                    try:
+                        outcome = outcome.result()
+                    except OSError as e:
+                        outcome = e
+                done = [(number, outcome)]
+            except queue.Empty:
+                done = []
+            # requests without an answer in time count as failed, a late answer is dropped
+            now = time.monotonic()
+            for number, (commands, attempt, future, sent) in list(in_flight.items()):
+                if future is not None and not future.done() and now - sent > timeout:
+                    if future.connection is not None:
+                        future.connection.forget(future)
+                    done.append((number, TimeoutError(f"no answer within {timeout}s")))
+
+            for number, outcome in done:
+                commands, attempt, _, _ = in_flight.pop(number)
+                again = []
+                for command, answer in zip(commands, answers_of(commands, outcome)):
+                    if not insert_failed(answer):
+                        progress.update(1)
+                    elif attempt < retries:
+                        # safe to send again: inserting a value the key already holds changes nothing
+                        again.append(command)
+                    else:
+                        failed.append((command, answer))
+                        progress.update(1)
+                if again:
+                    retried += len(again)
+                    waiting.append((time.monotonic() + 0.1 * 2 ** attempt, again, attempt + 1))
+                    waiting.sort(key=lambda item: item[0])
+                progress.set_postfix(retried=retried, failed=len(failed), refresh=False)
+
+    if failed:
+        print(f"{Fore.RED}{len(failed)} of {total} keys could not be inserted after {retries} retries:{Style.RESET_ALL}")
+        for command, answer in failed[:10]:
+            print(f"  {command}: {answer}")
+        print("Batch insert failed! Exiting...")
+        os._exit(1)
+    print(f"{Fore.GREEN}Inserted {total} keys in {progress.format_dict['elapsed']:.1f}s "
+          f"({total / max(progress.format_dict['elapsed'], 1e-9):.0f} keys/s){Style.RESET_ALL}")
 
 
 if __name__ == "__main__":
@@ -168,18 +310,24 @@ if __name__ == "__main__":
     parser.add_argument("--batch-insert", action="store_true", default=False, help="Whether to perform batch insert operation from directory.")
     parser.add_argument("--server-ip", type=str, default="127.0.0.1", help="The IP address of the bootstrap node (default: 127.0.0.1)")
     parser.add_argument("--server-port", type=int, default=5000, help="The port of the bootstrap node (default: 5000)")
+    parser.add_argument("--insert-dir", type=str, default="insert", help="Directory of the insert_*.txt files (default: insert)")
+    parser.add_argument("--window", type=int, default=64, help="Batch insert requests in flight at once (default: 64)")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Keys sent together in one batch request, 1 sends every key on its own (default: 1)")
+    parser.add_argument("--retries", type=int, default=3, help="Times a failed batch insert key is sent again (default: 3)")
+    parser.add_argument("--timeout", type=float, default=10.0,
+                        help="Seconds a batch insert request may wait for its answer (default: 10)")
 
     args = parser.parse_args()
 
     server_ip = args.server_ip
     server_port = args.server_port
 
-    insert_dir = "insert"
     if args.batch_insert:
-        process_insert_directory(insert_dir)
+        process_insert_directory(args.insert_dir, args.window, args.batch_size, args.retries, args.timeout)
 
     readline.set_history_length(100)
-    print("Commands: insert <key> <value>, query <key>, delete <key>, help")
+    print("Commands: insert <key> <value>, update <key> <value>, query <key>, delete <key>, overlay, stats, rebalance plan|run|status [window] [max_moves], help")
 
     while True:
         try:
@@ -0,0 +1,528 @@
+import asyncio
+import itertools
+import json
+import socket
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from framing import FRAME_MAGIC, encode_frame, decode_frames
+
+# commands that may be sent again after the connection broke while waiting for the answer;
+# an insert appends to an existing value and a delete may already have happened, so those are not
+IDEMPOTENT_COMMANDS = ("query", "local_query", "update", "overlay", "get_data", "get_network_config", "get_ring",
+                       "reset_config", "stats", "bloom_stats", "cache_stats", "traces", "memstats")
+# seconds a pooled connection may sit idle and still be reused, well below the node's idle timeout
+IDLE_REUSE = 30.0
+
+
+class FramingUnsupported(ConnectionError):
+    # the node answers one command per connection only
+    pass
+
+
+def is_idempotent(command):
+    return command.split(" ", 1)[0].lower() in IDEMPOTENT_COMMANDS
+
+
+def send_once(command, host="127.0.0.1", port=5000, timeout=10):
+    # the one-shot protocol: a connection per command, the answer ends when the node closes it
+    with socket.create_connection((host, port), timeout=timeout) as client:
+        client.sendall(command.encode())
+        response = []
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            response.append(chunk)
+        return b"".join(response).decode()
+
+
+def batch_command(commands):
+    return f"batch {json.dumps(list(commands))}"
+
+
+def answers_of(commands, outcome):
+    # one answer per command, from a single insert, a batch or the error that ended the request
+    if isinstance(outcome, Exception):
+        return [f"Error: {outcome}"] * len(commands)
+    if len(commands) == 1:
+        return [outcome]
+    try:
+        answers = json.loads(outcome)
+    except json.JSONDecodeError:
+        answers = None
+    if not isinstance(answers, list) or len(answers) != len(commands):
+        return [f"Error: {outcome}"] * len(commands)
+    return answers
+
+
+def insert_failed(response):
+    # judged by the answer's shape, the key itself may contain any word or number
+    return not response or response.lower().startswith("error") or "Inserted" not in response
+
+
+class Connection:
+    # one persistent connection with any number of requests in flight, answers are matched to requests by id
+    def __init__(self, host, port, timeout=10):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        try:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.sock.sendall(FRAME_MAGIC)
+            reply = b""
+            while len(reply) < len(FRAME_MAGIC):
+                chunk = self.sock.recv(len(FRAME_MAGIC) - len(reply))
+                if not chunk:
+                    break
+                reply += chunk
+        except OSError:
+            self.sock.close()
+            raise
+        if reply != FRAME_MAGIC:
+            self.sock.close()
+            raise FramingUnsupported(f"{host}:{port} does not keep connections open")
+        self.sock.settimeout(None)
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.closed = False
+        self.last_used = time.monotonic()
+        threading.Thread(target=self.read, daemon=True).start()
+
+    def submit(self, command):
+        # raises when the request could not be written, the node never saw it then; a frame is answered
+        # only once it arrived complete
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise ConnectionError("Connection closed")
+            request_id = next(self.ids) & 0xFFFFFFFF
+            self.pending[request_id] = future
+            try:
+                self.sock.sendall(encode_frame(request_id, command))
+            except OSError:
+                self.pending.pop(request_id, None)
+                self.closed = True
+                raise
+            self.last_used = time.monotonic()
+        future.request_id = request_id
+        future.connection = self
+        return future
+
+    def forget(self, future):
+        with self.lock:
+            self.pending.pop(getattr(future, "request_id", None), None)
+
+    def read(self):
+        buffer = b""
+        error = ConnectionError("Connection closed by the node")
+        try:
+            while True:
+                chunk = self.sock.recv(65536)
+                if not chunk:
+                    break
+                frames, buffer = decode_frames(buffer + chunk)
+                for request_id, response in frames:
+                    with self.lock:
+                        future = self.pending.pop(request_id, None)
+                    if future is not None:
+                        future.set_result(response)
+        except OSError as e:
+            error = ConnectionError(f"Connection lost: {e}")
+        with self.lock:
+            self.closed = True
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(error)
+        self.sock.close()
+
+    def idle(self):
+        return not self.pending and time.monotonic() - self.last_used > IDLE_REUSE
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class ChordClient:
+    # a pool of persistent connections to one node; requests from any number of threads are pipelined over them
+    def __init__(self, host="127.0.0.1", port=5000, pool_size=4, timeout=10.0, retries=2, backoff=0.05,
+                 pipelining=True):
+        self.host = host
+        self.port = port
+        self.pool_size = max(1, pool_size)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        # cleared when the node only speaks the one-shot protocol
+        self.framed = pipelining
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def connection(self):
+        with self.lock:
+            for connection in self.connections:
+                if connection.idle():
+                    connection.close()
+            self.connections = [connection for connection in self.connections if not connection.closed]
+            if len(self.connections) < self.pool_size:
+                connection = Connection(self.host, self.port, self.timeout)
+                self.connections.append(connection)
+                return connection
+            return min(self.connections, key=lambda connection: len(connection.pending))
+
+    def submit(self, command):
+        # a Future of the answer, the request goes out before this returns; a one-shot node gets it from a thread
+        if self.framed:
+            try:
+                return self.connection().submit(command)
+            except FramingUnsupported:
+                self.framed = False
+        future = Future()
+        future.connection = None
+
+        def send():
+            try:
+                future.set_result(send_once(command, self.host, self.port, self.timeout))
+            except OSError as e:
+                future.set_exception(e)
+        threading.Thread(target=send, daemon=True).start()
+        return future
+
+    def wait(self, future, timeout):
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            # a late answer is dropped
+            if future.connection is not None:
+                future.connection.forget(future)
+            raise TimeoutError(f"No answer from {self.host}:{self.port} within {timeout}s") from None
+
+    def send(self, command, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        attempt = 0
+        while True:
+            sent = False
+            try:
+                if not self.framed:
+                    sent = True
+                    return send_once(command, self.host, self.port, timeout)
+                future = self.submit(command)
+                sent = True
+                return self.wait(future, timeout)
+            except FramingUnsupported:
+                self.framed = False
+            except TimeoutError:
+                # the node may still carry the request out, sending it again could apply it twice
+                raise
+            except OSError as e:
+                # a refused connection never carried the request
+                sent = sent and not isinstance(e, ConnectionRefusedError)
+                if attempt >= self.retries or (sent and not is_idempotent(command)):
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+
+    def send_many(self, commands, window=64, timeout=None, return_exceptions=False):
+        # pipelines the commands with up to window of them in flight, the answers come back in order
+        commands = list(commands)
+        timeout = self.timeout if timeout is None else timeout
+        results = [None] * len(commands)
+        slots = threading.Semaphore(max(1, window))
+        futures = []
+        for index, command in enumerate(commands):
+            slots.acquire()
+            try:
+                if not self.framed:
+                    raise FramingUnsupported("one-shot node")
+                future = self.submit(command)
+            except OSError:
+                # not sent, send() takes care of falling back, retrying and reporting it
+                slots.release()
+                futures.append((index, None))
+                continue
+            future.add_done_callback(lambda _: slots.release())
+            futures.append((index, future))
+        for index, future in futures:
+            try:
+                if future is None:
+                    results[index] = self.send(commands[index], timeout)
+                else:
+                    try:
+                        results[index] = self.wait(future, timeout)
+                    except ConnectionError:
+                        if not is_idempotent(commands[index]):
+                            raise
+                        results[index] = self.send(commands[index], timeout)
+            except OSError as e:
+                if not return_exceptions:
+                    raise
+                results[index] = e
+        return results
+
+    def batch(self, commands, timeout=None):
+        # the commands in one request, carried out by the node one after the other
+        commands = list(commands)
+        response = self.send(batch_command(commands), timeout)
+        try:
+            answers = json.loads(response)
+        except json.JSONDecodeError:
+            answers = None
+        if not isinstance(answers, list) or len(answers) != len(commands):
+            # a node without the batch command
+            return self.send_many(commands, timeout=timeout)
+        return answers
+
+    def insert(self, key, value):
+        return self.send(f'insert "{key}" {value}')
+
+    def update(self, key, value):
+        return self.send(f'update "{key}" {value}')
+
+    def query(self, key):
+        return self.send(f'query "{key}"')
+
+    def delete(self, key):
+        return self.send(f'delete "{key}"')
+
+    def overlay(self):
+        return json.loads(self.send("overlay"))
+
+    def reset_config(self, replication_factor, consistency):
+        return self.send(f"reset_config {replication_factor} {consistency}")
+
+    def get_network_config(self):
+        return self.send("get_network_config").strip()
+
+    def get_data(self, node_id):
+        return self.send(f"get_data {node_id}")
+
+    def close(self):
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for connection in connections:
+            connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.closed = False
+        self.last_used = time.monotonic()
+        self.task = asyncio.get_running_loop().create_task(self.read())
+
+    @classmethod
+    async def open(cls, host, port, timeout=10):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        try:
+            writer.write(FRAME_MAGIC)
+            await writer.drain()
+            reply = await asyncio.wait_for(reader.readexactly(len(FRAME_MAGIC)), timeout)
+        except asyncio.IncompleteReadError:
+            reply = b""
+        except (OSError, asyncio.TimeoutError):
+            writer.close()
+            raise
+        if reply != FRAME_MAGIC:
+            writer.close()
+            raise FramingUnsupported(f"{host}:{port} does not keep connections open")
+        return cls(reader, writer)
+
+    async def submit(self, command):
+        if self.closed:
+            raise ConnectionError("Connection closed")
+        request_id = next(self.ids) & 0xFFFFFFFF
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            self.writer.write(encode_frame(request_id, command))
+            await self.writer.drain()
+        except OSError:
+            self.pending.pop(request_id, None)
+            self.closed = True
+            raise
+        self.last_used = time.monotonic()
+        future.request_id = request_id
+        return future
+
+    def forget(self, future):
+        self.pending.pop(getattr(future, "request_id", None), None)
+
+    async def read(self):
+        buffer = b""
+        error = ConnectionError("Connection closed by the node")
+        try:
+            while True:
+                chunk = await self.reader.read(65536)
+                if not chunk:
+                    break
+                frames, buffer = decode_frames(buffer + chunk)
+                for request_id, response in frames:
+                    future = self.pending.pop(request_id, None)
+                    if future is not None and not future.done():
+                        future.set_result(response)
+        except OSError as e:
+            error = ConnectionError(f"Connection lost: {e}")
+        self.closed = True
+        pending, self.pending = self.pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self.writer.close()
+
+    def idle(self):
+        return not self.pending and time.monotonic() - self.last_used > IDLE_REUSE
+
+    def close(self):
+        self.closed = True
+        self.writer.close()
+
+
+async def send_once_async(command, host="127.0.0.1", port=5000, timeout=10):
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(command.encode())
+        await writer.drain()
+        return (await asyncio.wait_for(reader.read(), timeout)).decode()
+    finally:
+        writer.close()
+
+
+class AsyncChordClient:
+    # the asyncio counterpart of ChordClient, for one event loop
+    def __init__(self, host="127.0.0.1", port=5000, pool_size=4, timeout=10.0, retries=2, backoff=0.05,
+                 pipelining=True):
+        self.host = host
+        self.port = port
+        self.pool_size = max(1, pool_size)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.framed = pipelining
+        self.connections = []
+        self.lock = asyncio.Lock()
+
+    async def connection(self):
+        async with self.lock:
+            for connection in self.connections:
+                if connection.idle():
+                    connection.close()
+            self.connections = [connection for connection in self.connections if not connection.closed]
+            if len(self.connections) < self.pool_size:
+                connection = await AsyncConnection.open(self.host, self.port, self.timeout)
+                self.connections.append(connection)
+                return connection
+            return min(self.connections, key=lambda connection: len(connection.pending))
+
+    async def send(self, command, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        attempt = 0
+        while True:
+            sent = False
+            try:
+                if not self.framed:
+                    sent = True
+                    return await send_once_async(command, self.host, self.port, timeout)
+                connection = await self.connection()
+                future = await connection.submit(command)
+                sent = True
+                try:
+                    return await asyncio.wait_for(future, timeout)
+                except asyncio.TimeoutError:
+                    connection.forget(future)
+                    raise TimeoutError(f"No answer from {self.host}:{self.port} within {timeout}s") from None
+            except FramingUnsupported:
+                self.framed = False
+            except TimeoutError:
+                raise
+            except OSError as e:
+                sent = sent and not isinstance(e, ConnectionRefusedError)
+                if attempt >= self.retries or (sent and not is_idempotent(command)):
+                    raise
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+
+    async def send_many(self, commands, window=64, timeout=None, return_exceptions=False):
+        slots = asyncio.Semaphore(max(1, window))
+
+        async def send(command):
+            async with slots:
+                return await self.send(command, timeout)
+        return await asyncio.gather(*(send(command) for command in commands), return_exceptions=return_exceptions)
+
+    async def batch(self, commands, timeout=None):
+        commands = list(commands)
+        response = await self.send(batch_command(commands), timeout)
+        try:
+            answers = json.loads(response)
+        except json.JSONDecodeError:
+            answers = None
+        if not isinstance(answers, list) or len(answers) != len(commands):
+            return await self.send_many(commands, timeout=timeout)
+        return answers
+
+    async def insert(self, key, value):
+        return await self.send(f'insert "{key}" {value}')
+
+    async def update(self, key, value):
+        return await self.send(f'update "{key}" {value}')
+
+    async def query(self, key):
+        return await self.send(f'query "{key}"')
+
+    async def delete(self, key):
+        return await self.send(f'delete "{key}"')
+
+    async def overlay(self):
+        return json.loads(await self.send("overlay"))
+
+    async def reset_config(self, replication_factor, consistency):
+        return await self.send(f"reset_config {replication_factor} {consistency}")
+
+    async def get_network_config(self):
+        return (await self.send("get_network_config")).strip()
+
+    async def get_data(self, node_id):
+        return await self.send(f"get_data {node_id}")
+
+    async def close(self):
+        async with self.lock:
+            connections, self.connections = self.connections, []
+        for connection in connections:
+            connection.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+clients = {}
+clients_lock = threading.Lock()
+
+
+def shared_client(host="127.0.0.1", port=5000, pool_size=None):
+    # one pooled client per node for the whole process, the front ends and load generators share it;
+    # a pool size grows its pool to at least that many connections, it never shrinks
+    with clients_lock:
+        if (host, port) not in clients:
+            clients[(host, port)] = ChordClient(host, port)
+        client = clients[(host, port)]
+        if pool_size:
+            with client.lock:
+                client.pool_size = max(client.pool_size, pool_size)
+        return client
@@ -0,0 +1,300 @@
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from loadgen import send_command, run_load
+from logger import LEVELS
+from netproxy import LinkProxy, add_link_arguments, link_settings
+
+NODE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "node.py")
+# with a simulated network every node binds its port plus this offset, its proxy serves the advertised port
+PROXY_PORT_OFFSET = 10000
+
+
+def node_flags(options):
+    # {"vnodes": 4, "log_json": True} -> ["--vnodes", "4", "--log_json"]
+    flags = []
+    for name, value in options.items():
+        if value is True:
+            flags.append(f"--{name}")
+        elif value is not None and value is not False:
+            flags += [f"--{name}", str(value)]
+    return flags
+
+
+def ring_is_stable(overlay, size):
+    # every node is listed and the successor pointers form one cycle matching the predecessor pointers
+    if len(overlay) != size:
+        return False
+    nodes = {str(node["node_id"]): node for node in overlay.values()}
+    for node_id, node in nodes.items():
+        successor = nodes.get(str(node["successor"]))
+        if successor is None or str(successor["predecessor"]) != node_id:
+            return False
+    seen = set()
+    node_id = next(iter(nodes))
+    while node_id not in seen:
+        seen.add(node_id)
+        node_id = str(nodes[node_id]["successor"])
+    return len(seen) == size
+
+
+class Cluster:
+    # an N-node ring on localhost ports, started as subprocesses or as Node objects in this process
+    def __init__(self, size=4, replication_factor=3, consistency="chain", base_port=5000, host="127.0.0.1",
+                 mode="subprocess", node_options=None, log_dir=None, python=sys.executable, network=None,
+                 network_seed=0):
+        if mode not in ("subprocess", "inprocess"):
+            raise ValueError(f"Unknown mode {mode}, expected subprocess or inprocess")
+        self.size = size
+        self.replication_factor = replication_factor
+        self.consistency = consistency
+        self.base_port = base_port
+        self.host = host
+        self.mode = mode
+        # extra node.py options, by flag name without the dashes
+        self.node_options = node_options or {}
+        self.log_dir = log_dir
+        self.python = python
+        # link settings of netproxy.LinkProxy put in front of every node, None for direct connections
+        self.network = network
+        self.network_seed = network_seed
+        # port -> subprocess.Popen or in-process Node, in joining order
+        self.members = {}
+        self.proxies = {}
+        self.log_files = []
+
+    @property
+    def ports(self):
+        return list(self.members)
+
+    @property
+    def bootstrap_port(self):
+        return self.base_port
+
+    def listen_port(self, port):
+        return port + PROXY_PORT_OFFSET if self.network is not None else port
+
+    def send(self, command, port=None):
+        # control requests go straight to the node, only the traffic of the ring and the load crosses the links
+        return send_command(command, self.host, self.listen_port(port or self.bootstrap_port))
+
+    def port_in_use(self, port):
+        # a real request, an empty connection would show up as a failed request in the node's log
+        try:
+            send_command("get_network_config", self.host, port, timeout=0.5)
+            return True
+        except OSError:
+            return False
+
+    def wait_for_port(self, port, timeout=10.0):
+        deadline = time.time() + timeout
+        member = self.members.get(port)
+        while time.time() < deadline:
+            if isinstance(member, subprocess.Popen) and member.poll() is not None:
+                raise RuntimeError(f"Node {self.host}:{port} exited with code {member.returncode}")
+            if self.port_in_use(self.listen_port(port)):
+                return True
+            time.sleep(0.05)
+        raise TimeoutError(f"Node {self.host}:{port} did not start listening within {timeout}s")
+
+    def start(self, timeout=30.0):
+        try:
+            for i in range(self.size):
+                self.launch(self.base_port + i, bootstrap=i == 0)
+            self.wait_stable(timeout)
+        except BaseException:
+            self.stop()
+            raise
+        return self
+
+    def launch(self, port, bootstrap=False):
+        for used in {port, self.listen_port(port)}:
+            if self.port_in_use(used):
+                raise RuntimeError(f"Port {used} is already served, stop the nodes running there first")
+        if self.network is not None:
+            # the proxy is up before the node, so the ring can reach the node as soon as it joins
+            self.proxies[port] = LinkProxy(port, self.listen_port(port), self.host, self.host,
+                                           seed=self.network_seed + port, **self.network).start()
+        if self.mode == "subprocess":
+            self.members[port] = self.start_process(port, bootstrap)
+        else:
+            self.members[port] = self.start_node(port, bootstrap)
+        # joins are serialized, each one through an already listening bootstrap node
+        self.wait_for_port(port)
+
+    def add_node(self, timeout=30.0):
+        # a live join on the next free port, returns once the ring has closed around it
+        port = max(self.ports) + 1
+        while self.port_in_use(port):
+            port += 1
+        self.size += 1
+        self.launch(port)
+        self.wait_stable(timeout)
+        return port
+
+    def remove_node(self, port=None, graceful=True, timeout=30.0):
+        # the most recently joined node by default, the bootstrap node always stays
+        if port is None:
+            port = self.ports[-1]
+        if port == self.bootstrap_port:
+            raise ValueError("The bootstrap node cannot leave the ring")
+        member = self.members.pop(port)
+        self.size -= 1
+        self.stop_member(member, graceful, timeout)
+        if port in self.proxies:
+            self.proxies.pop(port).stop()
+        self.wait_stable(timeout)
+        return port
+
+    def set_link(self, port=None, **settings):
+        # change the link in front of one node, or of every node, while the ring runs
+        if self.network is None:
+            raise RuntimeError("The cluster was started without a simulated network")
+        for proxy_port, proxy in self.proxies.items():
+            if port is None or proxy_port == port:
+                proxy.update(**settings)
+
+    def link_stats(self):
+        return {port: proxy.stats() for port, proxy in self.proxies.items()}
+
+    def start_process(self, port, bootstrap):
+        args = [self.python, NODE_SCRIPT, "--ip", self.host, "--port", str(port)]
+        if bootstrap:
+            args += ["--bootstrap", "--replication_factor", str(self.replication_factor),
+                     "--consistency", self.consistency]
+        else:
+            args += ["--bootstrap_ip", self.host, "--bootstrap_port", str(self.bootstrap_port)]
+        if self.network is not None:
+            args += ["--listen_port", str(self.listen_port(port))]
+        args += node_flags(self.node_options)
+        output = subprocess.DEVNULL
+        if self.log_dir:
+            os.makedirs(self.log_dir, exist_ok=True)
+            output = open(os.path.join(self.log_dir, f"node_{port}.log"), "w")
+            self.log_files.append(output)
+        return subprocess.Popen(args, stdout=output, stderr=subprocess.STDOUT)
+
+    def start_node(self, port, bootstrap):
+        from node import Node
+        options = dict(self.node_options, listen_port=self.listen_port(port))
+        # node.py takes the level by name, Node by number
+        if isinstance(options.get("log_level"), str):
+            options["log_level"] = LEVELS[options["log_level"]]
+        if bootstrap:
+            node = Node(self.host, port, bootstrap=True, replication_factor=self.replication_factor,
+                        consistency=self.consistency, **options)
+        else:
+            node = Node(self.host, port, bootstrap_ip=self.host, bootstrap_port=self.bootstrap_port, **options)
+        threading.Thread(target=node.start_server, daemon=True).start()
+        return node
+
+    def overlay(self):
+        return json.loads(self.send("overlay"))
+
+    def wait_stable(self, timeout=30.0, interval=0.2):
+        deadline = time.time() + timeout
+        last = None
+        while time.time() < deadline:
+            try:
+                last = self.overlay()
+                if ring_is_stable(last, self.size):
+                    return last
+            except (OSError, ValueError):
+                pass
+            time.sleep(interval)
+        seen = len(last) if last else 0
+        raise TimeoutError(f"Ring did not stabilize within {timeout}s ({seen} of {self.size} nodes in the overlay)")
+
+    def reset_config(self, replication_factor, consistency):
+        response = self.send(f"reset_config {replication_factor} {consistency}")
+        self.replication_factor, self.consistency = int(replication_factor), consistency
+        return response
+
+    def run(self, commands, workers=8, rate=None, **kwargs):
+        return run_load(commands, workers=workers, rate=rate, host=self.host, port=self.bootstrap_port, **kwargs)
+
+    def stats(self):
+        # each node's own counters, by port
+        stats = {}
+        for port in self.ports:
+            try:
+                stats[port] = json.loads(self.send("stats", port))
+            except (OSError, ValueError) as e:
+                stats[port] = {"error": str(e)}
+        return stats
+
+    def reset_stats(self):
+        for port in self.ports:
+            self.send("stats reset", port)
+
+    def stop_member(self, member, graceful, timeout=10.0):
+        # graceful departs and hands the keys over, otherwise the node is simply killed
+        if isinstance(member, subprocess.Popen):
+            if member.poll() is None:
+                member.send_signal(signal.SIGINT if graceful else signal.SIGKILL)
+                try:
+                    member.wait(timeout)
+                except subprocess.TimeoutExpired:
+                    member.kill()
+                    member.wait()
+        else:
+            if graceful:
+                member.depart()
+            member.stop_server()
+
+    def stop(self, graceful=False, timeout=10.0):
+        members = list(self.members.values())
+        if not graceful:
+            # quiet the background loops of in-process nodes first, so no node reports the others going away
+            for member in members:
+                if not isinstance(member, subprocess.Popen):
+                    member.stopped = True
+        for member in reversed(members):
+            self.stop_member(member, graceful, timeout)
+        for proxy in self.proxies.values():
+            proxy.stop()
+        for log_file in self.log_files:
+            log_file.close()
+        self.members, self.proxies, self.log_files = {}, {}, []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Start a local Chord ring on consecutive localhost ports")
+    parser.add_argument("--nodes", type=int, default=4, help="Number of nodes (default: 4)")
+    parser.add_argument("--replication-factor", type=int, default=3, help="Replication factor (default: 3)")
+    parser.add_argument("--consistency", type=str, choices=["chain", "eventual"], default="chain",
+                        help="Consistency type (default: chain)")
+    parser.add_argument("--base-port", type=int, default=5000, help="Port of the bootstrap node, the others follow (default: 5000)")
+    parser.add_argument("--vnodes", type=int, default=1, help="Virtual ids per node (default: 1)")
+    parser.add_argument("--log-dir", type=str, help="Directory for one log file per node (default: discard the logs)")
+    add_link_arguments(parser)
+    parser.add_argument("--network-seed", type=int, default=0, help="Seed of the link delays and resets (default: 0)")
+    args = parser.parse_args()
+
+    network = link_settings(args) or None
+    cluster = Cluster(args.nodes, args.replication_factor, args.consistency, args.base_port,
+                      node_options={"vnodes": args.vnodes}, log_dir=args.log_dir, network=network,
+                      network_seed=args.network_seed)
+    try:
+        cluster.start()
+        print(f"Ring of {args.nodes} nodes is up on ports {cluster.ports[0]}-{cluster.ports[-1]}, Control-C stops it.")
+        if network:
+            print(f"Every node is behind a proxy with {network}, the nodes themselves listen on "
+                  f"{cluster.listen_port(cluster.ports[0])}-{cluster.listen_port(cluster.ports[-1])}.")
+        signal.pause()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cluster.stop()
@@ -0,0 +1,26 @@
+import struct
+
+# first bytes of a connection that stays open for framed requests instead of carrying a single command;
+# the node echoes them back, a node without framing answers them as an invalid command and closes
+FRAME_MAGIC = b"\x00CHORD/1\n"
+# every frame: payload length and request id, then the UTF-8 payload; answers carry the id of their request
+FRAME_HEADER = struct.Struct(">II")
+
+
+def encode_frame(request_id, payload):
+    data = payload.encode()
+    return FRAME_HEADER.pack(len(data), request_id) + data
+
+
+def decode_frames(buffer):
+    # the complete frames at the front of the buffer, and the bytes of the incomplete one after them
+    frames = []
+    offset = 0
+    while len(buffer) - offset >= FRAME_HEADER.size:
+        length, request_id = FRAME_HEADER.unpack_from(buffer, offset)
+        end = offset + FRAME_HEADER.size + length
+        if end > len(buffer):
+            break
+        frames.append((request_id, buffer[offset + FRAME_HEADER.size:end].decode()))
+        offset = end
+    return frames, buffer[offset:]
@@ -3,11 +3,18 @@ import streamlit as st
 from streamlit_option_menu import option_menu
 import datetime
 import networkx as nx
+import base64
 import json
 from tqdm import tqdm
 import matplotlib.pyplot as plt
 import os
 import socket
+from client import shared_client
+from loadgen import run_load, sweep_offered_load, saturation_point
+from workloads import Workload, WORKLOADS, read_insert_commands, read_query_commands
+from results_store import ResultsStore, compare_runs, RESULT_FIELDS, DEFAULT_PATH
+from staleness import run_staleness
+from churn import run_scalability
 
 plt.style.use("dark_background")
 
@@ -176,19 +183,7 @@ def is_node_running(ip, port):
 
 def send_command(command):
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
-            client.connect((BOOTSTRAP_IP, BOOTSTRAP_PORT))
-            client.sendall(command.encode())
-
-            response = []
-            while True:
-                chunk = client.recv(4096).decode()
-                if not chunk:
-                    break
-                response.append(chunk)
-
-            return "".join(response)
-
+        return shared_client(BOOTSTRAP_IP, BOOTSTRAP_PORT).send(command)
     except Exception as e:
         return f"Error: {e}"
 
@@ -230,6 +225,18 @@ def fetch_data_from_node(node_id):
     except Exception as e:
         return {"error": str(e)}
 
+def profile_node(node_id, action, *args):
+    try:
+        response = send_command(" ".join(["profile", action, node_id] + [str(arg) for arg in args]))
+        if not response.strip():
+            return {"error": "Empty response from node"}
+        return json.loads(response)
+
+    except json.JSONDecodeError:
+        return {"error": f"Invalid JSON format from node: {response}"}
+    except Exception as e:
+        return {"error": str(e)}
+
 def visualize_chord_ring():
     nodes = fetch_nodes()
 
@@ -293,6 +300,29 @@ def visualize_chord_ring():
 
     st.pyplot(fig)
 
+    # per-node load spread, with a single id per node and with the current virtual ids
+    key_counts = pd.Series([details.get("key_count", 0) for details in nodes.values()])
+    caption = f"Key count variance: {key_counts.var(ddof=0):.1f} (stddev {key_counts.std(ddof=0):.1f})"
+    if all("ownership" in details for details in nodes.values()):
+        single = pd.Series([details["single_token_ownership"] for details in nodes.values()])
+        virtual = pd.Series([details["ownership"] for details in nodes.values()])
+        caption += f" | Ring ownership stddev: single id {single.std(ddof=0):.4f} → virtual ids {virtual.std(ddof=0):.4f}"
+    st.caption(caption)
+
+    # memory per node, collected by the same overlay walk
+    if all("memory" in details for details in nodes.values()):
+        memory = pd.DataFrame([
+            {
+                "Node": node_id[-4:],
+                "Key Count": details.get("key_count", 0),
+                "Data (KB)": round(details["memory"]["data_bytes"] / 1024, 1),
+                "RSS (MB)": round(details["memory"]["rss"] / 1024 / 1024, 1),
+                "Threads": details["memory"]["threads"]
+            }
+            for node_id, details in nodes.items()
+        ])
+        st.dataframe(memory, hide_index=True, use_container_width=True)
+
 def process_insert_directory(directory):
     if not os.path.exists(directory) or not os.path.isdir(directory):
         return False, 0, None, 0
@@ -676,10 +706,64 @@ elif selected == "Overlay":
             else:
                 st.warning("Please enter a valid Node ID.")
 
+        st.markdown("### Profile a Node")
+        col212, col213, col214 = st.columns([4, 2, 2])
+        with col212:
+            profile_node_id = st.text_input("Enter Node ID to Profile:", key="profile_node_id")
+        with col213:
+            profile_duration = st.number_input("Duration (s):", min_value=1, max_value=300, value=10, key="profile_duration")
+        with col214:
+            profile_interval = st.number_input("Interval (ms):", min_value=1, max_value=100, value=5, key="profile_interval")
+
+        col215, col216, col217 = st.columns([2, 2, 2])
+        with col215:
+            if st.button("Start Profile"):
+                if profile_node_id.strip():
+                    status = profile_node(profile_node_id.strip(), "start", profile_duration, profile_interval / 1000)
+                    if "error" in status:
+                        st.error(status["error"])
+                    elif not status["started"]:
+                        st.warning("A profile is already running on this node.")
+                    else:
+                        st.success(f"Profiling node {status['node_id'][-4:]} for {profile_duration}s.")
+                else:
+                    st.warning("Please enter a valid Node ID.")
+        with col216:
+            if st.button("Stop Profile"):
+                if profile_node_id.strip():
+                    status = profile_node(profile_node_id.strip(), "stop")
+                    if "error" in status:
+                        st.error(status["error"])
+                    else:
+                        st.info(f"Stopped after {status['samples']} samples.")
+        with col217:
+            if st.button("Fetch Profile"):
+                if profile_node_id.strip():
+                    collapsed = profile_node(profile_node_id.strip(), "dump", "collapsed")
+                    pstats_dump = profile_node(profile_node_id.strip(), "dump", "pstats")
+                    if "error" in collapsed or "error" in pstats_dump:
+                        st.error(collapsed.get("error") or pstats_dump.get("error"))
+                    else:
+                        st.session_state["profile_result"] = (collapsed, pstats_dump)
+
+        if "profile_result" in st.session_state:
+            collapsed, pstats_dump = st.session_state["profile_result"]
+            st.caption(f"Node {collapsed['node_id'][-4:]}: {collapsed['state']}, {collapsed['samples']} samples "
+                       f"over {collapsed['elapsed']}s, {collapsed['stacks']} distinct stacks")
+            col218, col219 = st.columns([2, 2])
+            with col218:
+                st.download_button("Download collapsed stacks", collapsed["data"],
+                                   file_name=f"profile_{collapsed['node_id'][-4:]}.collapsed.txt")
+            with col219:
+                st.download_button("Download pstats", base64.b64decode(pstats_dump["data"]),
+                                   file_name=f"profile_{pstats_dump['node_id'][-4:]}.prof")
+
 if selected == "Experiments":
     st.markdown("<h2 style='text-align: center;'>Experiments</h2>", unsafe_allow_html=True)
 
-    experiment_type = st.selectbox("Select Experiment Type", ["Write Throughput", "Read Throughput", "Freshness"])
+    experiment_type = st.selectbox("Select Experiment Type", ["Write Throughput", "Read Throughput", "Freshness", "Open-Loop Sweep",
+                                                             "YCSB Workloads", "Staleness", "Scalability & Churn",
+                                                             "Results History"])
 
 
     def process_insert_directory(directory):
@@ -806,6 +890,28 @@ if selected == "Experiments":
         return f"Error: {response}"
 
 
+    def plot_latency_curves(df):
+        fig, ax = plt.subplots(figsize=(8, 5))
+        colors = {"chain": ["#80C7E0", "#4FA3C7", "#1F6F8B"], "eventual": ["#B490C0", "#8E5EA2", "#5E3370"]}
+        for i, ((repl_factor, consistency), curve) in enumerate(df.groupby(["Replication Factor", "Consistency"])):
+            curve = curve.sort_values("Offered Load (req/s)")
+            color = colors.get(consistency, ["#E0E0E0"] * 3)[i % 3]
+            ax.plot(curve["Throughput (req/s)"], curve["p99 (ms)"], marker='o' if consistency == "chain" else 's',
+                    linestyle='-', color=color, markersize=6, linewidth=2, alpha=0.8,
+                    label=f"{consistency.capitalize()}, RF={repl_factor}")
+        ax.set_yscale("log")
+        ax.set_xlabel("Achieved Throughput (req/s)", fontsize=11, fontweight='medium', color="#E0E0E0")
+        ax.set_ylabel("p99 Latency (ms)", fontsize=11, fontweight='medium', color="#E0E0E0")
+        ax.set_title("Throughput vs. Latency under Open-Loop Load", fontsize=13, fontweight='medium', color="#F5F5F5")
+        ax.grid(True, linestyle="--", alpha=0.3, color="gray")
+        ax.spines["left"].set_color("#A0A0A0")
+        ax.spines["bottom"].set_color("#A0A0A0")
+        ax.spines["right"].set_color("none")
+        ax.spines["top"].set_color("none")
+        ax.legend(facecolor="#222831", edgecolor="#444", fontsize=9, loc="upper left", framealpha=0.6)
+        st.pyplot(fig)
+
+
     if experiment_type == "Write Throughput":
         insert_directory = st.text_input("Enter directory path for batch insert", "insert")
         if st.button("Run Write Throughput Experiment"):
@@ -1078,5 +1184,380 @@ if selected == "Experiments":
             except Exception as e:
                 st.error(f"Error: {e}")
 
+    elif experiment_type == "Open-Loop Sweep":
+        col1, col2, col3 = st.columns([1, 1, 1])
+        with col1:
+            insert_directory = st.text_input("Enter directory path for batch insert", "insert")
+            sweep_operation = st.selectbox("Operation", ["query", "insert"])
+        with col2:
+            query_directory = st.text_input("Enter directory path for batch queries", "queries")
+            sweep_arrival = st.selectbox("Arrivals", ["poisson", "fixed"])
+        with col3:
+            sweep_rates = st.text_input("Offered loads (req/s)", "50,100,200,400,800")
+            sweep_step = st.number_input("Seconds per load step", min_value=1, max_value=120, value=5)
+        sweep_slo = st.number_input("p99 latency SLO in ms (0 for none)", min_value=0, value=0)
+
+        if st.button("Run Open-Loop Sweep"):
+            st.write("Running Open-Loop Sweep...")
+            try:
+                rates = [float(rate) for rate in sweep_rates.split(",") if rate.strip()]
+                insert_commands = read_insert_commands(insert_directory)
+                commands = insert_commands if sweep_operation == "insert" else read_query_commands(query_directory)
+                settings = [
+                    ("1", "chain"), ("3", "chain"), ("5", "chain"),
+                    ("1", "eventual"), ("3", "eventual"), ("5", "eventual")
+                ]
+                curves = []
+                saturation = []
+                progress_bar = st.progress(0)
+                for i, (repl_factor, consistency) in enumerate(settings):
+                    reset_status = reset_config(repl_factor, consistency)
+                    if reset_status != "OK":
+                        progress_bar.progress(100)
+                        raise Exception(f"Resetting configuration failed: {reset_status}")
+                    if sweep_operation == "query":
+                        run_load(insert_commands, workers=8, host=BOOTSTRAP_IP, port=int(BOOTSTRAP_PORT))
+
+                    rows = sweep_offered_load(commands, rates, sweep_step, sweep_arrival, slo_ms=sweep_slo or None,
+                                              host=BOOTSTRAP_IP, port=int(BOOTSTRAP_PORT))
+                    for row in rows:
+                        curves.append([repl_factor, consistency, row["offered"], row["throughput"], row["p50_ms"],
+                                       row["p99_ms"], row["p999_ms"], row["error_rate"], row["saturated"]])
+                    saturation.append([repl_factor, consistency, saturation_point(rows)])
+                    progress_bar.progress(int(((i + 1) / len(settings)) * 100))
+                    time.sleep(1)
+
+                df = pd.DataFrame(curves, columns=["Replication Factor", "Consistency", "Offered Load (req/s)",
+                                                   "Throughput (req/s)", "p50 (ms)", "p99 (ms)", "p999 (ms)",
+                                                   "Error Rate", "Saturated"])
+                df.to_csv(f"open_loop_{sweep_operation}_sweep.csv", index=False)
+                st.session_state["sweep_results"] = (df, pd.DataFrame(
+                    saturation, columns=["Replication Factor", "Consistency", "Saturation Point (req/s)"]))
+                st.success(f"Open-Loop Sweep Completed, curves saved to open_loop_{sweep_operation}_sweep.csv")
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+        sweep_csv = st.text_input("Or plot a saved sweep (CSV from run_experiments.py)", "")
+        if st.button("Plot Saved Sweep"):
+            try:
+                df = pd.read_csv(sweep_csv)
+                saturation = [[repl_factor, consistency, saturation_point([
+                    {"offered": row["Offered Load (req/s)"], "saturated": row["Saturated"]} for _, row in curve.iterrows()])]
+                    for (repl_factor, consistency), curve in df.groupby(["Replication Factor", "Consistency"])]
+                st.session_state["sweep_results"] = (df, pd.DataFrame(
+                    saturation, columns=["Replication Factor", "Consistency", "Saturation Point (req/s)"]))
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+        if "sweep_results" in st.session_state:
+            df, df_saturation = st.session_state["sweep_results"]
+            col1, col2, col3 = st.columns([1, 3, 1])
+            with col2:
+                plot_latency_curves(df)
+            st.table(df_saturation)
+            st.dataframe(df, use_container_width=True)
+
+    elif experiment_type == "YCSB Workloads":
+        col1, col2, col3 = st.columns([1, 1, 1])
+        with col1:
+            ycsb_workloads = st.multiselect("Workloads", list(WORKLOADS), default=["A", "B", "C"],
+                                            format_func=lambda name: f"{name}: {WORKLOADS[name]['description']}")
+            ycsb_distribution = st.selectbox("Key distribution", ["workload default", "uniform", "zipfian", "latest"])
+        with col2:
+            ycsb_records = st.number_input("Record count", min_value=10, max_value=1000000, value=1000)
+            ycsb_operations = st.number_input("Operation count", min_value=10, max_value=1000000, value=1000)
+        with col3:
+            ycsb_value_size = st.number_input("Value size (bytes)", min_value=1, max_value=65536, value=100)
+            ycsb_workers = st.number_input("Concurrent workers", min_value=1, max_value=256, value=8)
+
+        if st.button("Run YCSB Workloads"):
+            st.write("Running YCSB Workloads...")
+            try:
+                settings = [
+                    ("1", "chain"), ("3", "chain"), ("5", "chain"),
+                    ("1", "eventual"), ("3", "eventual"), ("5", "eventual")
+                ]
+                results = []
+                progress_bar = st.progress(0)
+                total_steps = len(settings) * len(ycsb_workloads)
+                step = 0
+                for repl_factor, consistency in settings:
+                    for name in ycsb_workloads:
+                        workload = Workload(name, int(ycsb_records), int(ycsb_operations), int(ycsb_value_size),
+                                            None if ycsb_distribution == "workload default" else ycsb_distribution,
+                                            seed=42)
+                        reset_status = reset_config(repl_factor, consistency)
+                        if reset_status != "OK":
+                            progress_bar.progress(100)
+                            raise Exception(f"Resetting configuration failed: {reset_status}")
+                        run_load(workload.load_commands(), workers=int(ycsb_workers), host=BOOTSTRAP_IP,
+                                 port=int(BOOTSTRAP_PORT))
+
+                        operations = workload.operations()
+                        result = run_load([commands for _, commands in operations], workers=int(ycsb_workers),
+                                          host=BOOTSTRAP_IP, port=int(BOOTSTRAP_PORT),
+                                          labels=[operation for operation, _ in operations])
+                        summary = result.summary()
+                        results.append([repl_factor, consistency, workload.name, workload.distribution, "all",
+                                        summary["throughput"], summary["p50_ms"], summary["p99_ms"],
+                                        summary["error_rate"]])
+                        for operation, latency in result.label_summaries().items():
+                            results.append([repl_factor, consistency, workload.name, workload.distribution,
+                                            operation, None, latency["p50"], latency["p99"], None])
+                        step += 1
+                        progress_bar.progress(int((step / total_steps) * 100))
+                        time.sleep(1)
+
+                df = pd.DataFrame(results, columns=["Replication Factor", "Consistency", "Workload", "Distribution",
+                                                   "Operation", "Throughput (ops/sec)", "p50 (ms)", "p99 (ms)",
+                                                   "Error Rate"])
+                df.to_csv("ycsb_experiment.csv", index=False)
+                st.session_state["ycsb_results"] = df
+                st.success("YCSB Workloads Completed, results saved to ycsb_experiment.csv")
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+        if "ycsb_results" in st.session_state:
+            df = st.session_state["ycsb_results"]
+            overall = df[df["Operation"] == "all"]
+            col1, col2, col3 = st.columns([1, 3, 1])
+            with col2:
+                fig, ax = plt.subplots(figsize=(8, 5))
+                pivot = overall.pivot_table(index="Workload", columns=["Consistency", "Replication Factor"],
+                                            values="Throughput (ops/sec)")
+                pivot.plot.bar(ax=ax, rot=0, alpha=0.8,
+                               color=["#80C7E0", "#4FA3C7", "#1F6F8B", "#B490C0", "#8E5EA2", "#5E3370"][:len(pivot.columns)])
+                ax.set_xlabel("Workload", fontsize=11, fontweight='medium', color="#E0E0E0")
+                ax.set_ylabel("Throughput (ops/sec)", fontsize=11, fontweight='medium', color="#E0E0E0")
+                ax.set_title("YCSB Throughput: Chain vs. Eventual Consistency", fontsize=13, fontweight='medium',
+                             color="#F5F5F5")
+                ax.grid(True, axis="y", linestyle="--", alpha=0.3, color="gray")
+                ax.spines["right"].set_color("none")
+                ax.spines["top"].set_color("none")
+                ax.legend(facecolor="#222831", edgecolor="#444", fontsize=9, loc="upper right", framealpha=0.6)
+                st.pyplot(fig)
+            st.dataframe(df, use_container_width=True)
+
+    elif experiment_type == "Staleness":
+        col1, col2, col3 = st.columns([1, 1, 1])
+        with col1:
+            staleness_keys = st.number_input("Keys written concurrently", min_value=1, max_value=100, value=8)
+            staleness_versions = st.number_input("Versions per key", min_value=2, max_value=500, value=40)
+        with col2:
+            staleness_interval = st.number_input("Pause between versions (ms)", min_value=0, max_value=1000, value=20)
+            staleness_readers = st.number_input("Concurrent readers", min_value=1, max_value=32, value=4)
+        with col3:
+            staleness_background = st.number_input("Background YCSB-A operations", min_value=0, max_value=100000,
+                                                   value=0)
+
+        if st.button("Run Staleness Benchmark"):
+            st.write("Running Staleness Benchmark...")
+            try:
+                settings = [
+                    ("1", "chain"), ("3", "chain"), ("5", "chain"),
+                    ("1", "eventual"), ("3", "eventual"), ("5", "eventual")
+                ]
+                background = None
+                if staleness_background:
+                    background = [commands for _, commands in
+                                  Workload("A", 500, int(staleness_background), 20, seed=7).operations()]
+                results = []
+                freshness = []
+                progress_bar = st.progress(0)
+                for i, (repl_factor, consistency) in enumerate(settings):
+                    reset_status = reset_config(repl_factor, consistency)
+                    if reset_status != "OK":
+                        progress_bar.progress(100)
+                        raise Exception(f"Resetting configuration failed: {reset_status}")
+                    if background:
+                        run_load(Workload("A", 500, 0, 20, seed=7).load_commands(), workers=8, host=BOOTSTRAP_IP,
+                                 port=int(BOOTSTRAP_PORT))
+                    report = run_staleness(int(staleness_keys), int(staleness_versions), staleness_interval / 1000,
+                                           int(staleness_readers), host=BOOTSTRAP_IP, port=int(BOOTSTRAP_PORT),
+                                           background=background)
+                    visibility, read_lag = report["visibility_ms"], report["read_lag"]
+                    results.append([repl_factor, consistency, visibility["p50"], visibility["p99"],
+                                    report["probe_gap_ms"]["p50"], read_lag.get("p_within", {}).get(0),
+                                    read_lag.get("mean_lag"), read_lag.get("max_lag")])
+                    for age, probability in report["p_fresh_by_age_ms"].items():
+                        freshness.append([repl_factor, consistency, age, probability])
+                    progress_bar.progress(int(((i + 1) / len(settings)) * 100))
+                    time.sleep(1)
+
+                df = pd.DataFrame(results, columns=["Replication Factor", "Consistency", "Visibility p50 (ms)",
+                                                   "Visibility p99 (ms)", "Probe Gap p50 (ms)", "P(Fresh Read)",
+                                                   "Mean Lag", "Max Lag"])
+                df.to_csv("staleness_experiment.csv", index=False)
+                st.session_state["staleness_results"] = (df, pd.DataFrame(
+                    freshness, columns=["Replication Factor", "Consistency", "Age (ms)", "P(Fresh)"]))
+                st.success("Staleness Benchmark Completed, results saved to staleness_experiment.csv")
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+        if "staleness_results" in st.session_state:
+            df, df_freshness = st.session_state["staleness_results"]
+            st.table(df)
+            col1, col2, col3 = st.columns([1, 3, 1])
+            with col2:
+                fig, ax = plt.subplots(figsize=(8, 5))
+                colors = {"chain": ["#80C7E0", "#4FA3C7", "#1F6F8B"], "eventual": ["#B490C0", "#8E5EA2", "#5E3370"]}
+                for i, ((repl_factor, consistency), curve) in enumerate(
+                        df_freshness.groupby(["Replication Factor", "Consistency"], sort=False)):
+                    ax.plot(curve["Age (ms)"], curve["P(Fresh)"], marker='o' if consistency == "chain" else 's',
+                            linestyle='-', color=colors.get(consistency, ["#E0E0E0"] * 3)[i % 3], markersize=6,
+                            linewidth=2, alpha=0.8, label=f"{consistency.capitalize()}, RF={repl_factor}")
+                ax.set_ylim(0, 1.05)
+                ax.set_xlabel("Time since the newest version was acknowledged (ms)", fontsize=11,
+                              fontweight='medium', color="#E0E0E0")
+                ax.set_ylabel("P(read returns it)", fontsize=11, fontweight='medium', color="#E0E0E0")
+                ax.set_title("Probabilistically Bounded Staleness", fontsize=13, fontweight='medium', color="#F5F5F5")
+                ax.grid(True, linestyle="--", alpha=0.3, color="gray")
+                ax.spines["right"].set_color("none")
+                ax.spines["top"].set_color("none")
+                ax.legend(facecolor="#222831", edgecolor="#444", fontsize=9, loc="lower right", framealpha=0.6)
+                st.pyplot(fig)
+
+    elif experiment_type == "Scalability & Churn":
+        st.caption("Runs its own local ring on the ports below, joining and departing nodes under a steady load.")
+        col1, col2, col3 = st.columns([1, 1, 1])
+        with col1:
+            churn_min = st.number_input("Smallest ring", min_value=1, max_value=32, value=2)
+            churn_max = st.number_input("Largest ring", min_value=2, max_value=32, value=8)
+            churn_step = st.number_input("Nodes per step", min_value=1, max_value=16, value=2)
+        with col2:
+            churn_duration = st.number_input("Seconds measured per step", min_value=1.0, max_value=120.0, value=5.0)
+            churn_rf = st.number_input("Replication factor", min_value=1, max_value=10, value=3)
+            churn_consistency = st.selectbox("Consistency", ["chain", "eventual"])
+        with col3:
+            churn_workload = st.selectbox("YCSB workload", list(WORKLOADS), index=1)
+            churn_records = st.number_input("Records", min_value=10, max_value=100000, value=1000)
+            churn_port = st.number_input("First port", min_value=1024, max_value=65000, value=6000)
+
+        if st.button("Run Scalability & Churn Experiment"):
+            st.write("Running Scalability & Churn Experiment...")
+            try:
+                status = st.empty()
+
+                def on_step(row):
+                    if "error" in row:
+                        status.write(f"Step {row['step']}: {row['action']} failed, {row['error']}")
+                    else:
+                        status.write(f"Step {row['step']}: {row['action']} -> {row['nodes']} nodes, "
+                                     f"{row['summary']['throughput']} req/s")
+
+                rows, events, timeline = run_scalability(int(churn_min), int(churn_max), int(churn_step),
+                                                         float(churn_duration), int(churn_rf), churn_consistency,
+                                                         int(churn_records), churn_workload,
+                                                         base_port=int(churn_port), on_step=on_step)
+                df = pd.DataFrame([[row["step"], row["action"] + (" (failed)" if "error" in row else ""),
+                                    row["nodes"], row["transition_s"], row.get("keys_moved"),
+                                    row.get("transfer_max_ms"), row.get("transition_errors"),
+                                    row.get("transition_misses"), row["summary"]["throughput"],
+                                    row["summary"]["p99_ms"], row["summary"]["error_rate"]] for row in rows],
+                                  columns=["Step", "Action", "Nodes", "Transition (s)", "Keys Moved",
+                                           "Longest Handoff (ms)", "Transition Errors", "Transition Misses",
+                                           "Throughput (req/s)", "p99 (ms)", "Error Rate"])
+                df.to_csv("scalability_experiment.csv", index=False)
+                st.session_state["scalability_results"] = (df, timeline, events)
+                st.success("Scalability & Churn Experiment Completed, results saved to scalability_experiment.csv")
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+        if "scalability_results" in st.session_state:
+            df, timeline, events = st.session_state["scalability_results"]
+            st.table(df)
+            col1, col2 = st.columns([1, 1])
+            with col1:
+                fig, ax = plt.subplots(figsize=(6, 4))
+                steady = df[~df["Action"].str.endswith("(failed)")]
+                ax.plot(range(len(steady)), steady["Throughput (req/s)"], marker='o', linestyle='-',
+                        color="#4FA3C7", linewidth=2, label="Throughput")
+                ax.set_xticks(range(len(steady)))
+                ax.set_xticklabels([f"{nodes}" for nodes in steady["Nodes"]])
+                ax.set_xlabel("Nodes (in step order)", fontsize=11, fontweight='medium', color="#E0E0E0")
+                ax.set_ylabel("Throughput (req/s)", fontsize=11, fontweight='medium', color="#E0E0E0")
+                latency_ax = ax.twinx()
+                latency_ax.plot(range(len(steady)), steady["p99 (ms)"], marker='s', linestyle='--',
+                                color="#8E5EA2", linewidth=2, label="p99")
+                latency_ax.set_ylabel("p99 (ms)", fontsize=11, fontweight='medium', color="#E0E0E0")
+                ax.set_title("Throughput and p99 per Ring Size", fontsize=13, fontweight='medium', color="#F5F5F5")
+                ax.grid(True, linestyle="--", alpha=0.3, color="gray")
+                st.pyplot(fig)
+            with col2:
+                fig, ax = plt.subplots(figsize=(6, 4))
+                ax.plot([at for at, _ in timeline], [throughput for _, throughput in timeline], linestyle='-',
+                        color="#4FA3C7", linewidth=1.5)
+                for at, event in events:
+                    ax.axvline(at, color="#B490C0" if event.startswith("join") else "#E07A5F", linestyle=":",
+                               alpha=0.8)
+                    ax.text(at, ax.get_ylim()[1] * 0.95, event, rotation=90, fontsize=8, color="#E0E0E0",
+                            va="top", ha="right")
+                ax.set_xlabel("Time (s)", fontsize=11, fontweight='medium', color="#E0E0E0")
+                ax.set_ylabel("Throughput (req/s)", fontsize=11, fontweight='medium', color="#E0E0E0")
+                ax.set_title("Throughput During Joins and Departs", fontsize=13, fontweight='medium',
+                             color="#F5F5F5")
+                ax.grid(True, linestyle="--", alpha=0.3, color="gray")
+                ax.spines["right"].set_color("none")
+                ax.spines["top"].set_color("none")
+                st.pyplot(fig)
+
+    elif experiment_type == "Results History":
+        history_db = st.text_input("Results database", DEFAULT_PATH)
+        if not os.path.exists(history_db):
+            st.info("No stored runs yet, run_experiments.py stores every experiment it runs.")
+        else:
+            store = ResultsStore(history_db)
+            runs = store.runs()
+            experiments = sorted({run["experiment"] for run in runs})
+            col1, col2 = st.columns([1, 1])
+            with col1:
+                history_experiment = st.selectbox("Experiment", experiments)
+            with col2:
+                history_metric = st.selectbox("Metric", RESULT_FIELDS, index=RESULT_FIELDS.index("throughput"))
+
+            trend = pd.DataFrame(store.trend(history_experiment, history_metric))
+            if not trend.empty:
+                col1, col2, col3 = st.columns([1, 3, 1])
+                with col2:
+                    fig, ax = plt.subplots(figsize=(8, 5))
+                    for (repl_factor, consistency, label), points in trend.groupby(
+                            ["replication_factor", "consistency", "label"]):
+                        ax.plot(points["run_id"].astype(str), points["value"], marker='o' if consistency == "chain" else 's',
+                                linestyle='-', markersize=6, linewidth=2, alpha=0.8,
+                                label=f"{consistency.capitalize()}, RF={repl_factor}, {label}")
+                    ax.set_xlabel("Run", fontsize=11, fontweight='medium', color="#E0E0E0")
+                    ax.set_ylabel(history_metric, fontsize=11, fontweight='medium', color="#E0E0E0")
+                    ax.set_title(f"{history_experiment}: {history_metric} per Run", fontsize=13, fontweight='medium',
+                                 color="#F5F5F5")
+                    ax.grid(True, linestyle="--", alpha=0.3, color="gray")
+                    ax.spines["right"].set_color("none")
+                    ax.spines["top"].set_color("none")
+                    ax.legend(facecolor="#222831", edgecolor="#444", fontsize=8, loc="best", framealpha=0.6)
+                    st.pyplot(fig)
+
+            experiment_runs = [run for run in runs if run["experiment"] == history_experiment]
+            st.dataframe(pd.DataFrame(experiment_runs).drop(columns=["extra"]), use_container_width=True)
+            if len(experiment_runs) >= 2:
+                run_labels = {run["id"]: f"Run {run['id']} ({run['started_at']}, {(run['git_commit'] or '')[:10]})"
+                              for run in experiment_runs}
+                col1, col2 = st.columns([1, 1])
+                with col1:
+                    baseline_run = st.selectbox("Baseline run", list(run_labels), index=1, format_func=run_labels.get)
+                with col2:
+                    candidate_run = st.selectbox("Candidate run", list(run_labels), index=0, format_func=run_labels.get)
+                comparison = pd.DataFrame(compare_runs(store, baseline_run, candidate_run))
+                if comparison.empty:
+                    st.info("The two runs have no settings in common.")
+                else:
+                    regressions = int(comparison["regression"].sum())
+                    if regressions:
+                        st.error(f"{regressions} significant regression(s) in run {candidate_run}")
+                    else:
+                        st.success(f"No significant regression in run {candidate_run}")
+                    st.dataframe(comparison.style.apply(
+                        lambda row: ["background-color: #5E3370" if row["regression"] else "" for _ in row], axis=1),
+                        use_container_width=True)
+            store.close()
+
 current_year = datetime.datetime.now().year
 st.markdown(f"<div style='text-align: center; padding-top:20px;'>🎼 Conchord © {current_year}</div>", unsafe_allow_html=True)
\ No newline at end of file
@@ -0,0 +1,264 @@
+import itertools
+import random
+import threading
+import time
+
+from client import shared_client
+from metrics import Histogram
+
+# width in seconds of the windows the throughput is sampled over
+THROUGHPUT_WINDOW = 0.5
+
+
+def send_command(command, host="127.0.0.1", port=5000, timeout=10):
+    # over the process-wide pooled connections, so connection setup stays out of the measured latency
+    return shared_client(host, port).send(command, timeout)
+
+
+def is_error(response):
+    return response.startswith("Error") or response.startswith("ERROR")
+
+
+def send_operation(operation, host="127.0.0.1", port=5000):
+    # an operation is a single command or a sequence of commands sent back to back
+    if isinstance(operation, str):
+        return send_command(operation, host, port)
+    response = ""
+    for command in operation:
+        response = send_command(command, host, port)
+        if is_error(response):
+            break
+    return response
+
+
+class LoadResult:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # per-request latency in microseconds
+        self.latency = Histogram()
+        self.labels = {}
+        self.requests = 0
+        self.errors = 0
+        self.elapsed = 0.0
+        self.responses = []
+        # completions per throughput window since started, the samples a regression test compares
+        self.started = None
+        self.windows = {}
+
+    def record(self, seconds, error, label=None):
+        with self.lock:
+            self.latency.record(seconds * 1e6)
+            if label is not None:
+                self.labels.setdefault(label, Histogram()).record(seconds * 1e6)
+            self.requests += 1
+            if error:
+                self.errors += 1
+            if self.started is not None:
+                window = int((time.perf_counter() - self.started) / THROUGHPUT_WINDOW)
+                self.windows[window] = self.windows.get(window, 0) + 1
+
+    def throughput_samples(self):
+        # requests per second of every complete window, the trailing partial one is left out
+        complete = int(self.elapsed / THROUGHPUT_WINDOW)
+        return [self.windows.get(window, 0) / THROUGHPUT_WINDOW for window in range(complete)]
+
+    def summary(self):
+        latency = self.latency.summary()
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.errors / self.requests, 4) if self.requests else 0.0,
+            "elapsed": round(self.elapsed, 3),
+            "throughput": round(self.requests / self.elapsed, 2) if self.elapsed else 0.0,
+            "mean_ms": latency["mean"],
+            "stdev_ms": latency["stdev"],
+            "p50_ms": latency["p50"],
+            "p95_ms": latency["p95"],
+            "p99_ms": latency["p99"],
+            "p999_ms": latency["p999"],
+            "max_ms": latency["max"],
+            "throughput_samples": self.throughput_samples()
+        }
+
+    def label_summaries(self):
+        # latency per operation type, e.g. read and update of a YCSB workload
+        return {label: histogram.summary() for label, histogram in sorted(self.labels.items())}
+
+
+def arrival_schedule(count, rate, arrival="poisson", seed=None):
+    # send offsets in seconds: exponential gaps for poisson arrivals, even gaps otherwise
+    rng = random.Random(seed)
+    offsets = []
+    offset = 0.0
+    for _ in range(count):
+        offsets.append(offset)
+        offset += rng.expovariate(rate) if arrival == "poisson" else 1.0 / rate
+    return offsets
+
+
+def run_load(commands, workers=8, rate=None, host="127.0.0.1", port=5000, keep_responses=False, progress=None,
+             schedule=None, open_loop=False, labels=None):
+    # closed loop: each worker sends its next command once the previous one is answered,
+    # a target rate additionally paces the commands on a shared schedule
+    commands = list(commands)
+    if schedule is None and rate:
+        schedule = [index / rate for index in range(len(commands))]
+    result = LoadResult()
+    # a connection per worker, so the workers are not queued behind each other on a few sockets
+    shared_client(host, port, pool_size=workers)
+    next_index = [0]
+    index_lock = threading.Lock()
+    if keep_responses:
+        result.responses = [None] * len(commands)
+
+    def worker():
+        while True:
+            with index_lock:
+                index = next_index[0]
+                if index >= len(commands):
+                    return
+                next_index[0] += 1
+            intended = None
+            if schedule is not None:
+                intended = started + schedule[index]
+                delay = intended - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            sent = time.perf_counter()
+            try:
+                response = send_operation(commands[index], host, port)
+                error = is_error(response)
+            except OSError as e:
+                response, error = f"Error: {e}", True
+            # open loop latency counts from the intended send time, so waiting for a free worker is included
+            begin = min(intended, sent) if open_loop and intended is not None else sent
+            result.record(time.perf_counter() - begin, error, labels[index] if labels else None)
+            if keep_responses:
+                result.responses[index] = response
+            if progress is not None:
+                progress()
+
+    started = result.started = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+class SteadyLoad:
+    # closed-loop workers cycling through the commands until stopped, measured in phases:
+    # phase() hands back everything recorded since the previous call
+    def __init__(self, commands, workers=8, rate=None, host="127.0.0.1", port=5000):
+        self.commands = list(commands)
+        self.workers = workers
+        self.rate = rate
+        self.host = host
+        self.port = port
+        self.lock = threading.Lock()
+        self.running = False
+        self.threads = []
+        self.result = LoadResult()
+        self.misses = 0
+        # completions per throughput window over the whole run, for throughput-over-time plots
+        self.timeline = {}
+        self.started = None
+
+    def start(self):
+        shared_client(self.host, self.port, pool_size=self.workers)
+        self.running = True
+        self.started = self.result.started = time.perf_counter()
+        self.threads = [threading.Thread(target=self.worker, args=(offset,), daemon=True)
+                        for offset in range(max(1, self.workers))]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        for thread in self.threads:
+            thread.join()
+
+    def worker(self, offset):
+        interval = self.workers / self.rate if self.rate else 0
+        commands = itertools.islice(itertools.cycle(self.commands), offset, None, max(1, self.workers))
+        next_send = time.perf_counter()
+        for command in commands:
+            if not self.running:
+                return
+            if interval:
+                next_send += interval
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            sent = time.perf_counter()
+            try:
+                response = send_operation(command, self.host, self.port)
+                error = is_error(response)
+            except OSError:
+                response, error = "", True
+            now = time.perf_counter()
+            with self.lock:
+                self.result.record(now - sent, error)
+                if response.startswith("Key not found"):
+                    self.misses += 1
+                window = int((now - self.started) / THROUGHPUT_WINDOW)
+                self.timeline[window] = self.timeline.get(window, 0) + 1
+
+    def phase(self):
+        with self.lock:
+            result, misses = self.result, self.misses
+            self.result, self.misses = LoadResult(), 0
+            self.result.started = time.perf_counter()
+        result.elapsed = time.perf_counter() - result.started
+        summary = result.summary()
+        summary["misses"] = misses
+        return summary
+
+    def throughput_timeline(self):
+        # (seconds since start, requests per second) per window
+        with self.lock:
+            windows = dict(self.timeline)
+        last = max(windows) if windows else -1
+        return [(window * THROUGHPUT_WINDOW, windows.get(window, 0) / THROUGHPUT_WINDOW) for window in range(last)]
+
+
+def run_open_loop(commands, rate, arrival="poisson", max_in_flight=256, host="127.0.0.1", port=5000, progress=None,
+                  seed=None):
+    # requests go out on their schedule whether or not earlier ones were answered
+    commands = list(commands)
+    return run_load(commands, workers=min(max_in_flight, len(commands)), host=host, port=port, progress=progress,
+                    schedule=arrival_schedule(len(commands), rate, arrival, seed), open_loop=True)
+
+
+def is_saturated(summary, offered, slo_ms=None, min_ratio=0.9, max_error_rate=0.01):
+    return summary["throughput"] < min_ratio * offered or summary["error_rate"] > max_error_rate or \
+        (slo_ms is not None and summary["p99_ms"] > slo_ms)
+
+
+def saturation_point(rows):
+    # the highest offered load served before the first saturated step
+    best = None
+    for row in sorted(rows, key=lambda row: row["offered"]):
+        if row["saturated"]:
+            break
+        best = row["offered"]
+    return best
+
+
+def sweep_offered_load(commands, rates, step_duration=5.0, arrival="poisson", max_in_flight=256, slo_ms=None,
+                       host="127.0.0.1", port=5000, on_step=None):
+    # one open-loop step per offered rate, cycling through the commands as needed
+    rows = []
+    for rate in sorted(rates):
+        count = max(1, int(rate * step_duration))
+        step_commands = list(itertools.islice(itertools.cycle(commands), count))
+        summary = run_open_loop(step_commands, rate, arrival, max_in_flight, host, port).summary()
+        summary["offered"] = rate
+        summary["saturated"] = is_saturated(summary, rate, slo_ms)
+        rows.append(summary)
+        if on_step is not None:
+            on_step(summary)
+    return rows
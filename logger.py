@@ -0,0 +1,122 @@
+import json
+import queue
+import random
+import re
+import sys
+import threading
+import time
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+ANSI_CODES = re.compile(r"\x1b\[[0-9;]*m")
+
+
+def parse_sample_rates(spec):
+    # "query=0.01,insert=0.1" -> {"query": 0.01, "insert": 0.1}
+    rates = {}
+    for item in (spec or "").split(","):
+        if item.strip():
+            module, _, rate = item.partition("=")
+            rates[module.strip()] = float(rate)
+    return rates
+
+
+class Logger:
+    def __init__(self, prefix="", level=INFO, json_output=False, sample_rates=None, queue_size=10000, stream=None):
+        self.prefix = prefix
+        self.level = level
+        self.json_output = json_output
+        # share of the messages kept per module, modules not listed keep everything
+        self.sample_rates = sample_rates or {}
+        self.stream = stream or sys.stdout
+        self.queue = queue.Queue(queue_size)
+        self.lock = threading.Lock()
+        self.writer = None
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def log(self, level, module, message, *args):
+        # cheap checks first: a disabled message costs a comparison and is never formatted
+        if level < self.level:
+            return
+        rate = self.sample_rates.get(module)
+        if rate is not None and random.random() >= rate:
+            self.sampled_out += 1
+            return
+        if self.writer is None:
+            self.start()
+        # formatting happens on the writer thread, pass immutable arguments
+        try:
+            self.queue.put_nowait((time.time(), level, module, message, args))
+        except queue.Full:
+            self.dropped += 1
+
+    def debug(self, module, message, *args):
+        self.log(DEBUG, module, message, *args)
+
+    def info(self, module, message, *args):
+        self.log(INFO, module, message, *args)
+
+    def warning(self, module, message, *args):
+        self.log(WARNING, module, message, *args)
+
+    def error(self, module, message, *args):
+        self.log(ERROR, module, message, *args)
+
+    def start(self):
+        with self.lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.run, daemon=True)
+                self.writer.start()
+
+    def format(self, record):
+        timestamp, level, module, message, args = record
+        if args:
+            try:
+                message = message % args
+            except (TypeError, ValueError):
+                message = f"{message} {args}"
+        if not self.json_output:
+            return f"{self.prefix}{message}"
+        return json.dumps({
+            "ts": round(timestamp, 6),
+            "level": LEVEL_NAMES.get(level, str(level)),
+            "module": module,
+            "node": self.prefix.strip(),
+            "msg": ANSI_CODES.sub("", str(message))
+        })
+
+    def run(self):
+        while True:
+            record = self.queue.get()
+            try:
+                self.stream.write(self.format(record) + "\n")
+                self.written += 1
+                # flush once the backlog is drained rather than on every line
+                if self.queue.empty():
+                    self.stream.flush()
+            except Exception:
+                self.dropped += 1
+            finally:
+                self.queue.task_done()
+
+    def flush(self, timeout=1.0):
+        deadline = time.time() + timeout
+        while self.queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+
+    def stats(self):
+        return {
+            "level": LEVEL_NAMES.get(self.level, str(self.level)),
+            "json": self.json_output,
+            "sample_rates": self.sample_rates,
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out
+        }
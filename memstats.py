@@ -0,0 +1,89 @@
+import os
+import resource
+import sys
+import threading
+import tracemalloc
+
+
+def record_bytes(key, record):
+    # one entry of Node.data; the hop is a small int, those are shared and cost nothing per record
+    return sys.getsizeof(key) + sys.getsizeof(record["value"]) + sys.getsizeof(record)
+
+
+def store_bytes(data):
+    # approximate footprint of Node.data: {key: {"value": str, "hop": int}}, the per-record parts of record_bytes
+    keys = values = records = 0
+    for key, record in list(data.items()):
+        keys += sys.getsizeof(key)
+        values += sys.getsizeof(record["value"])
+        records += sys.getsizeof(record)
+    table = sys.getsizeof(data)
+    return {
+        "keys": keys,
+        "values": values,
+        "record_overhead": records,
+        "table": table,
+        "total": keys + values + records + table
+    }
+
+
+def dict_bytes(mapping):
+    # shallow size of a flat dict of small objects (hash memo, cache entries)
+    items = list(mapping.items())
+    return sys.getsizeof(mapping) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in items)
+
+
+def thread_stats():
+    # stacks are reserved as virtual memory, only the touched pages count towards the rss
+    stack_size = threading.stack_size()
+    if not stack_size:
+        soft, _ = resource.getrlimit(resource.RLIMIT_STACK)
+        stack_size = soft if soft not in (resource.RLIM_INFINITY, -1) else 8 * 1024 * 1024
+    count = threading.active_count()
+    return {"count": count, "stack_size": stack_size, "stack_reserved": count * stack_size}
+
+
+def process_memory():
+    stats = {"max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+    try:
+        with open("/proc/self/statm") as statm:
+            size, resident = statm.read().split()[:2]
+        page = os.sysconf("SC_PAGE_SIZE")
+        stats["rss"] = int(resident) * page
+        stats["vms"] = int(size) * page
+    except (OSError, ValueError):
+        stats["rss"] = stats["max_rss"]
+    return stats
+
+
+class AllocationTracker:
+    # tracemalloc snapshots on demand, compared against the one taken when tracing started
+    def __init__(self):
+        self.baseline = None
+
+    def start(self, frames=1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.baseline = tracemalloc.take_snapshot()
+
+    def stop(self):
+        self.baseline = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def report(self, top=10):
+        if not tracemalloc.is_tracing() or self.baseline is None:
+            return {"tracing": False}
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        growth = snapshot.compare_to(self.baseline, "lineno")
+        return {
+            "tracing": True,
+            "traced": current,
+            "peak": peak,
+            "growth": sum(stat.size_diff for stat in growth),
+            "top_growth": [
+                {"where": str(stat.traceback), "size_diff": stat.size_diff, "count_diff": stat.count_diff}
+                for stat in growth[:top]
+            ]
+        }
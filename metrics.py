@@ -0,0 +1,214 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Histogram:
+    # log-linear buckets in the style of HdrHistogram: every power of two is split into
+    # the same number of linear sub-buckets, keeping the relative error below 1 / sub_buckets
+    def __init__(self, sub_bucket_bits=7):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_buckets = 1 << sub_bucket_bits
+        self.half = self.sub_buckets >> 1
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.total_squares = 0
+        self.min = None
+        self.max = 0
+
+    def bucket(self, value):
+        if value < self.sub_buckets:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return (shift * self.half) + (value >> shift)
+
+    def bucket_range(self, index):
+        if index < self.sub_buckets:
+            return index, index
+        shift = index // self.half - 1
+        sub_bucket = index - shift * self.half
+        return sub_bucket << shift, ((sub_bucket + 1) << shift) - 1
+
+    def record(self, value):
+        value = max(0, int(value))
+        index = self.bucket(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.total_squares += value * value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.total_squares += other.total_squares
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        if not self.count:
+            return 0
+        rank = max(1, int(round(q / 100 * self.count + 0.5 - 1e-9)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                # report the middle of the bucket, clamped to the values actually seen
+                low, high = self.bucket_range(index)
+                return min(max((low + high) // 2, self.min), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def stdev(self):
+        if self.count < 2:
+            return 0.0
+        variance = (self.total_squares - self.total * self.total / self.count) / (self.count - 1)
+        return max(0.0, variance) ** 0.5
+
+    def summary(self, scale=1000.0):
+        return {
+            "count": self.count,
+            "mean": round(self.mean() / scale, 3),
+            "stdev": round(self.stdev() / scale, 3),
+            "p50": round(self.percentile(50) / scale, 3),
+            "p95": round(self.percentile(95) / scale, 3),
+            "p99": round(self.percentile(99) / scale, 3),
+            "p999": round(self.percentile(99.9) / scale, 3),
+            "max": round(self.max / scale, 3)
+        }
+
+
+class NodeMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        # per command: request count, error count and latency histogram in microseconds
+        self.requests = {}
+        self.errors = {}
+        self.latency = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.active_handlers = 0
+        # messages this node sent on to other nodes, per command
+        self.forwards = {}
+        self.forward_bytes_out = 0
+        self.forward_bytes_in = 0
+
+    def handler_started(self):
+        with self.lock:
+            self.active_handlers += 1
+
+    def handler_finished(self, command, seconds, bytes_in, bytes_out, error=False):
+        with self.lock:
+            self.active_handlers -= 1
+            self.requests[command] = self.requests.get(command, 0) + 1
+            if error:
+                self.errors[command] = self.errors.get(command, 0) + 1
+            if command not in self.latency:
+                self.latency[command] = Histogram()
+            self.latency[command].record(seconds * 1e6)
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def record_forward(self, command, bytes_out, bytes_in):
+        with self.lock:
+            self.forwards[command] = self.forwards.get(command, 0) + 1
+            self.forward_bytes_out += bytes_out
+            self.forward_bytes_in += bytes_in
+
+    def reset(self):
+        with self.lock:
+            self.started_at = time.time()
+            self.requests.clear()
+            self.errors.clear()
+            self.latency.clear()
+            self.bytes_in = self.bytes_out = 0
+            self.forwards.clear()
+            self.forward_bytes_out = self.forward_bytes_in = 0
+
+    def snapshot(self):
+        with self.lock:
+            commands = {
+                command: {
+                    "requests": count,
+                    "errors": self.errors.get(command, 0),
+                    "latency_ms": self.latency[command].summary()
+                }
+                for command, count in sorted(self.requests.items())
+            }
+            return {
+                "uptime": round(time.time() - self.started_at, 3),
+                "commands": commands,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "active_handlers": self.active_handlers,
+                "forwards": dict(sorted(self.forwards.items())),
+                "forward_bytes_out": self.forward_bytes_out,
+                "forward_bytes_in": self.forward_bytes_in
+            }
+
+
+def prometheus_text(stats, labels):
+    # render a stats snapshot in the Prometheus text exposition format
+    base = ",".join(f'{name}="{value}"' for name, value in labels.items())
+
+    def sample(name, value, **extra):
+        tags = ",".join(([base] if base else []) + [f'{k}="{v}"' for k, v in extra.items()])
+        return f"{name}{{{tags}}} {value}" if tags else f"{name} {value}"
+
+    lines = ["# TYPE chord_requests_total counter"]
+    for command, entry in stats["commands"].items():
+        lines.append(sample("chord_requests_total", entry["requests"], command=command))
+    lines.append("# TYPE chord_request_errors_total counter")
+    for command, entry in stats["commands"].items():
+        lines.append(sample("chord_request_errors_total", entry["errors"], command=command))
+    lines.append("# TYPE chord_request_duration_seconds summary")
+    for command, entry in stats["commands"].items():
+        latency = entry["latency_ms"]
+        for quantile, name in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99"), ("0.999", "p999"), ("1", "max")):
+            lines.append(sample("chord_request_duration_seconds", round(latency[name] / 1000, 6), command=command, quantile=quantile))
+        lines.append(sample("chord_request_duration_seconds_sum", round(latency["mean"] * latency["count"] / 1000, 6), command=command))
+        lines.append(sample("chord_request_duration_seconds_count", latency["count"], command=command))
+    lines.append("# TYPE chord_forwards_total counter")
+    for command, count in stats["forwards"].items():
+        lines.append(sample("chord_forwards_total", count, command=command))
+    lines += [
+        "# TYPE chord_bytes_received_total counter", sample("chord_bytes_received_total", stats["bytes_in"]),
+        "# TYPE chord_bytes_sent_total counter", sample("chord_bytes_sent_total", stats["bytes_out"]),
+        "# TYPE chord_forward_bytes_sent_total counter", sample("chord_forward_bytes_sent_total", stats["forward_bytes_out"]),
+        "# TYPE chord_forward_bytes_received_total counter", sample("chord_forward_bytes_received_total", stats["forward_bytes_in"]),
+        "# TYPE chord_active_handlers gauge", sample("chord_active_handlers", stats["active_handlers"]),
+        "# TYPE chord_uptime_seconds gauge", sample("chord_uptime_seconds", stats["uptime"])
+    ]
+    data = stats.get("data", {})
+    lines.append("# TYPE chord_keys gauge")
+    lines.append(sample("chord_keys", data.get("primary_keys", 0), role="primary"))
+    lines.append(sample("chord_keys", data.get("replica_keys", 0), role="replica"))
+    lines += ["# TYPE chord_data_bytes gauge", sample("chord_data_bytes", data.get("data_bytes", 0))]
+    return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(port, collect, labels):
+    # side port for Prometheus scrapes, kept off the node's own text protocol
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = prometheus_text(collect(), labels).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class NegativeCache:
+    def __init__(self, size=1024, ttl=1.0):
+        self.size = size
+        self.ttl = ttl
+        # key -> expiry time of its "Key not found" answer
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def enabled(self):
+        return self.size > 0 and self.ttl > 0
+
+    def get(self, key):
+        if not self.enabled():
+            return False
+        with self.lock:
+            expiry = self.entries.get(key)
+            if expiry is not None and expiry > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True
+            if expiry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return False
+
+    def put(self, key):
+        if not self.enabled():
+            return
+        with self.lock:
+            self.entries[key] = time.monotonic() + self.ttl
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key):
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "capacity": self.size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,218 @@
+import argparse
+import queue
+import random
+import socket
+import struct
+import threading
+import time
+
+from colorama import Fore, Style
+
+# the link settings a proxy takes, with their defaults
+LINK_DEFAULTS = {
+    "latency_ms": 0.0,      # one-way delay added to every chunk, in both directions
+    "jitter_ms": 0.0,       # uniform +- spread around the latency
+    "bandwidth": None,      # bytes per second per direction, None for unlimited
+    "reset_rate": 0.0,      # share of the connections reset right after they are accepted
+    "down": False,          # reset every connection, the node is unreachable
+}
+
+
+def reset(sock):
+    # close with SO_LINGER 0, the peer sees ECONNRESET instead of an orderly close
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+    except OSError:
+        pass
+    sock.close()
+
+
+class LinkProxy:
+    # a TCP proxy in front of one node: everything sent to the listen port reaches the target port
+    # late, throttled or not at all, the way a link between two machines would
+    def __init__(self, listen_port, target_port, host="127.0.0.1", target_host="127.0.0.1", seed=None, **settings):
+        unknown = set(settings) - set(LINK_DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown link settings: {', '.join(sorted(unknown))}")
+        self.listen_port = listen_port
+        self.target_port = target_port
+        self.host = host
+        self.target_host = target_host
+        self.settings = dict(LINK_DEFAULTS, **settings)
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.counters = {"connections": 0, "resets": 0, "upstream_errors": 0, "bytes_in": 0, "bytes_out": 0,
+                         "delayed_ms": 0.0}
+        self.server_socket = None
+        self.stopped = False
+
+    def update(self, **settings):
+        # takes effect for every chunk forwarded from now on, also on open connections
+        unknown = set(settings) - set(LINK_DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown link settings: {', '.join(sorted(unknown))}")
+        with self.lock:
+            self.settings.update(settings)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, **self.settings)
+
+    def start(self):
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((self.host, self.listen_port))
+        self.server_socket.listen(128)
+        threading.Thread(target=self.serve, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        if self.server_socket is not None:
+            self.server_socket.close()
+
+    def serve(self):
+        while not self.stopped:
+            try:
+                client, _ = self.server_socket.accept()
+            except OSError:
+                break
+            threading.Thread(target=self.handle, args=(client,), daemon=True).start()
+
+    def generator(self, *stream):
+        # a generator of its own for every connection and direction, seeded from the seed, the link and the stream,
+        # the same seed gives every run the same delays and resets however the threads interleave
+        if self.seed is None:
+            return random.Random()
+        return random.Random(":".join(map(str, (self.seed, self.listen_port, self.target_port) + stream)))
+
+    def handle(self, client):
+        with self.lock:
+            self.counters["connections"] += 1
+            connection = self.counters["connections"]
+            drop = self.settings["down"] or self.generator(connection).random() < self.settings["reset_rate"]
+            if drop:
+                self.counters["resets"] += 1
+        if drop:
+            reset(client)
+            return
+        try:
+            upstream = socket.create_connection((self.target_host, self.target_port))
+        except OSError:
+            with self.lock:
+                self.counters["upstream_errors"] += 1
+            reset(client)
+            return
+        for sock in (client, upstream):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        pumps = [threading.Thread(target=self.pump, args=(client, upstream, "bytes_in", self.generator(connection, "in")),
+                                  daemon=True),
+                 threading.Thread(target=self.pump, args=(upstream, client, "bytes_out", self.generator(connection, "out")),
+                                  daemon=True)]
+        for pump in pumps:
+            pump.start()
+        for pump in pumps:
+            pump.join()
+        client.close()
+        upstream.close()
+
+    def delay(self, generator):
+        # seconds until a chunk read now may be delivered, latency plus jitter
+        with self.lock:
+            latency, jitter = self.settings["latency_ms"], self.settings["jitter_ms"]
+        spread = generator.uniform(-jitter, jitter) if jitter else 0.0
+        return max(0.0, latency + spread) / 1000
+
+    def pump(self, source, destination, counter, generator):
+        # a reader stamps every chunk with its delivery time, a writer sends it then; the chunks stay in order,
+        # so jitter never reorders a stream, and a chunk is never split, the node reads a request until a short chunk
+        chunks = queue.Queue()
+        writer = threading.Thread(target=self.deliver, args=(chunks, destination, counter), daemon=True)
+        writer.start()
+        last = 0.0
+        while True:
+            try:
+                data = source.recv(65536)
+            except OSError:
+                data = b""
+            last = max(last, time.perf_counter() + self.delay(generator))
+            chunks.put((last, data))
+            if not data:
+                break
+        writer.join()
+
+    def deliver(self, chunks, destination, counter):
+        free_at = 0.0
+        while True:
+            deliver_at, data = chunks.get()
+            # coalesce what is already due, it arrived together and is sent together
+            while data:
+                try:
+                    next_at, more = chunks.queue[0]
+                except IndexError:
+                    break
+                if next_at > max(deliver_at, time.perf_counter()) or not more:
+                    break
+                chunks.get()
+                deliver_at, data = next_at, data + more
+            with self.lock:
+                bandwidth = self.settings["bandwidth"]
+            if data and bandwidth:
+                # serialization delay, the link carries one chunk at a time
+                deliver_at = max(deliver_at, free_at) + len(data) / bandwidth
+                free_at = deliver_at
+            wait = deliver_at - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            if not data:
+                # pass the half close on, the node answers once the request is complete
+                try:
+                    destination.shutdown(socket.SHUT_WR)
+                except OSError:
+                    pass
+                return
+            try:
+                destination.sendall(data)
+            except OSError:
+                return
+            with self.lock:
+                self.counters[counter] += len(data)
+                self.counters["delayed_ms"] += max(0.0, wait) * 1000
+
+
+def link_settings(args, prefix=""):
+    # the link settings given on the command line
+    settings = {name: getattr(args, prefix.replace("-", "_") + name)
+                for name in ("latency_ms", "jitter_ms", "bandwidth", "reset_rate")}
+    return {name: value for name, value in settings.items() if value}
+
+
+def add_link_arguments(parser, prefix=""):
+    parser.add_argument(f"--{prefix}latency-ms", type=float, default=0.0, help="One-way delay added in each direction")
+    parser.add_argument(f"--{prefix}jitter-ms", type=float, default=0.0, help="Uniform +- spread around the delay")
+    parser.add_argument(f"--{prefix}bandwidth", type=float,
+                        help="Bytes per second per direction (default: unlimited)")
+    parser.add_argument(f"--{prefix}reset-rate", type=float, default=0.0,
+                        help="Share of the connections reset right after they are accepted, 0 to 1")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forward a port to a node with added latency, jitter, "
+                                                 "bandwidth limits and connection resets")
+    parser.add_argument("--listen-port", type=int, required=True, help="Port the proxy accepts connections on")
+    parser.add_argument("--target-port", type=int, required=True, help="Port of the node behind the proxy")
+    parser.add_argument("--target-ip", type=str, default="127.0.0.1", help="IP of the node behind the proxy")
+    parser.add_argument("--seed", type=int, help="Seed of the delays and resets, for repeatable runs")
+    add_link_arguments(parser)
+    args = parser.parse_args()
+
+    proxy = LinkProxy(args.listen_port, args.target_port, target_host=args.target_ip, seed=args.seed,
+                      **link_settings(args)).start()
+    print(f"{Fore.GREEN}Forwarding :{args.listen_port} -> {args.target_ip}:{args.target_port} "
+          f"with {link_settings(args) or 'no faults'}{Style.RESET_ALL}")
+    try:
+        while True:
+            time.sleep(10)
+            print(proxy.stats())
+    except KeyboardInterrupt:
+        proxy.stop()
@@ -9,26 +9,111 @@ from colorama import Fore, Style, init
 import signal
 import os
 import copy
+import sys
+import queue
 
 init(autoreset=True)
 
-from utils import hash_key, log, custom_split
+from utils import hash_key, custom_split, split_meta, format_meta
+from logger import Logger, LEVELS, DEBUG, INFO, ERROR, parse_sample_rates
+from bloom import BloomFilter
+from negative_cache import NegativeCache
+from ring import TokenRing, vnode_ids, split_endpoint
+from rebalancer import plan_moves
+from metrics import NodeMetrics, serve_prometheus
+from tracing import Tracer, new_id, parse_context
+from profiler import SamplingProfiler
+from memstats import AllocationTracker, store_bytes, record_bytes, dict_bytes, thread_stats, process_memory
+from transport import TcpTransport
+from capture import TrafficCapture
+from framing import FRAME_MAGIC, encode_frame, decode_frames
+
+# client-facing commands the entry node may start a sampled trace for
+TRACED_COMMANDS = ("insert", "update", "query", "delete")
+# seconds eventual consistency waits before passing a write on to the next replica
+EVENTUAL_DELAY = 0.1
+# seconds a pooled client connection may stay idle before the node closes it
+FRAMED_IDLE_TIMEOUT = 120
+# commands whose frames are run one at a time per key, in the order they arrived on their connection
+ORDERED_COMMANDS = ("insert", "update", "delete")
 
 class Node:
     def __init__(self, ip, port, bootstrap_ip=None, bootstrap_port=None,
-                 bootstrap = False, replication_factor=3, consistency="chain"):
+                 bootstrap = False, replication_factor=3, consistency="chain", hash_memo_size=100000,
+                 bloom_bits=16384, bloom_hashes=4, bloom_interval=1.0,
+                 negative_cache_size=1024, negative_cache_ttl=1.0, vnodes=1, metrics_port=None,
+                 trace_sample_rate=0.0, trace_buffer=10000, log_level=INFO, log_json=False, log_sample_rates=None,
+                 trace_allocations=False, listen_port=None, transport=None, capture_path=None, frame_workers=32,
+                 capture_dir="captures"):
         self.ip = ip
         self.port = port
-        self.node_id = hash_key(f"{ip}:{port}")
+        # the port we bind, when a proxy in front of us owns the advertised one
+        self.listen_port = listen_port or port
+        # outgoing connections and background work, real sockets and threads unless simulated
+        self.transport = transport or TcpTransport()
+        self.endpoint = f"{ip}:{port}"
+        self.node_id = hash_key(self.endpoint)
         self.bootstrap_node = bootstrap
         self.successor = self
         self.predecessor = self
         self.data = {}
+        # bytes of the records in self.data and how many of them are primaries, see track_bytes
+        self.data_bytes = 0
+        self.primary_keys = 0
+        # bounded memo of the hashes of the keys this node stores
+        self.hash_memo_size = hash_memo_size
+        self.key_hashes = {}
+        # bloom filter of the stored keys, published to the neighbours
+        self.bloom = BloomFilter(bloom_bits, bloom_hashes)
+        self.bloom_version = 0
+        self.bloom_heartbeat = 0
+        self.bloom_interval = bloom_interval
+        self.bloom_skips = 0
+        # the neighbours' published filters, by node id
+        self.peer_blooms = {}
+        # short-lived "Key not found" answers for queries entering at this node
+        self.negative_cache = NegativeCache(negative_cache_size, negative_cache_ttl)
+        # virtual ids of every node on the ring, used for placement once any node owns more than its node id
+        self.vnodes = vnodes
+        self.ring = TokenRing()
+        self.ring.add(self.endpoint, vnode_ids(ip, port, vnodes))
+        self.ring_announce = False
+        self.ring_lock = threading.Lock()
+        # primary requests served per virtual id, sampled by the rebalancer
+        self.token_requests = {}
+        self.rebalance_status = {"state": "idle"}
+        # request counters and latency histograms, served by the stats command
+        self.metrics = NodeMetrics()
+        self.metrics_port = metrics_port
+        # spans of sampled requests, served by the traces command
+        self.tracer = Tracer(self.endpoint, trace_sample_rate, trace_buffer)
+        # on-demand stack sampling of all threads, idle until a profile command starts it
+        self.profiler = SamplingProfiler()
+        # tracemalloc snapshots for memstats, from startup only when asked for
+        self.allocations = AllocationTracker()
+        # set once the server socket is closed, ends the background loops
+        self.stopped = False
+        # open connections of pooled clients, and the bounded pool of threads answering their frames
+        self.framed_connections = set()
+        self.connections_lock = threading.Lock()
+        self.frame_workers = max(1, frame_workers)
+        self.frame_queue = queue.Queue()
+        self.frame_threads = []
+        if trace_allocations:
+            self.allocations.start()
+        # opt-in log of the client commands entering at this node, for replay.py
+        self.capture = TrafficCapture()
+        # where the captures started at runtime go, a client only names the file
+        self.capture_dir = capture_dir
+        if capture_path:
+            self.capture.start(capture_path, self.endpoint)
 
         if not self.bootstrap_node:
             self.prefix = f"[NODE {str(self.node_id)[-4:]}]: "
         else:
             self.prefix = F"[BOOTSTRAP NODE | {str(self.node_id)[-4:]}]: "
+        # messages are formatted and written by a background thread
+        self.logger = Logger(self.prefix, log_level, log_json, log_sample_rates)
 
         if self.bootstrap_node:
             self.replication_factor = replication_factor
@@ -37,27 +122,82 @@ class Node:
         if not bootstrap and bootstrap_ip and bootstrap_port:
             self.join(bootstrap_ip, bootstrap_port)
 
-    def log(self, output=None):
-        log(prefix=self.prefix, output=output)
+    def log(self, output=None, *args, level=INFO, module="node"):
+        self.logger.log(level, module, output, *args)
+
+    def connect(self, ip, port, timeout=None):
+        return self.transport.connect(ip, port, timeout)
+
+    def key_hash(self, key):
+        hashed_key = self.key_hashes.get(key)
+        if hashed_key is None:
+            hashed_key = hash_key(key)
+        return hashed_key
+
+    def remember_hash(self, key, hashed_key):
+        if key not in self.key_hashes and len(self.key_hashes) >= self.hash_memo_size:
+            # evict the oldest memoized hash
+            try:
+                self.key_hashes.pop(next(iter(self.key_hashes)), None)
+            except (StopIteration, RuntimeError):
+                pass
+        self.key_hashes[key] = hashed_key
+
+    def forget_hash(self, key):
+        self.key_hashes.pop(key, None)
+
+    def index_key(self, key, hashed_key):
+        self.remember_hash(key, hashed_key)
+        self.bloom.add(hashed_key)
+        self.bloom_version += 1
+
+    def unindex_key(self, key):
+        self.bloom.remove(self.key_hash(key))
+        self.bloom_version += 1
+        self.forget_hash(key)
+
+    def track_bytes(self, key, record, sign=1):
+        # running size and primary count of the records in self.data, so overlay and stats do not walk the store
+        self.data_bytes += sign * record_bytes(key, record)
+        self.primary_keys += sign * (record["hop"] == 0)
+
+    def set_hop(self, key, hop):
+        # the hop is left out of a record's size, but a change may make it a primary or a replica
+        record = self.data[key]
+        self.primary_keys += (hop == 0) - (record["hop"] == 0)
+        record["hop"] = hop
 
     def start_server(self):
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         bind_ip = "0.0.0.0"
-        self.server_socket.bind((bind_ip, self.port))
-        self.server_socket.listen(5)
-        self.log(f"Binding on {bind_ip}:{self.port}")
+        self.server_socket.bind((bind_ip, self.listen_port))
+        # room for the forwards a burst of pipelined client requests sets off
+        self.server_socket.listen(128)
+        self.log(f"Binding on {bind_ip}:{self.listen_port}")
+
+        threading.Thread(target=self.bloom_sync, daemon=True).start()
+        if self.metrics_port:
+            serve_prometheus(self.metrics_port, self.stats, {"node": self.endpoint})
+            self.log(f"Serving Prometheus metrics on {bind_ip}:{self.metrics_port}")
+        # announce our virtual ids only once we can receive the keys they bring along
+        if self.ring_announce:
+            threading.Thread(target=self.announce_ring).start()
 
         while True:
-            client, _ = self.server_socket.accept()
+            try:
+                client, _ = self.server_socket.accept()
+            except OSError:
+                if self.stopped:
+                    break
+                raise
             threading.Thread(target=self.handle_request, args=(client,)).start()
 
     def join(self, bootstrap_ip, bootstrap_port):
         self.log(f"Joining via Bootstrap Node => {bootstrap_ip}:{bootstrap_port}")
 
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
-                client.connect((bootstrap_ip, bootstrap_port))
+            with self.connect(bootstrap_ip, bootstrap_port) as client:
                 client.sendall("get_network_config".encode())
                 config_data = client.recv(1024).decode()
                 replication_factor, consistency = config_data.split(":")
@@ -66,44 +206,51 @@ class Node:
                 self.log(f"Received network config: Replication Factor={self.replication_factor}, "
                          f"Consistency={self.consistency}")
 
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
-                client.connect((bootstrap_ip, bootstrap_port))
+            ring_data = self.send_message(bootstrap_ip, bootstrap_port, "get_ring")
+            self.ring = TokenRing.from_json(json.loads(ring_data))
+            self.ring.remove(self.endpoint)
+            self.ring.add(self.endpoint, vnode_ids(self.ip, self.port, self.vnodes))
+            self.ring_announce = True
+            self.log(f"Received token ring of {len(self.ring.endpoints()) - 1} nodes, "
+                     f"adding {self.vnodes} virtual ids.")
+
+            with self.connect(bootstrap_ip, bootstrap_port) as client:
                 client.sendall(f"find_successor {self.node_id}".encode())
                 successor_data = client.recv(1024).decode()
 
             succ_ip, succ_port = successor_data.split(":")
             self.successor = Node(succ_ip, int(succ_port))
 
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
-                client.connect((self.successor.ip, self.successor.port))
+            with self.connect(self.successor.ip, self.successor.port) as client:
                 client.sendall("get_predecessor".encode())
                 pred_data = client.recv(1024).decode()
 
             if pred_data == "None":
                 self.predecessor = self.successor
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
-                    client.connect((bootstrap_ip, bootstrap_port))
+                with self.connect(bootstrap_ip, bootstrap_port) as client:
                     client.sendall(f"update_successor {self.ip} {self.port}".encode())
             else:
                 pred_ip, pred_port = pred_data.split(":")
                 self.predecessor = Node(pred_ip, int(pred_port))
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
-                    client.connect((self.predecessor.ip, self.predecessor.port))
+                with self.connect(self.predecessor.ip, self.predecessor.port) as client:
                     client.sendall(f"update_successor {self.ip} {self.port}".encode())
 
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
-                client.connect((self.successor.ip, self.successor.port))
+            with self.connect(self.successor.ip, self.successor.port) as client:
                 client.sendall(f"update_predecessor {self.ip} {self.port}".encode())
                 self.log(f"Successfully joined the Chord ring.")
 
+            # with virtual ids the current holders push our keys once we announce them
+            if self.ring.virtual:
+                self.log(f"Virtual ids in use, keys will be pushed by their current holders.")
+                return
+
             # Request keys that now belong to this new node
             # The successor transfers to the new node - predecessor - the primary data it is responsible for,
             # along with all its replicas. The successor then increments the hop count for all transferred data
             # and propagates this update to the next successors.  If the hop count exceeds the replication factor,
             # the corresponding keys are deleted.
             self.log(f"Requesting keys from successor {self.successor.ip}:{self.successor.port}")
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
-                client.connect((self.successor.ip, self.successor.port))
+            with self.connect(self.successor.ip, self.successor.port) as client:
                 client.sendall(f"transfer_keys {self.node_id}".encode())
                 client.settimeout(2)
                 received_data = []
@@ -124,19 +271,24 @@ class Node:
             if received_data:
                 try:
                     transferred_keys = json.loads("".join(received_data))
+                    for key, record in transferred_keys.items():
+                        if key not in self.data:
+                            self.index_key(key, hash_key(key))
+                        else:
+                            self.track_bytes(key, self.data[key], -1)
+                        self.track_bytes(key, record)
                     self.data.update(transferred_keys)
                     self.log(f"Received {len(transferred_keys)} keys from successor.")
 
-                    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
-                        client.connect((self.successor.ip, self.successor.port))
+                    with self.connect(self.successor.ip, self.successor.port) as client:
                         client.sendall("ACK".encode())
                 except json.JSONDecodeError as e:
-                    self.log(f"{Fore.RED}ERROR: Failed to parse received key data: {e}{Style.RESET_ALL}")
+                    self.log(f"{Fore.RED}ERROR: Failed to parse received key data: {e}{Style.RESET_ALL}", level=ERROR)
             else:
                 self.log(f"Did not receive transfer_keys")
 
         except Exception as e:
-            self.log(f"{Fore.RED}ERROR: Join failed - {e}{Style.RESET_ALL}")
+            self.log(f"{Fore.RED}ERROR: Join failed - {e}{Style.RESET_ALL}", level=ERROR)
 
     def get_overlay(self, initial_node=None):
         if initial_node is None:
@@ -151,7 +303,19 @@ class Node:
             "successor": self.successor.node_id if self.successor else None,
             "predecessor": self.predecessor.node_id if self.predecessor else None,
             "is_bootstrap": self.bootstrap_node,
-            "key_count": key_count
+            "key_count": key_count,
+            "vnodes": len(self.ring.tokens_of(self.endpoint)),
+            "ownership": round(self.ring.ownership().get(self.endpoint, 0), 6),
+            "single_token_ownership": round(self.ring.single_token_ring().ownership().get(self.endpoint, 0), 6),
+            "bloom": {
+                "false_positive_rate": round(self.bloom.false_positive_rate(), 6),
+                "memory_bytes": sum(self.bloom.memory_bytes().values())
+            },
+            "memory": {
+                "data_bytes": self.data_bytes + sys.getsizeof(self.data),
+                "rss": process_memory()["rss"],
+                "threads": threading.active_count()
+            }
         }
 
         # if request returns to the initial node, return full collected data
@@ -164,14 +328,14 @@ class Node:
 
         # if response is empty, return only this node's data
         if not response.strip():
-            self.log(f"{Fore.RED}ERROR: Empty overlay response received!{Style.RESET_ALL}")
+            self.log(f"{Fore.RED}ERROR: Empty overlay response received!{Style.RESET_ALL}", level=ERROR)
             return json.dumps({self.node_id: overlay_data}, indent=4)
 
         # convert response to dictionary
         try:
             received_overlay = json.loads(response)
         except json.JSONDecodeError as e:
-            self.log(f"{Fore.RED}ERROR: JSON decode failed: {e}, response: {response}{Style.RESET_ALL}")
+            self.log(f"{Fore.RED}ERROR: JSON decode failed: {e}, response: {response}{Style.RESET_ALL}", level=ERROR)
             return json.dumps({self.node_id: overlay_data}, indent=4)  # Return only self-data if parsing fails
 
         # merge received data with current node
@@ -188,6 +352,13 @@ class Node:
         self.replication_factor = int(replication_factor)
         self.consistency = consistency
         self.data.clear()
+        self.data_bytes = 0
+        self.primary_keys = 0
+        self.key_hashes.clear()
+        self.bloom.clear()
+        self.bloom_version += 1
+        self.negative_cache.clear()
+        self.token_requests.clear()
         self.log(
             f"Reset configuration: Replication Factor={self.replication_factor}, Consistency={self.consistency}, Data Cleared.")
 
@@ -203,14 +374,14 @@ class Node:
 
         # if response is empty, return only this node's data
         if not response.strip():
-            self.log(f"{Fore.RED}ERROR: Empty reset response received!{Style.RESET_ALL}")
+            self.log(f"{Fore.RED}ERROR: Empty reset response received!{Style.RESET_ALL}", level=ERROR)
             return json.dumps({str(self.node_id)[-4:]: "ACK"}, indent=4)
 
         # convert response to dictionary
         try:
             received_reset_status = json.loads(response)
         except json.JSONDecodeError as e:
-            self.log(f"{Fore.RED}ERROR: JSON decode failed: {e}, response: {response}{Style.RESET_ALL}")
+            self.log(f"{Fore.RED}ERROR: JSON decode failed: {e}, response: {response}{Style.RESET_ALL}", level=ERROR)
             return json.dumps({str(self.node_id)[-4:]: "ACK"}, indent=4)  # Return only self-data if parsing fails
 
         # merge received data with current node
@@ -220,263 +391,35 @@ class Node:
         return json.dumps(received_reset_status, indent=4)
 
     def handle_request(self, client):
+        started = time.perf_counter()
+        request, response = "", ""
         try:
             client.settimeout(2)
             buffer = []
             try:
                 while True:
-                    chunk = client.recv(1024*10).decode()
+                    chunk = client.recv(1024*10)
+                    if not buffer and chunk.startswith(FRAME_MAGIC):
+                        # a pooled client keeps the connection open and sends framed requests
+                        self.serve_framed(client, chunk[len(FRAME_MAGIC):])
+                        return
                     if not chunk:
                         break
                     buffer.append(chunk)
                     if len(chunk) < 1024*10:
                         break
             except socket.timeout:
-                print("[ERROR] Receiving data timed out after 2 seconds.")
-            request = "".join(buffer).strip()
-
-            parts = custom_split(request)
-            command = parts[0].lower()
-
-            if command == "reset_config":
-                new_replication_factor = parts[1]
-                new_consistency = parts[2]
-                if len(parts) == 3:
-                    initial_node = None
-                elif len(parts) == 4:
-                    initial_node = parts[3]
-                else:
-                    response = json.dumps({"error": "Invalid reset_config command format"})
-                self.log(
-                    f"Resetting network config to Replication Factor={new_replication_factor}, Consistency={new_consistency}")
-                response = self.reset_configuration(new_replication_factor, new_consistency, initial_node)
-            elif command == "get_network_config":
-                self.log("Sending network config.")
-                response = f"{self.replication_factor}:{self.consistency}"
-            elif command == "overlay":
-                initial_node = None
-                if len(parts) == 2:
-                    initial_node = parts[1]
-                response = self.get_overlay(initial_node=initial_node)
-            elif command == "get_data":
-                if len(parts) >= 2:
-                    request_node_id = parts[1]
-                    self.log(f"get_data {request_node_id}")
-                    if str(self.node_id)[-4:] == request_node_id or str(self.node_id) == request_node_id:
-                        response = json.dumps({"node_id": str(self.node_id), "data": self.data}, indent=4)
-                        self.log(f"returning data {str(self.node_id)[-4:]}")
-                    else:
-                        self.log(f"forwarding data to {self.successor.node_id}")
-                        response = self.forward_request(command="get_data", key=request_node_id)
-                        self.log(f"received response from {str(self.successor.node_id)[-4:]}")
-            elif command == "find_successor":
-                node_id = int(parts[1])
-                successor = self.find_successor(node_id)
-                response = f"{successor.ip}:{successor.port}"
-            elif command == "get_predecessor":
-                response = f"{self.predecessor.ip}:{self.predecessor.port}" if self.predecessor and self.predecessor != self else "None"
-            elif command == "update_predecessor":
-                if len(parts) >= 3:
-                    self.log(f"Updating predecessor {parts}")
-                    try:
-                        pred_ip = parts[1]
-                        pred_port = int(parts[2])
-                        self.predecessor = Node(pred_ip, pred_port)
-                        self.log(f"Predecessor updated to {str(self.predecessor.node_id)[-4:]}")
-                        response = "ACK"
-                    except ValueError:
-                        self.log(f"ValueError while updating predecessor: {parts}")
-                        response = "ERROR: Invalid predecessor format"
-                else:
-                    response = "ERROR: Malformed update_predecessor command"
-            elif command == "update_successor":
-                if len(parts) >= 3:
-                    self.log(f"Updating successor {parts}")
-                    try:
-                        succ_ip = parts[1]
-                        succ_port = int(parts[2])
-                        self.successor = Node(succ_ip, succ_port)
-                        self.log(f"Successor updated to {str(self.successor.node_id)[-4:]}")
-                        response = "ACK"
-                    except ValueError:
-                        self.log(f"ValueError while updating successor: {parts}")
-                        response = "ERROR: Invalid successor format"
-                else:
-                    response = "ERROR: Malformed update_successor command"
-            elif command == "transfer_keys":
-                if len(parts) == 2:
-                    new_node_id = int(parts[1])
-                    self.log(f"Transferring primary keys to new predecessor {str(new_node_id)[-4:]}.")
-
-                    # find primary keys (hop == 0) that should be transferred to the new node
-                    primary_transfer_data = {key: value for key, value in self.data.items()
-                                     if value["hop"] == 0 and hash_key(key) <= new_node_id}
-                    self.log(f"Found {len(primary_transfer_data)} primary keys to transfer.")
-
-                    replica_transfer_data = {key: value for key, value in self.data.items()
-                                     if value["hop"] > 0}
-                    self.log(f"Found {len(replica_transfer_data)} replicas to transfer.")
-
-                    combined_transfer_data = copy.deepcopy(primary_transfer_data)
-                    combined_transfer_data.update(copy.deepcopy(replica_transfer_data))
-                    self.log(f"Total keys to transfer (primary + replicas): {len(combined_transfer_data)}")
-
-                    # delete keys where hop > replication_factor - 1
-                    old_data_size = len(self.data)
-                    self.data = {k: v for k, v in self.data.items()
-                                 if not (k in combined_transfer_data and v["hop"] >= self.replication_factor - 1)}
-                    new_data_size = len(self.data)
-                    self.log(f"Deleted {old_data_size - new_data_size} keys (hop >= {self.replication_factor - 1})."
-                             f"Now have {new_data_size} keys.")
-
-                    # increment hop for all of the keys of the successor that we send to the predecessor
-                    for key in combined_transfer_data:
-                         if key in self.data:
-                             self.data[key]["hop"] += 1
-
-                    # notify successors to increment hop on those keys too,
-                    # and delete the ones that surpass the replication factor.
-                    combined_transfer_keys = set(combined_transfer_data.keys())
-                    if len(combined_transfer_keys) > 0:
-                        increment_hop_response = self.forward_request(command="increment_hop",
-                                                                      combined_transfer_keys=json.dumps(list(combined_transfer_keys)))
-
-                        # increment_hop_response = self.forward_request("increment_hop", list(combined_transfer_keys))
-                        # self.log(f"received response from {str(self.successor.node_id)[-4:]} : {increment_hop_response}")
-
-                    # send the keys to the requesting node
-                    response = json.dumps(combined_transfer_data)
-                else:
-                    response = json.dumps({"error": "Invalid transfer_keys command format"})
-
-            elif command == "increment_hop":
-                if len(parts) == 2:
-                    try:
-                        # deserialize JSON argument to list
-                        keys_to_increment_hop = json.loads(parts[1])
-                        if not isinstance(keys_to_increment_hop, list):
-                            response = "ERROR: Expected a list of keys"
-                        else:
-                            # increment hop on those keys
-                            for key in keys_to_increment_hop:
-                                if key in self.data.keys():
-                                    self.data[key]["hop"] += 1
-                            # delete keys where hop > replication_factor - 1
-                            old_data_size = len(self.data)
-                            self.data = {k: v for k, v in self.data.items() if not v["hop"] > self.replication_factor - 1}
-                            new_data_size = len(self.data)
-                            self.log(
-                                f"Deleted {old_data_size - new_data_size} keys (hop > {self.replication_factor - 1}). "
-                                f"Now have {new_data_size} keys.")
-                            print(f"old_data_size: {old_data_size}")
-                            print(f"new_data_size: {new_data_size}")
-                            print(f"len(keys_to_increment_hop): {len(keys_to_increment_hop)}")
-                            if not old_data_size == new_data_size and len(keys_to_increment_hop) > 0:
-                                increment_hop_response = self.forward_request(command="increment_hop",
-                                                                              key=json.dumps(list(keys_to_increment_hop)))
-                                self.log(
-                                    f"received response from {str(self.successor.node_id)[-4:]} : {increment_hop_response}")
-                            response = "ACK"
-                    except json.JSONDecodeError:
-                        response = "ERROR: Malformed JSON in increment_hop"
-                else:
-                    response = "ERROR: Malformed increment_hop command"
-            elif command == "receive_keys":
-                try:
-                    keys_data = json.loads(" ".join(parts[1:]))
-                    keys_data = {key.strip().strip('"').strip(): value for key, value in keys_data.items()}
-                    alter_count = 0
-                    insert_count = 0
-                    transfer_data = {}
-                    def normalize_key(key):
-                        return key.strip().strip('"').strip("'")
-
-                    # match keys ignoring extra quotes
-                    normalized_self_data = {normalize_key(k): k for k in self.data}
-                    for key, value in keys_data.items():
-                        norm_key = normalize_key(key)
-                        if norm_key in normalized_self_data:
-                            original_key = normalized_self_data[norm_key]
-                            # if the key already exists, decrement the hop count
-                            self.data[original_key]["hop"] -= 1
-                            transfer_data[original_key] = self.data[original_key]
-                            alter_count += 1
-                        else:
-                            # insert the key with the received hop count and value
-                            self.data[key] = {"value": value["value"], "hop": value["hop"]}
-                            insert_count += 1
-
-                    self.log(f"Received {len(keys_data)}, inserted {insert_count} new keys & altered {alter_count} keys after node "
-                             f"departure from {str(self.predecessor.node_id)[-4:]}.")
-
-                    # propagate the key transfer process to the next successor
-                    if len(transfer_data) > 0 and alter_count+insert_count>0:
-                        if self.successor.node_id != self.node_id:
-                            self.log(f"Will propagate {len(transfer_data)} changes to {str(self.successor.node_id)[-4:]}")
-                            ack = self.forward_request(command="receive_keys", key=json.dumps(transfer_data))
-                            if ack == "ACK":
-                                self.log(f"Successor {str(self.successor.node_id)[-4:]} acknowledged key transfer.")
-                                response = "ACK"
-                            else:
-                                self.log(f"[ERROR] Successor {str(self.successor.node_id)[-4:]} did not acknowledge key transfer: {ack}")
-                                response = "ERROR"
-                        else:
-                            response = "ACK"
-                    else:
-                        response = "ACK"
-
-                except json.JSONDecodeError:
-                    response = "ERROR: Invalid key transfer data format"
-
-            elif command == "insert":
-                key, value = parts[1], parts[2]
-                if len(parts) == 4:
-                    replica_count = int(parts[3])
-                else:
-                    replica_count = 0
-                if replica_count >= self.replication_factor:
-                    response = "Replication limit reached"
-                else:
-                    response = self.insert(key, value, replica_count) or "ERROR: Insert failed"
-            elif command == "query":
-                key = parts[1]
-                initial_node, hops = None, 0
-
-                if len(parts) == 3:
-                    if len(str(parts[2])) > 4:
-                        initial_node = parts[2]
-                    else:
-                        hops = int(parts[2])
-                elif len(parts) == 4:
-                    if len(str(parts[2])) > 4:
-                        initial_node = parts[2]
-                        hops = int(parts[3])
-                    else:
-                        hops = int(parts[2])
-                        initial_node = parts[3]
-                value = self.query(key, hops=hops, initial_node=initial_node)
-                response = f"{value}"
-            elif command == "delete":
-                key = parts[1]
-                if len(parts) == 3:
-                    replica_count = int(parts[2])
-                else:
-                    replica_count = 0
-                if replica_count >= self.replication_factor:
-                    response = "Replication limit reached"
-                else:
-                    response = self.delete(key, replica_count)
-
-            else:
-                response = f"Invalid command: {", ".join(parts)}"
+                self.log("[ERROR] Receiving data timed out after 2 seconds.", level=ERROR)
+            request = b"".join(buffer).decode().strip()
+            response = self.answer(request, started)
 
             # ensure socket is valid before responding
             if client.fileno() != -1:
-                client.send(response.encode())
+                client.sendall(response.encode())
             else:
                 self.log(f"Socket is not open anymore. Client cannot send response!")
         except Exception as e:
-            self.log(f"{Fore.RED}ERROR: Exception in handle_request: {e}{Style.RESET_ALL}")
+            self.log(f"{Fore.RED}ERROR: Exception in handle_request: {e}{Style.RESET_ALL}", level=ERROR)
             if client.fileno() != -1:
                 try:
                     client.send("ERROR: Internal server error".encode())
@@ -488,64 +431,637 @@ class Node:
             except OSError:
                 pass
 
-    def insert(self, key, value, replica_count=0):
-        hashed_key = hash_key(key)
+    def answer(self, request, started=None):
+        # processes one request, whichever connection it came on, and records it in the metrics and the capture
+        started = time.perf_counter() if started is None else started
+        self.metrics.handler_started()
+        command, response, error = "unknown", "", False
+        stripped, meta = "", {}
+        try:
+            stripped, meta = split_meta(request)
+            command = stripped.split(" ", 1)[0].lower()
+            # join the caller's trace, or start one for a sampled client request
+            trace_id = parent_id = None
+            if "trace" in meta:
+                trace_id, parent_id = parse_context(meta["trace"])
+            elif command in TRACED_COMMANDS and "node" not in meta and self.tracer.sample():
+                trace_id = new_id()
+            if trace_id is not None:
+                with self.tracer.span(command, trace_id, parent_id, request=stripped[:80]):
+                    response = self.process_request(stripped, meta)
+            else:
+                response = self.process_request(stripped, meta)
+            if response.startswith("Invalid command"):
+                # keep arbitrary input out of the per-command metrics
+                command = "invalid"
+            error = response.startswith("ERROR") or response.startswith('{"error"')
+        except Exception as e:
+            self.log(f"{Fore.RED}ERROR: Exception while answering %s: %s{Style.RESET_ALL}", request[:80], e, level=ERROR)
+            response, error = "ERROR: Internal server error", True
+        finally:
+            elapsed = time.perf_counter() - started
+            self.metrics.handler_finished(command, elapsed, len(request.encode()), len(response.encode()), error)
+            if self.capture.active and self.is_client_request(command, stripped, meta):
+                self.capture.record(started, stripped, elapsed, error)
+        return response
+
+    def serve_framed(self, client, pending):
+        # requests are answered concurrently by the frame pool and may finish out of order, each answer carries
+        # its request's id; writes to the same key wait for the earlier ones, so they apply in the order sent
+        client.settimeout(FRAMED_IDLE_TIMEOUT)
+        send_lock = threading.Lock()
+        order_lock = threading.Lock()
+        # keys of the writes running now, and the writes waiting for them in arrival order
+        busy, waiting = set(), []
+
+        def run(keys, frame):
+            try:
+                self.answer_frame(client, send_lock, *frame)
+            finally:
+                if keys:
+                    release(keys)
+
+        def release(keys):
+            ready = []
+            with order_lock:
+                busy.difference_update(keys)
+                blocked = set(busy)
+                for entry in list(waiting):
+                    if not entry[0] & blocked:
+                        waiting.remove(entry)
+                        busy.update(entry[0])
+                        ready.append(entry)
+                    blocked.update(entry[0])
+            for entry in ready:
+                self.submit_frame(run, *entry)
+
+        with self.connections_lock:
+            self.framed_connections.add(client)
+        try:
+            client.sendall(FRAME_MAGIC)
+            buffer = pending
+            while not self.stopped:
+                frames, buffer = decode_frames(buffer)
+                for request_id, request in frames:
+                    frame = (request_id, request, time.perf_counter())
+                    keys = self.written_keys(request)
+                    with order_lock:
+                        if keys & busy or any(keys & entry[0] for entry in waiting):
+                            waiting.append((keys, frame))
+                            continue
+                        busy.update(keys)
+                    self.submit_frame(run, keys, frame)
+                chunk = client.recv(65536)
+                if not chunk:
+                    break
+                buffer += chunk
+        except OSError:
+            # idle for too long, or the client went away
+            pass
+        finally:
+            with self.connections_lock:
+                self.framed_connections.discard(client)
+
+    def submit_frame(self, job, *args):
+        # the worker threads start with the first pooled connection, a simulated node never has any
+        with self.connections_lock:
+            if not self.frame_threads:
+                self.frame_threads = [threading.Thread(target=self.frame_worker, daemon=True)
+                                      for _ in range(self.frame_workers)]
+                for thread in self.frame_threads:
+                    thread.start()
+        self.frame_queue.put((job, args))
+
+    def frame_worker(self):
+        while True:
+            work = self.frame_queue.get()
+            if work is None:
+                return
+            job, args = work
+            try:
+                job(*args)
+            except Exception as e:
+                self.log("Exception while answering a frame: %s", e, level=ERROR)
+
+    def written_keys(self, request):
+        # the keys a request writes, a batch writes the keys of its commands
+        stripped, _ = split_meta(request.strip())
+        parts = custom_split(stripped)
+        command = parts[0].lower() if parts else ""
+        if command in ORDERED_COMMANDS and len(parts) > 1:
+            return {parts[1]}
+        if command == "batch" and len(parts) > 1:
+            try:
+                commands = json.loads(parts[1])
+            except ValueError:
+                return set()
+            if isinstance(commands, list):
+                return {key for item in commands for key in self.written_keys(str(item))}
+        return set()
+
+    def answer_frame(self, client, send_lock, request_id, request, started):
+        response = self.answer(request.strip(), started)
+        try:
+            with send_lock:
+                client.sendall(encode_frame(request_id, response))
+        except OSError:
+            pass
+
+    def close_connections(self):
+        # pooled clients keep their connections open, end them along with the server
+        with self.connections_lock:
+            connections = list(self.framed_connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        # and end the threads answering their frames
+        with self.connections_lock:
+            threads, self.frame_threads = self.frame_threads, []
+        for _ in threads:
+            self.frame_queue.put(None)
+
+    def is_client_request(self, command, request, meta):
+        # commands sent by a client, not hops, replicas or the query * walk forwarded by other nodes
+        if command not in TRACED_COMMANDS or "node" in meta:
+            return False
+        return not (command == "query" and len(custom_split(request)) > 2)
+
+    def process_request(self, request, meta=None):
+        # strip the metadata (e.g. the key hash) appended by forwarding nodes
+        if meta is None:
+            request, meta = split_meta(request)
+        key_hash = int(meta["hash"]) if "hash" in meta else None
+        parts = custom_split(request)
+        command = parts[0].lower()
+
+        if command == "reset_config":
+            new_replication_factor = parts[1]
+            new_consistency = parts[2]
+            if len(parts) == 3:
+                initial_node = None
+            elif len(parts) == 4:
+                initial_node = parts[3]
+            else:
+                response = json.dumps({"error": "Invalid reset_config command format"})
+            self.log(
+                f"Resetting network config to Replication Factor={new_replication_factor}, Consistency={new_consistency}")
+            response = self.reset_configuration(new_replication_factor, new_consistency, initial_node)
+        elif command == "get_network_config":
+            self.log("Sending network config.")
+            response = f"{self.replication_factor}:{self.consistency}"
+        elif command == "overlay":
+            initial_node = None
+            if len(parts) == 2:
+                initial_node = parts[1]
+            response = self.get_overlay(initial_node=initial_node)
+        elif command == "get_data":
+            if len(parts) >= 2:
+                request_node_id = parts[1]
+                self.log("get_data %s", request_node_id, level=DEBUG, module="get_data")
+                if str(self.node_id)[-4:] == request_node_id or str(self.node_id) == request_node_id:
+                    response = json.dumps({"node_id": str(self.node_id), "data": self.data}, indent=4)
+                    self.log("returning data %s", str(self.node_id)[-4:], level=DEBUG, module="get_data")
+                else:
+                    self.log("forwarding data to %s", self.successor.node_id, level=DEBUG, module="get_data")
+                    response = self.forward_request(command="get_data", key=request_node_id)
+                    self.log("received response from %s", str(self.successor.node_id)[-4:], level=DEBUG,
+                             module="get_data")
+        elif command == "get_ring":
+            response = json.dumps(self.ring.to_json())
+        elif command == "ring_add":
+            try:
+                endpoint, tokens = json.loads(parts[1])
+                self.log(f"Adding {len(tokens)} virtual ids of {endpoint} to the ring.")
+                self.update_ring(lambda ring: (ring.remove(endpoint), ring.add(endpoint, tokens)))
+                response = "ACK"
+            except (IndexError, ValueError):
+                response = "ERROR: Malformed ring_add command"
+        elif command == "ring_remove":
+            if len(parts) == 3:
+                endpoint = f"{parts[1]}:{parts[2]}"
+                self.log(f"Removing the virtual ids of {endpoint} from the ring.")
+                self.update_ring(lambda ring: ring.remove(endpoint))
+                self.peer_blooms.pop(hash_key(endpoint), None)
+                response = "ACK"
+            else:
+                response = "ERROR: Malformed ring_remove command"
+        elif command == "ring_assign":
+            if len(parts) == 3:
+                token, endpoint = int(parts[1]), parts[2]
+                self.log(f"Assigning virtual id {str(token)[-4:]} to {endpoint}.")
+                self.update_ring(lambda ring: ring.assign(token, endpoint))
+                response = "ACK"
+            else:
+                response = "ERROR: Malformed ring_assign command"
+        elif command == "load_report":
+            response = json.dumps(self.load_report())
+        elif command == "move_token":
+            if len(parts) == 3:
+                response = json.dumps(self.move_token(int(parts[1]), parts[2]))
+            else:
+                response = json.dumps({"error": "Malformed move_token command"})
+        elif command == "rebalance":
+            action = parts[1].lower() if len(parts) >= 2 else "status"
+            window = float(parts[2]) if len(parts) >= 3 else 2.0
+            max_moves = int(parts[3]) if len(parts) >= 4 else 4
+            if action == "plan":
+                response = json.dumps(self.plan_rebalance(window, max_moves), indent=4)
+            elif action == "run":
+                if self.rebalance_status["state"] in ("collecting", "streaming"):
+                    response = json.dumps({"error": "A rebalance is already running"})
+                else:
+                    threading.Thread(target=self.run_rebalance, args=(window, max_moves)).start()
+                    response = json.dumps({"state": "started"})
+            elif action == "status":
+                response = json.dumps(self.rebalance_status, indent=4)
+            else:
+                response = json.dumps({"error": f"Unknown rebalance action: {action}"})
+        elif command == "absorb_keys":
+            try:
+                absorbed = self.absorb_keys(json.loads(parts[1]))
+                self.log(f"Absorbed {absorbed} keys pushed after a ring change.")
+                response = "ACK"
+            except (IndexError, ValueError) as e:
+                response = f"ERROR: Invalid absorb_keys data: {e}"
+        elif command == "bloom_pull":
+            try:
+                response = json.dumps(self.bloom_pull(json.loads(parts[1])))
+            except (IndexError, ValueError):
+                response = "ERROR: Malformed bloom_pull command"
+        elif command == "bloom_stats":
+            response = json.dumps(self.bloom_stats(), indent=4)
+        elif command == "cache_stats":
+            response = json.dumps(self.negative_cache.stats(), indent=4)
+        elif command == "traces":
+            if len(parts) == 2:
+                response = json.dumps(self.tracer.trace(parts[1]))
+            else:
+                response = json.dumps({"tracing": self.tracer.stats(), "recent": self.tracer.recent()}, indent=4)
+        elif command == "profile":
+            response = self.profile(parts[1:])
+        elif command == "batch":
+            # several commands in one request, answered one after the other as a JSON list
+            try:
+                commands = json.loads(parts[1])
+                if not isinstance(commands, list):
+                    raise ValueError("not a list")
+                response = json.dumps([self.answer(str(item).strip()) for item in commands])
+            except (IndexError, ValueError):
+                response = "ERROR: Malformed batch command"
+        elif command == "capture":
+            action = parts[1].lower() if len(parts) > 1 else "status"
+            if action == "start" and len(parts) == 3:
+                name = parts[2]
+                # a bare file name only, a client must not pick which file on the node's host is overwritten
+                if name in (".", "..") or os.path.basename(name) != name or (os.altsep and os.altsep in name):
+                    response = f"ERROR: Capture file must be a plain file name in {self.capture_dir}"
+                else:
+                    path = os.path.join(self.capture_dir, name)
+                    try:
+                        os.makedirs(self.capture_dir, exist_ok=True)
+                        if self.capture.start(path, self.endpoint):
+                            self.log(f"Capturing client commands to {path}.")
+                        response = json.dumps(self.capture.status())
+                    except OSError as e:
+                        response = f"ERROR: Cannot capture to {path}: {e}"
+            elif action == "stop":
+                if self.capture.stop():
+                    self.log(f"Stopped capturing, {self.capture.captured} commands in {self.capture.path}.")
+                response = json.dumps(self.capture.status())
+            elif action == "status":
+                response = json.dumps(self.capture.status())
+            else:
+                response = "ERROR: Malformed capture command"
+        elif command == "memstats":
+            if len(parts) == 3 and parts[1].lower() == "tracemalloc" and parts[2].lower() in ("start", "stop"):
+                if parts[2].lower() == "start":
+                    self.allocations.start()
+                else:
+                    self.allocations.stop()
+                response = "ACK"
+            else:
+                response = json.dumps(self.memory_stats(), indent=4)
+        elif command == "log_level":
+            if len(parts) == 2 and parts[1].lower() in LEVELS:
+                self.logger.level = LEVELS[parts[1].lower()]
+                response = "ACK"
+            else:
+                response = f"ERROR: Expected one of {', '.join(LEVELS)}"
+        elif command == "stats":
+            if len(parts) == 2 and parts[1].lower() == "reset":
+                self.metrics.reset()
+                response = "ACK"
+            else:
+                response = json.dumps(self.stats(), indent=4)
+        elif command == "find_successor":
+            node_id = int(parts[1])
+            successor = self.find_successor(node_id)
+            response = f"{successor.ip}:{successor.port}"
+        elif command == "get_predecessor":
+            response = f"{self.predecessor.ip}:{self.predecessor.port}" if self.predecessor and self.predecessor != self else "None"
+        elif command == "update_predecessor":
+            if len(parts) >= 3:
+                self.log(f"Updating predecessor {parts}")
+                try:
+                    pred_ip = parts[1]
+                    pred_port = int(parts[2])
+                    self.predecessor = Node(pred_ip, pred_port)
+                    self.log(f"Predecessor updated to {str(self.predecessor.node_id)[-4:]}")
+                    response = "ACK"
+                except ValueError:
+                    self.log(f"ValueError while updating predecessor: {parts}")
+                    response = "ERROR: Invalid predecessor format"
+            else:
+                response = "ERROR: Malformed update_predecessor command"
+        elif command == "update_successor":
+            if len(parts) >= 3:
+                self.log(f"Updating successor {parts}")
+                try:
+                    succ_ip = parts[1]
+                    succ_port = int(parts[2])
+                    self.successor = Node(succ_ip, succ_port)
+                    self.log(f"Successor updated to {str(self.successor.node_id)[-4:]}")
+                    response = "ACK"
+                except ValueError:
+                    self.log(f"ValueError while updating successor: {parts}")
+                    response = "ERROR: Invalid successor format"
+            else:
+                response = "ERROR: Malformed update_successor command"
+        elif command == "transfer_keys":
+            if len(parts) == 2:
+                new_node_id = int(parts[1])
+                self.log("Transferring primary keys to new predecessor %s.", str(new_node_id)[-4:], level=DEBUG,
+                         module="transfer")
+
+                primary_transfer_data, replica_transfer_data = self.select_transfer(new_node_id)
+                self.log("Found %s primary keys to transfer.", len(primary_transfer_data), level=DEBUG, module="transfer")
+                self.log("Found %s replicas to transfer.", len(replica_transfer_data), level=DEBUG, module="transfer")
+
+                combined_transfer_data = copy.deepcopy(primary_transfer_data)
+                combined_transfer_data.update(copy.deepcopy(replica_transfer_data))
+                self.log("Total keys to transfer (primary + replicas): %s", len(combined_transfer_data), level=DEBUG,
+                         module="transfer")
+
+                # delete keys where hop > replication_factor - 1
+                old_data = self.data
+                old_data_size = len(old_data)
+                self.data = {k: v for k, v in old_data.items()
+                             if not (k in combined_transfer_data and v["hop"] >= self.replication_factor - 1)}
+                for key in old_data.keys() - self.data.keys():
+                    self.unindex_key(key)
+                    self.track_bytes(key, old_data[key], -1)
+                new_data_size = len(self.data)
+                self.log("Deleted %s keys (hop >= %s). Now have %s keys.", old_data_size - new_data_size,
+                         self.replication_factor - 1, new_data_size, level=DEBUG, module="transfer")
+
+                # increment hop for all of the keys of the successor that we send to the predecessor
+                for key in combined_transfer_data:
+                     if key in self.data:
+                         self.set_hop(key, self.data[key]["hop"] + 1)
+
+                # notify successors to increment hop on those keys too,
+                # and delete the ones that surpass the replication factor.
+                combined_transfer_keys = set(combined_transfer_data.keys())
+                if len(combined_transfer_keys) > 0:
+                    increment_hop_response = self.forward_request(command="increment_hop",
+                                                                  combined_transfer_keys=json.dumps(list(combined_transfer_keys)))
+
+                    # increment_hop_response = self.forward_request("increment_hop", list(combined_transfer_keys))
+                    # self.log(f"received response from {str(self.successor.node_id)[-4:]} : {increment_hop_response}")
+
+                # send the keys to the requesting node
+                response = json.dumps(combined_transfer_data)
+            else:
+                response = json.dumps({"error": "Invalid transfer_keys command format"})
+
+        elif command == "increment_hop":
+            if len(parts) == 2:
+                try:
+                    # deserialize JSON argument to list
+                    keys_to_increment_hop = json.loads(parts[1])
+                    if not isinstance(keys_to_increment_hop, list):
+                        response = "ERROR: Expected a list of keys"
+                    else:
+                        old_data_size, new_data_size = self.increment_hops(keys_to_increment_hop)
+                        self.log(
+                            f"Deleted {old_data_size - new_data_size} keys (hop > {self.replication_factor - 1}). "
+                            f"Now have {new_data_size} keys.")
+                        self.log("increment_hop: old_data_size=%s new_data_size=%s keys=%s", old_data_size,
+                                 new_data_size, len(keys_to_increment_hop), level=DEBUG, module="increment_hop")
+                        if not old_data_size == new_data_size and len(keys_to_increment_hop) > 0:
+                            increment_hop_response = self.forward_request(command="increment_hop",
+                                                                          key=json.dumps(list(keys_to_increment_hop)))
+                            self.log(
+                                f"received response from {str(self.successor.node_id)[-4:]} : {increment_hop_response}")
+                        response = "ACK"
+                except json.JSONDecodeError:
+                    response = "ERROR: Malformed JSON in increment_hop"
+            else:
+                response = "ERROR: Malformed increment_hop command"
+        elif command == "receive_keys":
+            try:
+                keys_data = json.loads(" ".join(parts[1:]))
+                keys_data = {key.strip().strip('"').strip(): value for key, value in keys_data.items()}
+                alter_count = 0
+                insert_count = 0
+                transfer_data = {}
+                def normalize_key(key):
+                    return key.strip().strip('"').strip("'")
+
+                # match keys ignoring extra quotes
+                normalized_self_data = {normalize_key(k): k for k in self.data}
+                for key, value in keys_data.items():
+                    norm_key = normalize_key(key)
+                    if norm_key in normalized_self_data:
+                        original_key = normalized_self_data[norm_key]
+                        # if the key already exists, decrement the hop count
+                        self.set_hop(original_key, self.data[original_key]["hop"] - 1)
+                        transfer_data[original_key] = self.data[original_key]
+                        alter_count += 1
+                    else:
+                        # insert the key with the received hop count and value
+                        self.data[key] = {"value": value["value"], "hop": value["hop"]}
+                        self.index_key(key, hash_key(key))
+                        self.track_bytes(key, self.data[key])
+                        insert_count += 1
+
+                self.log(f"Received {len(keys_data)}, inserted {insert_count} new keys & altered {alter_count} keys after node "
+                         f"departure from {str(self.predecessor.node_id)[-4:]}.")
+
+                # propagate the key transfer process to the next successor
+                if len(transfer_data) > 0 and alter_count+insert_count>0:
+                    if self.successor.node_id != self.node_id:
+                        self.log(f"Will propagate {len(transfer_data)} changes to {str(self.successor.node_id)[-4:]}")
+                        ack = self.forward_request(command="receive_keys", key=json.dumps(transfer_data))
+                        if ack == "ACK":
+                            self.log(f"Successor {str(self.successor.node_id)[-4:]} acknowledged key transfer.")
+                            response = "ACK"
+                        else:
+                            self.log(f"[ERROR] Successor {str(self.successor.node_id)[-4:]} did not acknowledge key transfer: {ack}")
+                            response = "ERROR"
+                    else:
+                        response = "ACK"
+                else:
+                    response = "ACK"
+
+            except json.JSONDecodeError:
+                response = "ERROR: Invalid key transfer data format"
+
+        elif command in ("insert", "update"):
+            # an update overwrites the value, an insert adds it to the values the key holds
+            key, value = parts[1], parts[2]
+            if len(parts) == 4:
+                replica_count = int(parts[3])
+            else:
+                replica_count = 0
+            if replica_count >= self.replication_factor:
+                response = "Replication limit reached"
+            else:
+                response = self.insert(key, value, replica_count, key_hash=key_hash, replace=command == "update") \
+                           or f"ERROR: {command.capitalize()} failed"
+                # the insert was acknowledged, drop any "not found" answer cached meanwhile
+                self.negative_cache.discard(key)
+        elif command == "query":
+            key = parts[1]
+            initial_node, hops = None, 0
+
+            if len(parts) == 3:
+                if len(str(parts[2])) > 4:
+                    initial_node = parts[2]
+                else:
+                    hops = int(parts[2])
+            elif len(parts) == 4:
+                if len(str(parts[2])) > 4:
+                    initial_node = parts[2]
+                    hops = int(parts[3])
+                else:
+                    hops = int(parts[2])
+                    initial_node = parts[3]
+            # only the entry node of a client query answers from the negative cache
+            entry_query = key_hash is None and initial_node is None and hops == 0 and key != "*"
+            if entry_query and self.negative_cache.get(key):
+                value = "Key not found"
+            else:
+                value = self.query(key, hops=hops, initial_node=initial_node, key_hash=key_hash)
+                if entry_query and value == "Key not found":
+                    self.negative_cache.put(key)
+            response = f"{value}"
+        elif command == "local_query":
+            # this node's own copy, never forwarded, so a staleness probe can read each replica directly
+            if len(parts) == 2:
+                record = self.data.get(parts[1])
+                response = json.dumps(record) if record is not None else "Key not found"
+            else:
+                response = "ERROR: Malformed local_query command"
+        elif command == "delete":
+            key = parts[1]
+            if len(parts) == 3:
+                replica_count = int(parts[2])
+            else:
+                replica_count = 0
+            if replica_count >= self.replication_factor:
+                response = "Replication limit reached"
+            else:
+                response = self.delete(key, replica_count, key_hash=key_hash)
+
+        else:
+            response = f"Invalid command: {", ".join(parts)}"
+
+        return response
+
+    def select_transfer(self, new_node_id):
+        # primary keys (hop == 0) that should be transferred to the new node, and all the replicas
+        primary = {key: value for key, value in self.data.items()
+                   if value["hop"] == 0 and self.key_hash(key) <= new_node_id}
+        replicas = {key: value for key, value in self.data.items() if value["hop"] > 0}
+        return primary, replicas
+
+    def increment_hops(self, keys):
+        # increment hop on those keys
+        for key in keys:
+            if key in self.data.keys():
+                self.set_hop(key, self.data[key]["hop"] + 1)
+        # delete keys where hop > replication_factor - 1
+        old_data = self.data
+        self.data = {k: v for k, v in old_data.items() if not v["hop"] > self.replication_factor - 1}
+        for key in old_data.keys() - self.data.keys():
+            self.unindex_key(key)
+            self.track_bytes(key, old_data[key], -1)
+        return len(old_data), len(self.data)
+
+    def insert(self, key, value, replica_count=0, key_hash=None, replace=False):
+        command = "update" if replace else "insert"
+        self.negative_cache.discard(key)
+        # the entry node hashes the key once, the rest of the route reuses it
+        hashed_key = key_hash if key_hash is not None else self.key_hash(key)
 
         if self.responsible_for(hashed_key) or replica_count>0:
             #print(f"Node {self.node_id} is responsible for key {hashed_key}")
             if replica_count==0:
-                self.log(f"Responsible for key {key}:{value}")
-            if key in self.data:
+                self.log("Responsible for key %s:%s", key, value, level=DEBUG, module="insert")
+                self.record_token_hit(hashed_key)
+            if key in self.data and replace:
+                self.track_bytes(key, self.data[key], -1)
+                self.data[key]["value"] = value
+                self.track_bytes(key, self.data[key])
+            elif key in self.data:
                 # no duplicates
                 existing_values = self.data[key]["value"].split(", ")
                 # concatenate for update
                 if value not in existing_values:
+                    self.track_bytes(key, self.data[key], -1)
                     self.data[key]["value"] += f", {value}"
+                    self.track_bytes(key, self.data[key])
             else:
                 self.data[key] = {"value": value, "hop": replica_count}
+                self.index_key(key, hashed_key)
+                self.track_bytes(key, self.data[key])
 
-            if replica_count < self.replication_factor - 1:
+            target = self.replica_target(hashed_key) if replica_count < self.replication_factor - 1 else None
+            if target is not None:
                 if self.consistency == "chain":
-                    return self.chain_replicate("insert", key, value, replica_count)
+                    return self.chain_replicate(command, key, value, replica_count, hashed_key, target)
                 elif self.consistency == "eventual":
-                    threading.Thread(target=self.eventual_replicate, args=("insert", key, value, replica_count)).start()
-                    return f"{self.prefix} Inserted {key}: {value}"
-            elif replica_count == self.replication_factor - 1:
-                self.log(f"Tail received baton for key {key}")
-                if self.consistency == "chain":
-                    return f"{self.prefix}Inserted {key}: {value}"
+                    self.transport.spawn(self.tracer.wrap(self.eventual_replicate), command, key, value, replica_count,
+                                         hashed_key, target, delay=EVENTUAL_DELAY)
+                    return f"{self.prefix} {'Updated' if replace else 'Inserted'} {key}: {value}"
+            else:
+                self.log("Tail received baton for key %s", key, level=DEBUG, module="insert")
+                return f"{self.prefix}{'Updated' if replace else 'Inserted'} {key}: {value}"
         else:
             # self.log(f"Forwarding key {key} to successor {str(self.successor.node_id)[-4:]}")
-            return self.forward_request(command="insert", key=key, value=value)
+            return self.forward_request(command=command, key=key, value=value, key_hash=hashed_key,
+                                        target=self.route(hashed_key))
 
-    def query(self, key, hops=0, initial_node=None):
-        hashed_key = hash_key(key)
+    def query(self, key, hops=0, initial_node=None, key_hash=None):
         if key == "*" or key.strip().strip('"').strip() == "*":
-            self.log(f"Got query {key} {initial_node}")
+            self.log("Got query %s %s", key, initial_node, level=DEBUG, module="query")
             # the bootstrap node
             if initial_node is None:
-                self.log(f"First query * call")
+                self.log("First query * call", level=DEBUG, module="query")
                 initial_node = self.node_id
 
             # the last node before bootstrap returns its data
             if self.successor.node_id == int(initial_node):
-                self.log(f"Last query * call, added {len(self.data)}")
+                self.log("Last query * call, added %s", len(self.data), level=DEBUG, module="query")
                 return json.dumps({k: v["value"] for k, v in self.data.items()}, indent=4)
 
             # forward request to the successor, waiting for their response
-            self.log(f"Forwarding to {self.successor.node_id} query {key} {initial_node}")
+            self.log("Forwarding to %s query %s %s", self.successor.node_id, key, initial_node, level=DEBUG, module="query")
             response = self.forward_request(command="query", key=key, hops=0, initial_node=initial_node)
 
             # parse response safely
             if not response.strip():
-                self.log(f"{Fore.RED}ERROR: Empty response received!{Style.RESET_ALL}")
+                self.log(f"{Fore.RED}ERROR: Empty response received!{Style.RESET_ALL}", level=ERROR)
                 return json.dumps({k: v["value"] for k, v in self.data.items()}, indent=4)
 
             # convert response to dict
             try:
                 received_data = json.loads(response)
             except json.JSONDecodeError as e:
-                self.log(f"{Fore.RED}ERROR: JSON decode failed: {e}, response: {response}{Style.RESET_ALL}")
+                self.log(f"{Fore.RED}ERROR: JSON decode failed: {e}, response: {response}{Style.RESET_ALL}", level=ERROR)
                 # if failed return my data
                 return json.dumps({k: v["value"] for k, v in self.data.items()}, indent=4)
 
@@ -553,69 +1069,392 @@ class Node:
             # extend dict with current node's data
             received_data.update({k: v["value"] for k, v in self.data.items()})
             after = len(received_data)
-            self.log(f"Added: {after - before} pairs, now hold: {after}")
+            self.log("Added: %s pairs, now hold: %s", after - before, after, level=DEBUG, module="query")
             return json.dumps(received_data, indent=4)
         if self.consistency == "chain":
+            hashed_key = key_hash if key_hash is not None else self.key_hash(key)
             if self.responsible_for(hashed_key) or hops > 0:
-                if hops < self.replication_factor - 1:
-                    return self.forward_request(command="query", key=key, hops=hops + 1)
+                if hops == 0:
+                    self.record_token_hit(hashed_key)
+                target = self.replica_target(hashed_key) if hops < self.replication_factor - 1 else None
+                if target is not None:
+                    return self.forward_request(command="query", key=key, hops=hops + 1, key_hash=hashed_key,
+                                                target=target)
                 return self.data[key]["value"] if key in self.data else "Key not found"
             else:
-                return self.forward_request(command="query", key=key)
+                return self.forward_request(command="query", key=key, key_hash=hashed_key,
+                                            target=self.route(hashed_key))
         elif self.consistency == "eventual":
             if initial_node is None:
-                self.log(f"First eventual query call: {key}")
+                self.log("First eventual query call: %s", key, level=DEBUG, module="query")
                 initial_node = self.node_id
             else:
-                self.log(f"{hops}) eventual query call: {key}, init_node: {initial_node}")
+                self.log("%s) eventual query call: %s, init_node: %s", hops, key, initial_node, level=DEBUG, module="query")
             if key in self.data.keys():
-                self.log(f"found {key}")
+                self.log("found %s", key, level=DEBUG, module="query")
                 return self.data[key]["value"]
             if self.successor.node_id == int(initial_node):
-                self.log(f"{Fore.YELLOW}Last eventual query call. Key {key} not found.{Style.RESET_ALL}")
+                self.log(f"{Fore.YELLOW}Last eventual query call. Key %s not found.{Style.RESET_ALL}", key, level=DEBUG, module="query")
+                return "Key not found"
+
+            # jump over the nodes whose bloom filter rules the key out
+            hashed_key = key_hash if key_hash is not None else self.key_hash(key)
+            target = self.next_bloom_candidate(hashed_key, int(initial_node))
+            if target is None:
+                self.log(f"{Fore.YELLOW}No bloom filter left on the ring matches %s. Key not found.{Style.RESET_ALL}", key,
+                         level=DEBUG, module="query")
                 return "Key not found"
-            return self.forward_request(command="query", key=key, hops=hops+1, initial_node=initial_node)
+            try:
+                return self.forward_request(command="query", key=key, hops=hops+1, initial_node=initial_node,
+                                            key_hash=hashed_key, target=target)
+            except OSError as e:
+                self.log(f"{Fore.RED}ERROR: Bloom jump to {target[0]}:{target[1]} failed: {e}{Style.RESET_ALL}", level=ERROR)
+                return self.forward_request(command="query", key=key, hops=hops+1, initial_node=initial_node,
+                                            key_hash=hashed_key)
         return "Key not found"
 
-    def delete(self, key, replica_count=0):
-        hashed_key = hash_key(key)
+    def delete(self, key, replica_count=0, key_hash=None):
+        hashed_key = key_hash if key_hash is not None else self.key_hash(key)
         if self.responsible_for(hashed_key) or replica_count > 0:
-            self.log(f"Deleting key {key} {f'(replica {replica_count})' if replica_count>0 else ''}")
-            self.data.pop(key, None)
-
-            if replica_count < self.replication_factor - 1:
+            self.log("Deleting key %s %s", key, f"(replica {replica_count})" if replica_count > 0 else "",
+                     level=DEBUG, module="delete")
+            if replica_count == 0:
+                self.record_token_hit(hashed_key)
+            record = self.data.pop(key, None)
+            if record is not None:
+                self.unindex_key(key)
+                self.track_bytes(key, record, -1)
+
+            target = self.replica_target(hashed_key) if replica_count < self.replication_factor - 1 else None
+            if target is not None:
                 if self.consistency == "chain":
-                    return self.chain_replicate("delete", key, None, replica_count)
+                    return self.chain_replicate("delete", key, None, replica_count, hashed_key, target)
                 elif self.consistency == "eventual":
-                    threading.Thread(target=self.eventual_replicate, args=("delete", key, None, replica_count)).start()
+                    self.transport.spawn(self.tracer.wrap(self.eventual_replicate), "delete", key, None, replica_count,
+                                         hashed_key, target, delay=EVENTUAL_DELAY)
                     return f"{self.prefix} Deleted {key}"
-            elif replica_count == self.replication_factor - 1:
-                self.log(f"Tail received baton to delete key {key}")
-                if self.consistency == "chain":
-                    return f"{self.prefix}Deleted {key}"
+            else:
+                self.log("Tail received baton to delete key %s", key, level=DEBUG, module="delete")
+                return f"{self.prefix}Deleted {key}"
         else:
-            return self.forward_request(command="delete", key=key)
-
-    def chain_replicate(self, command, key, value, replica_count):
-        successor = self.successor
-        if successor:
-            self.log(f"Passing replication baton from {self.ip}:{self.port} to {successor.ip}:{successor.port} for key {key} and rc: {replica_count + 1}")
-            return successor.forward_request(command=command, key=key, value=value, replica_count=replica_count + 1)
-
-    def eventual_replicate(self, command, key, value, replica_count):
-        successor = self.successor
-        if successor:
-            # simulate async delay
-            time.sleep(0.1)
-            self.log(f"Lazy forwarding to {successor.ip}:{successor.port} for key {key}")
-            successor.forward_request(command=command, key=key, value=value, replica_count=replica_count + 1)
+            return self.forward_request(command="delete", key=key, key_hash=hashed_key,
+                                        target=self.route(hashed_key))
+
+    def replica_target(self, key_hash):
+        # next node of the key's replica chain, None when this node is the tail
+        if not self.ring.virtual:
+            return self.successor.ip, self.successor.port
+        next_replica = self.ring.next_replica(key_hash, self.endpoint, self.replication_factor)
+        return split_endpoint(next_replica) if next_replica else None
+
+    def route(self, key_hash):
+        # with virtual ids the owner is known up front, otherwise walk the successors
+        if not self.ring.virtual:
+            return None
+        return split_endpoint(self.ring.owner(key_hash))
+
+    def chain_replicate(self, command, key, value, replica_count, key_hash=None, target=None):
+        if target is None:
+            target = (self.successor.ip, self.successor.port)
+        self.log("Passing replication baton from %s:%s to %s:%s for key %s and rc: %s",
+                 self.ip, self.port, target[0], target[1], key, replica_count + 1, level=DEBUG, module="replicate")
+        with self.tracer.span(f"chain_replicate {command}", replica=replica_count + 1):
+            return self.forward_request(command=command, key=key, value=value, replica_count=replica_count + 1,
+                                        key_hash=key_hash, target=target)
+
+    def eventual_replicate(self, command, key, value, replica_count, key_hash=None, target=None):
+        if target is None:
+            target = (self.successor.ip, self.successor.port)
+        # the async delay is applied by the transport that scheduled us (EVENTUAL_DELAY)
+        with self.tracer.span(f"eventual_replicate {command}", replica=replica_count + 1):
+            self.log("Lazy forwarding to %s:%s for key %s", target[0], target[1], key, level=DEBUG, module="replicate")
+            self.forward_request(command=command, key=key, value=value, replica_count=replica_count + 1,
+                                 key_hash=key_hash, target=target)
+
+    def send_message(self, ip, port, message, timeout=2):
+        with self.connect(ip, port, timeout=timeout) as client:
+            client.sendall(message.encode())
+            response = []
+            while True:
+                chunk = client.recv(4096).decode()
+                if not chunk:
+                    break
+                response.append(chunk)
+            response = "".join(response)
+            self.metrics.record_forward(message.split(" ", 1)[0].lower(), len(message.encode()), len(response.encode()))
+            return response
+
+    def announce_ring(self):
+        message = f"ring_add {json.dumps([self.endpoint, self.ring.tokens_of(self.endpoint)])}"
+        for endpoint in self.ring.endpoints():
+            if endpoint == self.endpoint:
+                continue
+            try:
+                self.send_message(*split_endpoint(endpoint), message)
+            except OSError as e:
+                self.log(f"{Fore.RED}ERROR: Could not announce virtual ids to {endpoint}: {e}{Style.RESET_ALL}", level=ERROR)
+        self.log(f"Announced {len(self.ring.tokens_of(self.endpoint))} virtual ids to the ring.")
+
+    def update_ring(self, update):
+        with self.ring_lock:
+            old_ring = self.ring.copy()
+            new_ring = old_ring.copy()
+            update(new_ring)
+            self.ring = new_ring
+        # plain chord rings move their keys through transfer_keys and receive_keys instead
+        if old_ring.virtual or new_ring.virtual:
+            self.transport.spawn(self.redistribute_keys, old_ring, new_ring)
+
+    def redistribute_keys(self, old_ring, new_ring, batch_size=32):
+        pushes = {}
+        drops = []
+        for key, record in list(self.data.items()):
+            hashed_key = self.key_hash(key)
+            old_replicas = old_ring.preference_list(hashed_key, self.replication_factor)
+            new_replicas = new_ring.preference_list(hashed_key, self.replication_factor)
+            if self.endpoint in old_replicas:
+                # the first replica that keeps the key hands it to the replicas that gained it
+                keepers = [endpoint for endpoint in old_replicas if endpoint in new_replicas]
+                pusher = keepers[0] if keepers else old_replicas[0]
+                targets = [endpoint for endpoint in new_replicas if endpoint not in old_replicas] \
+                    if pusher == self.endpoint else []
+            else:
+                # misplaced copy, hand it to all of its replicas
+                targets = new_replicas
+            for endpoint in targets:
+                if endpoint != self.endpoint:
+                    pushes.setdefault(endpoint, []).append([key, record["value"], new_replicas.index(endpoint)])
+            if self.endpoint in new_replicas:
+                self.set_hop(key, new_replicas.index(self.endpoint))
+            else:
+                drops.append((key, targets))
+
+        failed = set()
+        for endpoint, records in pushes.items():
+            for i in range(0, len(records), batch_size):
+                try:
+                    ack = self.send_message(*split_endpoint(endpoint),
+                                            f"absorb_keys {json.dumps(records[i:i + batch_size])}")
+                    if ack != "ACK":
+                        raise OSError(ack)
+                except OSError as e:
+                    self.log(f"{Fore.RED}ERROR: Could not push keys to {endpoint}: {e}{Style.RESET_ALL}", level=ERROR)
+                    failed.add(endpoint)
+                    break
+
+        dropped = 0
+        for key, targets in drops:
+            record = self.data.pop(key, None) if not failed.intersection(targets) else None
+            if record is not None:
+                self.unindex_key(key)
+                self.track_bytes(key, record, -1)
+                dropped += 1
+        self.log(f"Redistributed keys for the new ring: pushed {sum(len(r) for r in pushes.values())} "
+                 f"to {len(pushes)} nodes, dropped {dropped}, now have {len(self.data)} keys.")
+
+    def stats(self):
+        stats = self.metrics.snapshot()
+        stats["node_id"] = str(self.node_id)
+        stats["endpoint"] = self.endpoint
+        stats["threads"] = threading.active_count()
+        stats["logging"] = self.logger.stats()
+        stats["data"] = {
+            "key_count": len(self.data),
+            "primary_keys": self.primary_keys,
+            "replica_keys": len(self.data) - self.primary_keys,
+            # the same running figure as the overlay's, without the dict itself
+            "data_bytes": self.data_bytes,
+            "memoized_hashes": len(self.key_hashes)
+        }
+        return stats
+
+    def profile(self, args):
+        action = args[0].lower() if args else "status"
+        target = args[1] if len(args) > 1 and args[1] != "-" else None
+        if target is not None and target not in (str(self.node_id), str(self.node_id)[-4:]):
+            # hand the command to the node with that id (or its last 4 digits)
+            for endpoint in self.ring.endpoints():
+                node_id = str(hash_key(endpoint))
+                if target in (node_id, node_id[-4:]):
+                    return self.send_message(*split_endpoint(endpoint), " ".join(["profile", action, node_id] + args[2:]),
+                                             timeout=30)
+            return json.dumps({"error": f"No node with id {target}"})
+
+        try:
+            if action == "start":
+                duration = float(args[2]) if len(args) > 2 else 10.0
+                interval = float(args[3]) if len(args) > 3 else 0.005
+                started = self.profiler.start(duration, interval)
+                if started:
+                    self.log(f"Profiling all threads for {duration}s every {interval * 1000:.1f}ms.")
+                result = dict(self.profiler.status(), started=started)
+            elif action == "stop":
+                self.profiler.stop()
+                result = self.profiler.status()
+            elif action == "status":
+                result = self.profiler.status()
+            elif action == "dump":
+                output = args[2].lower() if len(args) > 2 else "collapsed"
+                if output == "collapsed":
+                    result = {"format": "collapsed", "data": self.profiler.collapsed()}
+                elif output == "pstats":
+                    result = {"format": "pstats", "encoding": "base64", "data": self.profiler.pstats()}
+                else:
+                    return json.dumps({"error": f"Unknown profile format: {output}"})
+                result.update(self.profiler.status())
+            else:
+                return json.dumps({"error": f"Unknown profile action: {action}"})
+        except ValueError as e:
+            return json.dumps({"error": f"Malformed profile command: {e}"})
+        result["node_id"] = str(self.node_id)
+        return json.dumps(result)
+
+    def memory_stats(self):
+        recv_buffer = send_buffer = 0
+        if hasattr(self, "server_socket"):
+            recv_buffer = self.server_socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+            send_buffer = self.server_socket.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+        in_flight = self.metrics.active_handlers
+        return {
+            "node_id": str(self.node_id),
+            "endpoint": self.endpoint,
+            "key_count": len(self.data),
+            "data": store_bytes(self.data),
+            "hash_memo": dict_bytes(self.key_hashes),
+            "bloom": sum(self.bloom.memory_bytes().values()),
+            "peer_blooms": sum(len(peer["filter"].bits) for peer in list(self.peer_blooms.values())),
+            "negative_cache": dict_bytes(self.negative_cache.entries),
+            "trace_spans": len(self.tracer.spans),
+            "threads": thread_stats(),
+            # every in-flight request holds a socket with kernel buffers and a receive chunk
+            "sockets": {
+                "in_flight": in_flight,
+                "recv_buffer": recv_buffer,
+                "send_buffer": send_buffer,
+                "in_flight_bytes": in_flight * (recv_buffer + send_buffer + 1024 * 10)
+            },
+            "process": process_memory(),
+            "allocations": self.allocations.report()
+        }
+
+    def record_token_hit(self, key_hash):
+        if self.ring.virtual:
+            token = self.ring.token_for(key_hash)
+            self.token_requests[token] = self.token_requests.get(token, 0) + 1
+
+    def load_report(self):
+        primary_keys = {}
+        for key, record in list(self.data.items()):
+            if record["hop"] == 0:
+                token = self.ring.token_for(self.key_hash(key))
+                primary_keys[token] = primary_keys.get(token, 0) + 1
+        return {
+            "endpoint": self.endpoint,
+            "key_count": len(self.data),
+            "tokens": {
+                str(token): {"keys": primary_keys.get(token, 0), "requests": self.token_requests.get(token, 0)}
+                for token in self.ring.tokens_of(self.endpoint)
+            }
+        }
+
+    def collect_load_reports(self):
+        reports = {}
+        for endpoint in self.ring.endpoints():
+            if endpoint == self.endpoint:
+                reports[endpoint] = self.load_report()
+            else:
+                reports[endpoint] = json.loads(self.send_message(*split_endpoint(endpoint), "load_report"))
+        return reports
+
+    def plan_rebalance(self, window=2.0, max_moves=4):
+        # sample every node twice to turn the request counters into rates
+        before = self.collect_load_reports()
+        time.sleep(window)
+        after = self.collect_load_reports()
+        plan = plan_moves(before, after, window, max_moves=max_moves)
+        if not self.ring.virtual:
+            plan["note"] = "Every node owns a single virtual id, start nodes with --vnodes to allow moves."
+        return plan
+
+    def run_rebalance(self, window=2.0, max_moves=4):
+        status = {"state": "collecting", "started_at": time.time(), "completed": 0, "keys_streamed": 0}
+        self.rebalance_status = status
+        try:
+            plan = self.plan_rebalance(window, max_moves)
+            status["plan"] = plan
+            status["state"] = "streaming"
+            for move in plan["moves"]:
+                status["current"] = move
+                self.log(f"Rebalance: moving virtual id {str(move['token'])[-4:]} from {move['from']} to {move['to']}")
+                result = json.loads(self.send_message(*split_endpoint(move["from"]),
+                                                      f"move_token {move['token']} {move['to']}", timeout=120))
+                if "error" in result:
+                    raise RuntimeError(result["error"])
+                status["keys_streamed"] += result["streamed"]
+                status["completed"] += 1
+            status.pop("current", None)
+            status["state"] = "done"
+        except Exception as e:
+            self.log(f"{Fore.RED}ERROR: Rebalance failed - {e}{Style.RESET_ALL}", level=ERROR)
+            status["state"] = "failed"
+            status["error"] = str(e)
+        status["finished_at"] = time.time()
+
+    def move_token(self, token, endpoint, batch_size=32):
+        if self.ring.owners.get(token) != self.endpoint:
+            return {"error": f"Virtual id {token} is not owned by {self.endpoint}"}
+        old_ring = self.ring
+        new_ring = old_ring.copy()
+        new_ring.assign(token, endpoint)
+
+        # stream the keys the new owner gains while we keep serving them under the old ring
+        records = []
+        for key, record in list(self.data.items()):
+            hashed_key = self.key_hash(key)
+            old_replicas = old_ring.preference_list(hashed_key, self.replication_factor)
+            new_replicas = new_ring.preference_list(hashed_key, self.replication_factor)
+            if old_replicas[0] == self.endpoint and endpoint in new_replicas and endpoint not in old_replicas:
+                records.append([key, record["value"], new_replicas.index(endpoint)])
+        for i in range(0, len(records), batch_size):
+            ack = self.send_message(*split_endpoint(endpoint), f"absorb_keys {json.dumps(records[i:i + batch_size])}")
+            if ack != "ACK":
+                return {"error": f"{endpoint} did not absorb the streamed keys: {ack}"}
+        self.log(f"Streamed {len(records)} keys of virtual id {str(token)[-4:]} to {endpoint}.")
+
+        # then switch the ownership on every node, the usual redistribution cleans up the rest
+        for other in old_ring.endpoints():
+            if other != self.endpoint:
+                try:
+                    self.send_message(*split_endpoint(other), f"ring_assign {token} {endpoint}")
+                except OSError as e:
+                    self.log(f"{Fore.RED}ERROR: Could not reassign virtual id at {other}: {e}{Style.RESET_ALL}", level=ERROR)
+        self.update_ring(lambda ring: ring.assign(token, endpoint))
+        return {"token": token, "to": endpoint, "streamed": len(records)}
+
+    def absorb_keys(self, records):
+        for key, value, hop in records:
+            if key in self.data:
+                # union of both copies' values, like repeated inserts
+                existing_values = self.data[key]["value"].split(", ")
+                missing = [v for v in value.split(", ") if v not in existing_values]
+                if missing:
+                    self.track_bytes(key, self.data[key], -1)
+                    self.data[key]["value"] += ", " + ", ".join(missing)
+                    self.track_bytes(key, self.data[key])
+                self.set_hop(key, hop)
+            else:
+                self.data[key] = {"value": value, "hop": hop}
+                self.index_key(key, hash_key(key))
+                self.track_bytes(key, self.data[key])
+        return len(records)
 
     def forward_request(self, command, key=None, value=None, replica_count=0,
                         hops=0, initial_node=None, replication_factor=None,
-                        consistency=None, combined_transfer_keys=None):
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
-            client.settimeout(2)
-            client.connect((self.successor.ip, self.successor.port))
+                        consistency=None, combined_transfer_keys=None, key_hash=None, target=None):
+        if target is None:
+            target = (self.successor.ip, self.successor.port)
+        with self.tracer.span(f"forward {command}", peer=f"{target[0]}:{target[1]}"), \
+                self.connect(*target, timeout=2) as client:
 
             message = command
             if key:
@@ -632,6 +1471,7 @@ class Node:
                 message += f" {replication_factor} {consistency} {initial_node}"
             if combined_transfer_keys is not None:
                 message += f" {combined_transfer_keys}"
+            message += format_meta(hash=key_hash, trace=self.tracer.outgoing(), node=self.endpoint)
 
             client.sendall(message.encode())
 
@@ -645,9 +1485,148 @@ class Node:
                     response.append(chunk)
                 except socket.timeout:
                     break
-            return "".join(response)
+            response = "".join(response)
+            self.metrics.record_forward(command, len(message.encode()), len(response.encode()))
+            return response
+
+    def next_bloom_candidate(self, key_hash, initial_node):
+        successor = (self.successor.ip, self.successor.port)
+        # the nodes of the ring only, also those whose filter has not been gossiped yet; a departed node's
+        # filter may linger among the peer filters, it is never a candidate
+        nodes = {hash_key(endpoint): split_endpoint(endpoint) for endpoint in self.ring.endpoints()}
+        nodes.pop(self.node_id, None)
+        # without a current view of the ring fall back to the plain successor walk
+        if self.successor.node_id not in nodes or (initial_node != self.node_id and initial_node not in nodes):
+            return successor
+
+        ring = sorted(nodes)
+        order = [node_id for node_id in ring if node_id > self.node_id] + \
+                [node_id for node_id in ring if node_id < self.node_id]
+        if order[0] != self.successor.node_id:
+            return successor
+
+        # filters lag behind recent inserts, but the primary holds every acknowledged key, so it is never skipped
+        owner = self.ring.owner(key_hash)
+        primary = hash_key(owner) if owner is not None else None
+
+        max_age = self.bloom_interval * 3
+        now = time.monotonic()
+        for skipped, node_id in enumerate(order):
+            if node_id == initial_node:
+                self.bloom_skips += skipped
+                return None
+            peer = self.peer_blooms.get(node_id)
+            # no filter yet, or one not refreshed lately, cannot rule anything out
+            if node_id == primary or peer is None or now - peer["seen"] > max_age or \
+                    peer["filter"].might_contain(key_hash):
+                self.bloom_skips += skipped
+                return nodes[node_id]
+        # wrapped around to the initial node
+        self.bloom_skips += len(order)
+        return None
+
+    def bloom_entry(self, with_bits=True):
+        entry = {
+            "node_id": self.node_id,
+            "ip": self.ip,
+            "port": self.port,
+            "version": self.bloom_version,
+            "heartbeat": self.bloom_heartbeat,
+            "size": self.bloom.size,
+            "hashes": self.bloom.hashes,
+            "count": self.bloom.count
+        }
+        if with_bits:
+            entry["bits"] = self.bloom.encode()
+        return entry
+
+    def bloom_pull(self, known):
+        # return every filter the requester holds an older copy of, or none at all
+        known = {int(node_id): (version, heartbeat) for node_id, version, heartbeat in known}
+        candidates = [(self.bloom_entry(with_bits=False), None)]
+        candidates += [(dict(peer["entry"]), peer["bits"]) for peer in list(self.peer_blooms.values())]
+        response = []
+        for entry, bits in candidates:
+            version, heartbeat = known.get(entry["node_id"], (-1, -1))
+            if entry["version"] > version:
+                entry["bits"] = bits if bits is not None else self.bloom.encode()
+                response.append(entry)
+            elif entry["heartbeat"] > heartbeat:
+                response.append(entry)
+        return response
+
+    def merge_blooms(self, entries):
+        now = time.monotonic()
+        members = set(self.ring.endpoints())
+        for entry in entries:
+            node_id = entry["node_id"]
+            # a departed node's filter still gossiped by a peer that has not dropped it yet
+            if node_id == self.node_id or f"{entry['ip']}:{entry['port']}" not in members:
+                continue
+            peer = self.peer_blooms.get(node_id)
+            if "bits" in entry and (peer is None or entry["version"] > peer["entry"]["version"]):
+                bits = entry.pop("bits")
+                peer = {"ip": entry["ip"], "port": entry["port"], "entry": entry, "bits": bits, "seen": now,
+                        "filter": BloomFilter.decode(entry["size"], entry["hashes"], bits, entry["count"])}
+                self.peer_blooms[node_id] = peer
+            elif peer is not None and entry["heartbeat"] > peer["entry"]["heartbeat"]:
+                peer["entry"]["heartbeat"] = entry["heartbeat"]
+                peer["seen"] = now
+
+    def bloom_sync(self):
+        while not self.stopped:
+            time.sleep(self.bloom_interval)
+            if self.stopped:
+                break
+            self.bloom_heartbeat += 1
+
+            # forget the filters of nodes that stopped sending heartbeats
+            now = time.monotonic()
+            for node_id, peer in list(self.peer_blooms.items()):
+                if now - peer["seen"] > self.bloom_interval * 10:
+                    self.peer_blooms.pop(node_id, None)
+
+            if self.successor.node_id == self.node_id:
+                continue
+            known = [[self.node_id, self.bloom_version, self.bloom_heartbeat]]
+            known += [[node_id, peer["entry"]["version"], peer["entry"]["heartbeat"]]
+                      for node_id, peer in list(self.peer_blooms.items())]
+            try:
+                with self.connect(self.successor.ip, self.successor.port, timeout=2) as client:
+                    client.sendall(f"bloom_pull {json.dumps(known)}".encode())
+                    response = []
+                    while True:
+                        chunk = client.recv(4096).decode()
+                        if not chunk:
+                            break
+                        response.append(chunk)
+                self.merge_blooms(json.loads("".join(response)))
+            except (OSError, ValueError) as e:
+                self.log(f"{Fore.RED}ERROR: Bloom filter sync with {self.successor.ip}:{self.successor.port} failed: {e}{Style.RESET_ALL}", level=ERROR)
+
+    def bloom_stats(self):
+        now = time.monotonic()
+        return {
+            "node_id": self.node_id,
+            "version": self.bloom_version,
+            "skipped_nodes": self.bloom_skips,
+            "filter": self.bloom.stats(),
+            "peers": {
+                str(node_id): {
+                    "keys": peer["filter"].count,
+                    "fill_ratio": round(peer["filter"].set_bits / peer["filter"].size, 4),
+                    "false_positive_rate": round(peer["filter"].false_positive_rate(), 6),
+                    "memory_bytes": len(peer["filter"].bits),
+                    "age": round(now - peer["seen"], 2)
+                }
+                for node_id, peer in list(self.peer_blooms.items())
+            }
+        }
 
     def responsible_for(self, key_hash):
+        if self.ring.virtual:
+            return self.ring.owner(key_hash) == self.endpoint
+
         pred_id = self.predecessor.node_id if self.predecessor else None
         node_id = self.node_id
 
@@ -663,59 +1642,82 @@ class Node:
         return key_hash > pred_id or key_hash <= node_id
 
 
+    def stop_server(self):
+        # stops serving without departing, the in-process cluster harness uses it for teardown
+        self.stopped = True
+        if hasattr(self, 'server_socket'):
+            try:
+                self.server_socket.shutdown(socket.SHUT_RDWR)
+                self.server_socket.close()
+            except OSError:
+                pass
+        self.close_connections()
+        self.logger.flush()
+
     def depart(self):
         self.log(f"Departing...")
 
+        # Every node drops our virtual ids. With virtual ids in use, the remaining replicas of each key
+        # push it to the nodes that take over, and we push the keys nobody else holds.
+        old_ring = self.ring.copy()
+        for endpoint in old_ring.endpoints():
+            if endpoint != self.endpoint:
+                try:
+                    self.send_message(*split_endpoint(endpoint), f"ring_remove {self.ip} {self.port}")
+                except OSError as x:
+                    self.log(f"{Fore.RED}ERROR: Could not remove our virtual ids at {endpoint}: {x}{Style.RESET_ALL}", level=ERROR)
+        new_ring = old_ring.copy()
+        new_ring.remove(self.endpoint)
+        self.peer_blooms.clear()
+        if old_ring.virtual:
+            self.redistribute_keys(old_ring, new_ring)
+
         # Each node transfers all its primary and replica keys to its successor.
         # If the successor already holds these keys, their hop count is decremented.
         # Otherwise, the keys are inserted along with their values.
         # This process is then propagated to the following successors in the network.
-        if self.successor.node_id != self.node_id:
+        if self.successor.node_id != self.node_id and not old_ring.virtual:
             try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
-                    client.settimeout(2)
-                    client.connect((self.successor.ip, self.successor.port))
+                with self.connect(self.successor.ip, self.successor.port, timeout=2) as client:
                     client.sendall(f"receive_keys {json.dumps(self.data)}".encode())
                     ack = client.recv(1024).decode()
                     if ack != "ACK":
-                        self.log(f"{Fore.RED}ERROR: Successor {str(self.successor.node_id)[-4:]} did not confirm key transfer: {ack}{Style.RESET_ALL}")
+                        self.log(f"{Fore.RED}ERROR: Successor {str(self.successor.node_id)[-4:]} did not confirm key transfer: {ack}{Style.RESET_ALL}", level=ERROR)
                     else:
                         self.log(f"{Fore.GREEN}Successor {str(self.successor.node_id)[-4:]} did confirm key transfer!{Style.RESET_ALL}")
             except Exception as x:
-                self.log(f"{Fore.RED}ERROR: Could not transfer keys to {self.successor.ip}:{self.successor.port}: {x}{Style.RESET_ALL}")
+                self.log(f"{Fore.RED}ERROR: Could not transfer keys to {self.successor.ip}:{self.successor.port}: {x}{Style.RESET_ALL}", level=ERROR)
 
         # notify predecessor to update successor
         if self.predecessor.node_id != self.node_id:
             try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
-                    client.settimeout(2)
-                    client.connect((self.predecessor.ip, self.predecessor.port))
+                with self.connect(self.predecessor.ip, self.predecessor.port, timeout=2) as client:
                     client.sendall(f"update_successor {self.successor.ip} {self.successor.port}".encode())
                     ack = client.recv(1024).decode()
                     if ack != "ACK":
-                        self.log(f"{Fore.RED}ERROR: Predecessor {str(self.predecessor.node_id)[-4:]} did not acknowledge successor update: {ack}{Style.RESET_ALL}")
+                        self.log(f"{Fore.RED}ERROR: Predecessor {str(self.predecessor.node_id)[-4:]} did not acknowledge successor update: {ack}{Style.RESET_ALL}", level=ERROR)
                     else:
                         self.log(f"{Fore.GREEN}Predecessor {str(self.predecessor.node_id)[-4:]} did acknowledge successor update!{Style.RESET_ALL}")
             except Exception as x:
-                self.log(f"{Fore.RED}ERROR: Could not update predecessor at {self.predecessor.ip}:{self.predecessor.port}: {x}{Style.RESET_ALL}")
+                self.log(f"{Fore.RED}ERROR: Could not update predecessor at {self.predecessor.ip}:{self.predecessor.port}: {x}{Style.RESET_ALL}", level=ERROR)
 
         # notify successor to update predecessor
         if self.successor.node_id != self.node_id:
             try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
-                    client.settimeout(2)
-                    client.connect((self.successor.ip, self.successor.port))
+                with self.connect(self.successor.ip, self.successor.port, timeout=2) as client:
                     client.sendall(f"update_predecessor {self.predecessor.ip} {self.predecessor.port}".encode())
                     ack = client.recv(1024).decode()
                     if ack != "ACK":
-                        self.log(f"{Fore.RED}ERROR: Successor {str(self.successor.node_id)[-4:]} did not acknowledge predecessor update: {ack}{Style.RESET_ALL}")
+                        self.log(f"{Fore.RED}ERROR: Successor {str(self.successor.node_id)[-4:]} did not acknowledge predecessor update: {ack}{Style.RESET_ALL}", level=ERROR)
                     else:
                         self.log(f"{Fore.GREEN}Successor {str(self.successor.node_id)[-4:]} did acknowledge predecessor update!{Style.RESET_ALL}")
             except Exception as x:
-                self.log(f"{Fore.RED}ERROR: Could not update successor at {self.successor.ip}:{self.successor.port}: {x}{Style.RESET_ALL}")
+                self.log(f"{Fore.RED}ERROR: Could not update successor at {self.successor.ip}:{self.successor.port}: {x}{Style.RESET_ALL}", level=ERROR)
 
         self.log("Closing socket...")
-        self.server_socket.close()
+        if hasattr(self, "server_socket"):
+            self.server_socket.close()
+        self.close_connections()
         self.log(f"Successfully departed from the Chord ring.")
 
     def find_successor(self, node_id):
@@ -734,14 +1736,14 @@ class Node:
 
         # forward request to next node
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
-                client.connect((self.successor.ip, self.successor.port))
-                client.sendall(f"find_successor {node_id}".encode())
+            with self.tracer.span("find_successor", peer=f"{self.successor.ip}:{self.successor.port}"), \
+                    self.connect(self.successor.ip, self.successor.port) as client:
+                client.sendall(f"find_successor {node_id}{format_meta(trace=self.tracer.outgoing(), node=self.endpoint)}".encode())
                 response = client.recv(1024).decode()
                 successor_ip, successor_port = response.split(":")
                 return Node(successor_ip, int(successor_port))
         except:
-            self.log(f"{Fore.RED}ERROR: Forwarding find_successor failed to {self.successor.ip}:{self.successor.port}{Style.RESET_ALL}")
+            self.log(f"{Fore.RED}ERROR: Forwarding find_successor failed to {self.successor.ip}:{self.successor.port}{Style.RESET_ALL}", level=ERROR)
             return self
 
 if __name__ == "__main__":
@@ -758,6 +1760,42 @@ if __name__ == "__main__":
 
     parser.add_argument("--bootstrap_ip", type=str, help="IP address of the bootstrap node")
     parser.add_argument("--bootstrap_port", type=int, help="Port number of the bootstrap node")
+    parser.add_argument("--hash_memo_size", type=int, default=100000,
+                        help="Maximum number of stored key hashes the node keeps memoized (default: 100000)")
+    parser.add_argument("--bloom_bits", type=int, default=16384,
+                        help="Size in bits of the bloom filter of stored keys (default: 16384)")
+    parser.add_argument("--bloom_hashes", type=int, default=4,
+                        help="Number of hash functions of the bloom filter (default: 4)")
+    parser.add_argument("--bloom_interval", type=float, default=1.0,
+                        help="Seconds between bloom filter exchanges with the successor (default: 1.0)")
+    parser.add_argument("--negative_cache_size", type=int, default=1024,
+                        help="Maximum number of cached \"Key not found\" answers, 0 disables the cache (default: 1024)")
+    parser.add_argument("--negative_cache_ttl", type=float, default=1.0,
+                        help="Seconds a cached \"Key not found\" answer stays valid (default: 1.0)")
+    parser.add_argument("--vnodes", type=int, default=1,
+                        help="Number of virtual ids this node owns on the ring (default: 1)")
+    parser.add_argument("--metrics_port", type=int,
+                        help="Port serving the node's stats in the Prometheus text format (default: disabled)")
+    parser.add_argument("--trace_sample_rate", type=float, default=0.0,
+                        help="Fraction of client requests entering at this node that are traced (default: 0.0)")
+    parser.add_argument("--trace_buffer", type=int, default=10000,
+                        help="Number of finished spans the node keeps for the traces command (default: 10000)")
+    parser.add_argument("--log_level", type=str, choices=list(LEVELS), default="info",
+                        help="Lowest level of the messages the node writes, 'debug' shows every request hop (default: info)")
+    parser.add_argument("--log_json", action="store_true",
+                        help="Write one JSON object per log message instead of plain text")
+    parser.add_argument("--log_sample", type=str,
+                        help="Share of the messages kept per module, e.g. 'query=0.01,insert=0.1' (default: keep all)")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="Trace allocations from startup so memstats reports the growth since then")
+    parser.add_argument("--listen_port", type=int,
+                        help="Port the node binds when a proxy (netproxy.py) serves --port in front of it (default: --port)")
+    parser.add_argument("--capture", type=str,
+                        help="JSONL file the client commands entering at this node are captured to, for replay.py")
+    parser.add_argument("--capture_dir", type=str, default="captures",
+                        help="Directory of the captures started with 'capture start <name>' (default: captures)")
+    parser.add_argument("--frame_workers", type=int, default=32,
+                        help="Threads answering the framed requests of pooled clients (default: 32)")
 
     args = parser.parse_args()
 
@@ -780,7 +1818,25 @@ if __name__ == "__main__":
                 bootstrap_port=args.bootstrap_port,
                 bootstrap=args.bootstrap,
                 replication_factor=args.replication_factor,
-                consistency=args.consistency)
+                consistency=args.consistency,
+                hash_memo_size=args.hash_memo_size,
+                bloom_bits=args.bloom_bits,
+                bloom_hashes=args.bloom_hashes,
+                bloom_interval=args.bloom_interval,
+                negative_cache_size=args.negative_cache_size,
+                negative_cache_ttl=args.negative_cache_ttl,
+                vnodes=args.vnodes,
+                metrics_port=args.metrics_port,
+                trace_sample_rate=args.trace_sample_rate,
+                trace_buffer=args.trace_buffer,
+                log_level=LEVELS[args.log_level],
+                log_json=args.log_json,
+                log_sample_rates=parse_sample_rates(args.log_sample),
+                trace_allocations=args.tracemalloc,
+                listen_port=args.listen_port,
+                capture_path=args.capture,
+                capture_dir=args.capture_dir,
+                frame_workers=args.frame_workers)
 
     # handle Control-C & gracefully depart
     def handle_exit(signum, frame):
@@ -794,6 +1850,8 @@ if __name__ == "__main__":
                 node.server_socket.close()
             except OSError:
                 pass
+        node.capture.stop()
+        node.logger.flush()
         # force exit to avoid threading shutdown errors
         os._exit(0)
 
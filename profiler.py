@@ -0,0 +1,106 @@
+import base64
+import marshal
+import sys
+import threading
+import time
+
+
+def frame_label(code):
+    return f"{code.co_filename}:{code.co_name}:{code.co_firstlineno}"
+
+
+class SamplingProfiler:
+    # statistical profiler: a background thread snapshots every other thread's stack at a fixed
+    # interval, nothing runs while no profile is in progress
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.running = False
+        self.interval = 0.005
+        self.stacks = {}
+        self.samples = 0
+        self.started_at = None
+        self.stopped_at = None
+
+    def start(self, duration=10.0, interval=0.005):
+        with self.lock:
+            if self.running:
+                return False
+            self.running = True
+            self.interval = interval
+            self.stacks = {}
+            self.samples = 0
+            self.started_at = time.time()
+            self.stopped_at = None
+            self.thread = threading.Thread(target=self.run, args=(duration,), daemon=True)
+            self.thread.start()
+            return True
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def run(self, duration):
+        own_id = threading.get_ident()
+        deadline = time.time() + duration if duration else None
+        while self.running and (deadline is None or time.time() < deadline):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                # root first, as flame graph tools expect
+                stack = tuple(reversed(stack))
+                with self.lock:
+                    self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+            time.sleep(self.interval)
+        self.running = False
+        self.stopped_at = time.time()
+
+    def status(self):
+        return {
+            "state": "running" if self.running else ("finished" if self.started_at else "idle"),
+            "interval": self.interval,
+            "samples": self.samples,
+            "stacks": len(self.stacks),
+            "started_at": self.started_at,
+            "elapsed": round((self.stopped_at or time.time()) - self.started_at, 3) if self.started_at else 0
+        }
+
+    def collapsed(self):
+        # "frame;frame;frame count" lines, the input of flamegraph.pl and speedscope
+        with self.lock:
+            stacks = list(self.stacks.items())
+        lines = [";".join(frame_label(code) for code in stack) + f" {count}" for stack, count in stacks]
+        return "\n".join(sorted(lines))
+
+    def pstats(self):
+        # the marshalled dict pstats.Stats loads: {func: (primitive calls, calls, tottime, cumtime, callers)}
+        with self.lock:
+            stacks = list(self.stacks.items())
+        # sleeping overshoots the interval, so spread the measured wall time over the samples
+        elapsed = (self.stopped_at or time.time()) - self.started_at if self.started_at else 0
+        per_sample = elapsed / self.samples if self.samples else self.interval
+        entries = {}
+        for stack, count in stacks:
+            seconds = count * per_sample
+            funcs = [(code.co_filename, code.co_firstlineno, code.co_name) for code in stack]
+            seen = set()
+            for depth, func in enumerate(funcs):
+                cc, nc, tt, ct, callers = entries.setdefault(func, (0, 0, 0.0, 0.0, {}))
+                if depth == len(funcs) - 1:
+                    tt += seconds
+                # recursive frames count once towards the cumulative time
+                if func not in seen:
+                    ct += seconds
+                    seen.add(func)
+                if depth > 0:
+                    caller = funcs[depth - 1]
+                    c_cc, c_nc, c_tt, c_ct = callers.get(caller, (0, 0, 0.0, 0.0))
+                    callers[caller] = (c_cc + count, c_nc + count, c_tt, c_ct + seconds)
+                entries[func] = (cc + count, nc + count, tt, ct, callers)
+        return base64.b64encode(marshal.dumps(entries)).decode()
@@ -0,0 +1,74 @@
+def token_loads(reports_before, reports_after, window, key_weight=0.5):
+    # load of every token: a blend of its share of the primary keys and of the request rate
+    keys = {}
+    rates = {}
+    owners = {}
+    for endpoint, report in reports_after.items():
+        before = reports_before.get(endpoint, {}).get("tokens", {})
+        for token, stats in report["tokens"].items():
+            owners[token] = endpoint
+            keys[token] = stats["keys"]
+            previous = before.get(token, {}).get("requests", stats["requests"])
+            rates[token] = max(0, stats["requests"] - previous) / window if window > 0 else 0
+
+    total_keys = sum(keys.values())
+    total_rate = sum(rates.values())
+    if total_rate == 0:
+        key_weight = 1.0
+    elif total_keys == 0:
+        key_weight = 0.0
+
+    loads = {}
+    for token in owners:
+        key_share = keys[token] / total_keys if total_keys else 0
+        rate_share = rates[token] / total_rate if total_rate else 0
+        loads[token] = key_weight * key_share + (1 - key_weight) * rate_share
+    return owners, loads, keys, rates
+
+
+def imbalance(node_loads):
+    if not node_loads:
+        return 0
+    mean = sum(node_loads.values()) / len(node_loads)
+    return max(node_loads.values()) / mean if mean else 0
+
+
+def plan_moves(reports_before, reports_after, window, max_moves=4, key_weight=0.5):
+    owners, loads, keys, rates = token_loads(reports_before, reports_after, window, key_weight)
+    node_loads = {endpoint: 0.0 for endpoint in reports_after}
+    for token, endpoint in owners.items():
+        node_loads[endpoint] += loads[token]
+    current = dict(node_loads)
+
+    moves = []
+    for _ in range(max_moves):
+        hot = max(node_loads, key=node_loads.get)
+        cold = min(node_loads, key=node_loads.get)
+        gap = node_loads[hot] - node_loads[cold]
+        hot_tokens = [token for token, endpoint in owners.items() if endpoint == hot]
+        # a node keeps at least one id, and a move must shrink the gap between the pair
+        candidates = [token for token in hot_tokens if 0 < loads[token] < gap] if len(hot_tokens) > 1 else []
+        if not candidates:
+            break
+        token = min(candidates, key=lambda t: abs(gap - 2 * loads[t]))
+        owners[token] = cold
+        node_loads[hot] -= loads[token]
+        node_loads[cold] += loads[token]
+        moves.append({
+            "token": token,
+            "from": hot,
+            "to": cold,
+            "keys": keys[token],
+            "request_rate": round(rates[token], 2),
+            "load": round(loads[token], 4)
+        })
+
+    return {
+        "window": window,
+        "key_weight": key_weight,
+        "loads": {endpoint: round(load, 4) for endpoint, load in current.items()},
+        "projected_loads": {endpoint: round(load, 4) for endpoint, load in node_loads.items()},
+        "imbalance": round(imbalance(current), 4),
+        "projected_imbalance": round(imbalance(node_loads), 4),
+        "moves": moves
+    }
@@ -0,0 +1,144 @@
+import argparse
+import csv
+
+from colorama import Fore, Style, init
+from tabulate import tabulate
+from tqdm import tqdm
+
+from capture import read_capture
+from loadgen import run_load
+from metrics import Histogram
+
+init(autoreset=True)
+
+COMPARED_PERCENTILES = ["p50", "p95", "p99", "max"]
+
+
+def command_label(command):
+    return command.split(" ", 1)[0].lower()
+
+
+def peak_concurrency(records):
+    # most commands the captured node was answering at once, answers finishing at an arrival's instant come first
+    events = sorted([(record["t"], 1) for record in records] +
+                    [(record["t"] + record["ms"] / 1000, -1) for record in records])
+    peak = current = 0
+    for _, change in events:
+        current += change
+        peak = max(peak, current)
+    return peak
+
+
+def captured_summary(records):
+    # latency the entry node measured while capturing, per command and overall, in the shape of LoadResult
+    overall = Histogram()
+    labels = {}
+    for record in records:
+        overall.record(record["ms"] * 1000)
+        labels.setdefault(command_label(record["c"]), Histogram()).record(record["ms"] * 1000)
+    duration = records[-1]["t"] - records[0]["t"] if len(records) > 1 else 0.0
+    errors = sum(record.get("err", 0) for record in records)
+    return {
+        "requests": len(records),
+        "errors": errors,
+        "error_rate": round(errors / len(records), 4) if records else 0.0,
+        "elapsed": round(duration, 3),
+        "throughput": round(len(records) / duration, 2) if duration else 0.0,
+        "latency": overall.summary(),
+        "labels": {label: histogram.summary() for label, histogram in sorted(labels.items())},
+    }
+
+
+def replay(records, speed=1.0, workers=None, host="127.0.0.1", port=5000, progress=None):
+    # at a speed the commands go out on the captured schedule compressed by that factor, open loop, so a slower
+    # ring shows up as queueing; without one every worker sends its next command as soon as it has an answer
+    commands = [record["c"] for record in records]
+    labels = [command_label(command) for command in commands]
+    workers = workers or max(1, peak_concurrency(records))
+    schedule = None
+    if speed:
+        first = records[0]["t"] if records else 0.0
+        schedule = [(record["t"] - first) / speed for record in records]
+    result = run_load(commands, workers=workers, host=host, port=port, progress=progress, schedule=schedule,
+                      open_loop=schedule is not None, labels=labels)
+    summary = result.summary()
+    return {
+        "requests": summary["requests"],
+        "errors": summary["errors"],
+        "error_rate": summary["error_rate"],
+        "elapsed": summary["elapsed"],
+        "throughput": summary["throughput"],
+        "latency": result.latency.summary(),
+        "labels": result.label_summaries(),
+        "workers": workers,
+    }
+
+
+def comparison_rows(captured, replayed):
+    rows = []
+    for label in ["all"] + sorted(set(captured["labels"]) | set(replayed["labels"])):
+        before = captured["latency"] if label == "all" else captured["labels"].get(label)
+        after = replayed["latency"] if label == "all" else replayed["labels"].get(label)
+        if before is None or after is None:
+            continue
+        row = {"command": label, "captured": before["count"], "replayed": after["count"]}
+        for name in COMPARED_PERCENTILES:
+            row[f"captured_{name}_ms"] = before[name]
+            row[f"replayed_{name}_ms"] = after[name]
+        row["p99_ratio"] = round(after["p99"] / before["p99"], 3) if before["p99"] else None
+        rows.append(row)
+    return rows
+
+
+def print_comparison(captured, replayed, rows):
+    print(tabulate([["Requests", captured["requests"], replayed["requests"]],
+                    ["Elapsed (s)", captured["elapsed"], replayed["elapsed"]],
+                    ["Throughput (req/s)", captured["throughput"], replayed["throughput"]],
+                    ["Error Rate", captured["error_rate"], replayed["error_rate"]]],
+                   headers=["", "Captured", "Replayed"], tablefmt="grid"))
+    print(tabulate([[row["command"], row["captured"], row["replayed"]] +
+                    [f"{row[f'captured_{name}_ms']} / {row[f'replayed_{name}_ms']}" for name in COMPARED_PERCENTILES] +
+                    [row["p99_ratio"]] for row in rows],
+                   headers=["Command", "Captured", "Replayed"] +
+                           [f"{name} (ms) captured / replayed" for name in COMPARED_PERCENTILES] + ["p99 Ratio"],
+                   tablefmt="grid"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay the client commands captured by a node (--capture) "
+                                                 "against a ring and compare the latency with the captured run")
+    parser.add_argument("capture", help="Capture file written by a node started with --capture")
+    parser.add_argument("--server-ip", type=str, default="127.0.0.1", help="The IP address of the entry node (default: 127.0.0.1)")
+    parser.add_argument("--server-port", type=int, default=5000, help="The port of the entry node (default: 5000)")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Replay speed, 1 keeps the captured timing, 2 sends twice as fast (default: 1)")
+    parser.add_argument("--max", action="store_true", help="Send as fast as the ring answers, ignoring the timing")
+    parser.add_argument("--workers", type=int,
+                        help="Concurrent connections (default: the most commands in flight during the capture)")
+    parser.add_argument("--limit", type=int, help="Replay only the first N captured commands")
+    parser.add_argument("--output", type=str, help="CSV file the per-command comparison is written to")
+    args = parser.parse_args()
+
+    header, records = read_capture(args.capture)
+    records = records[:args.limit] if args.limit else records
+    if not records:
+        print(f"{Fore.RED}{args.capture} holds no commands.{Style.RESET_ALL}")
+        exit(1)
+    speed = None if args.max else args.speed
+    captured = captured_summary(records)
+    print(f"{Fore.CYAN}Replaying {len(records)} commands captured at {header['capture']} over "
+          f"{captured['elapsed']}s to {args.server_ip}:{args.server_port} "
+          f"{'as fast as possible' if speed is None else f'at {speed}x'}{Style.RESET_ALL}")
+    with tqdm(total=len(records), desc="Replaying", unit="req", leave=False) as pbar:
+        replayed = replay(records, speed, args.workers, args.server_ip, args.server_port,
+                          progress=lambda: pbar.update(1))
+    print(f"{Fore.CYAN}{replayed['workers']} workers; captured latency is measured by the entry node, "
+          f"replayed latency by the client{Style.RESET_ALL}")
+    rows = comparison_rows(captured, replayed)
+    print_comparison(captured, replayed, rows)
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Comparison saved to {args.output}")
@@ -0,0 +1,292 @@
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import socket
+import sqlite3
+import subprocess
+
+DEFAULT_PATH = "experiment_results.db"
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    experiment TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    git_commit TEXT,
+    git_dirty INTEGER,
+    host TEXT,
+    platform TEXT,
+    python TEXT,
+    cpu_count INTEGER,
+    node_count INTEGER,
+    workers INTEGER,
+    rate REAL,
+    workload TEXT,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    replication_factor INTEGER,
+    consistency TEXT,
+    label TEXT,
+    requests INTEGER,
+    elapsed REAL,
+    throughput REAL,
+    mean_ms REAL,
+    stdev_ms REAL,
+    p50_ms REAL,
+    p95_ms REAL,
+    p99_ms REAL,
+    p999_ms REAL,
+    max_ms REAL,
+    error_rate REAL,
+    throughput_samples TEXT
+);
+CREATE INDEX IF NOT EXISTS results_run ON results(run_id);
+"""
+RESULT_FIELDS = ["requests", "elapsed", "throughput", "mean_ms", "stdev_ms", "p50_ms", "p95_ms", "p99_ms", "p999_ms",
+                 "max_ms", "error_rate"]
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True,
+                                timeout=5).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR,
+                                capture_output=True, text=True, timeout=5).stdout.strip()
+        return commit or None, bool(status)
+    except (OSError, subprocess.SubprocessError):
+        return None, None
+
+
+def host_info():
+    return {
+        "host": socket.gethostname(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count()
+    }
+
+
+def t_sf(t, df):
+    # two-sided p-value of Student's t through the regularized incomplete beta function
+    x = df / (df + t * t)
+    return incomplete_beta(df / 2, 0.5, x)
+
+
+def incomplete_beta(a, b, x):
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log(1 - x))
+    if x < (a + 1) / (a + b + 2):
+        return front * beta_fraction(a, b, x) / a
+    return 1 - front * beta_fraction(b, a, 1 - x) / b
+
+
+def beta_fraction(a, b, x, iterations=200, epsilon=1e-12):
+    # Lentz's continued fraction, as in Numerical Recipes' betacf
+    tiny = 1e-300
+    c, d = 1.0, 1 - (a + b) * x / (a + 1)
+    d = 1 / (d if abs(d) > tiny else tiny)
+    result = d
+    for m in range(1, iterations + 1):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                          -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1 + numerator * d
+            d = 1 / (d if abs(d) > tiny else tiny)
+            c = 1 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            result *= d * c
+        if abs(d * c - 1) < epsilon:
+            break
+    return result
+
+
+def welch_t_test(mean_a, stdev_a, n_a, mean_b, stdev_b, n_b):
+    # p-value of the difference of two means with unequal variances, None without enough samples
+    if n_a < 2 or n_b < 2:
+        return None
+    var_a, var_b = stdev_a ** 2 / n_a, stdev_b ** 2 / n_b
+    if var_a + var_b == 0:
+        return 0.0 if mean_a != mean_b else 1.0
+    t = (mean_b - mean_a) / math.sqrt(var_a + var_b)
+    df = (var_a + var_b) ** 2 / (var_a ** 2 / (n_a - 1) + var_b ** 2 / (n_b - 1))
+    return t_sf(t, df)
+
+
+def sample_stats(samples):
+    n = len(samples)
+    if not n:
+        return 0.0, 0.0, 0
+    mean = sum(samples) / n
+    stdev = math.sqrt(sum((x - mean) ** 2 for x in samples) / (n - 1)) if n > 1 else 0.0
+    return mean, stdev, n
+
+
+class ResultsStore:
+    # every experiment run with its metadata, in a local SQLite file
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def record_run(self, experiment, rows, node_count=None, workers=None, rate=None, workload=None, extra=None):
+        # rows: [{"replication_factor", "consistency", "label", "summary": LoadResult.summary()}]
+        commit, dirty = git_commit()
+        host = host_info()
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT INTO runs (experiment, started_at, git_commit, git_dirty, host, platform, python, cpu_count, "
+                "node_count, workers, rate, workload, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (experiment, datetime.datetime.now().isoformat(timespec="seconds"), commit,
+                 None if dirty is None else int(dirty), host["host"], host["platform"], host["python"],
+                 host["cpu_count"], node_count, workers, rate, workload, json.dumps(extra or {})))
+            run_id = cursor.lastrowid
+            for row in rows:
+                summary = row["summary"]
+                self.db.execute(
+                    f"INSERT INTO results (run_id, replication_factor, consistency, label, {', '.join(RESULT_FIELDS)}, "
+                    f"throughput_samples) VALUES ({', '.join('?' * (len(RESULT_FIELDS) + 5))})",
+                    [run_id, int(row["replication_factor"]), row["consistency"], str(row.get("label", "all"))]
+                    + [summary.get(field) for field in RESULT_FIELDS]
+                    + [json.dumps(summary.get("throughput_samples", []))])
+        return run_id
+
+    def runs(self, experiment=None, limit=None):
+        query = "SELECT * FROM runs"
+        params = []
+        if experiment:
+            query += " WHERE experiment = ?"
+            params.append(experiment)
+        query += " ORDER BY id DESC"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        return [dict(row) for row in self.db.execute(query, params)]
+
+    def run(self, run_id):
+        row = self.db.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        return dict(row) if row else None
+
+    def results(self, run_id):
+        rows = []
+        for row in self.db.execute("SELECT * FROM results WHERE run_id = ? ORDER BY rowid", (run_id,)):
+            row = dict(row)
+            row["throughput_samples"] = json.loads(row["throughput_samples"] or "[]")
+            rows.append(row)
+        return rows
+
+    def trend(self, experiment, metric="throughput"):
+        # one point per run and setting, oldest run first
+        if metric not in RESULT_FIELDS:
+            raise ValueError(f"Unknown metric {metric}, expected one of {', '.join(RESULT_FIELDS)}")
+        query = (f"SELECT runs.id AS run_id, runs.started_at, runs.git_commit, results.replication_factor, "
+                 f"results.consistency, results.label, results.{metric} AS value FROM results "
+                 f"JOIN runs ON runs.id = results.run_id WHERE runs.experiment = ? ORDER BY runs.id")
+        return [dict(row) for row in self.db.execute(query, (experiment,))]
+
+    def latest_pair(self, experiment=None):
+        runs = self.runs(experiment, limit=2)
+        if len(runs) < 2:
+            return None
+        return runs[1]["id"], runs[0]["id"]
+
+
+def compare_runs(store, baseline_id, candidate_id, alpha=0.05, min_change=0.05):
+    # per setting: throughput (windowed samples) and mean latency (count, mean, stdev) under Welch's t-test;
+    # a regression is a significant change in the worse direction larger than min_change
+    baseline = {(r["replication_factor"], r["consistency"], r["label"]): r for r in store.results(baseline_id)}
+    comparison = []
+    for row in store.results(candidate_id):
+        key = (row["replication_factor"], row["consistency"], row["label"])
+        before = baseline.get(key)
+        if before is None:
+            continue
+        throughput_p = welch_t_test(*sample_stats(before["throughput_samples"]),
+                                    *sample_stats(row["throughput_samples"]))
+        latency_p = welch_t_test(before["mean_ms"] or 0, before["stdev_ms"] or 0, before["requests"] or 0,
+                                 row["mean_ms"] or 0, row["stdev_ms"] or 0, row["requests"] or 0)
+        for metric, p_value, higher_is_better in (("throughput", throughput_p, True),
+                                                  ("mean_ms", latency_p, False),
+                                                  ("p99_ms", None, False)):
+            old, new = before[metric], row[metric]
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            worse = change < -min_change if higher_is_better else change > min_change
+            comparison.append({
+                "replication_factor": key[0],
+                "consistency": key[1],
+                "label": key[2],
+                "metric": metric,
+                "baseline": old,
+                "candidate": new,
+                "change": round(change, 4),
+                "p_value": None if p_value is None else round(p_value, 6),
+                # percentiles have no sampling distribution here, they are reported but never flagged
+                "regression": bool(worse and p_value is not None and p_value < alpha)
+            })
+    return comparison
+
+
+if __name__ == "__main__":
+    from tabulate import tabulate
+
+    parser = argparse.ArgumentParser(description="Browse the stored experiment runs and compare two of them")
+    parser.add_argument("--db", type=str, default=DEFAULT_PATH, help=f"Results database (default: {DEFAULT_PATH})")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    list_parser = subparsers.add_parser("list", help="List the stored runs, newest first")
+    list_parser.add_argument("--experiment", type=str, help="Only runs of this experiment")
+    list_parser.add_argument("--limit", type=int, default=20, help="Number of runs shown (default: 20)")
+    show_parser = subparsers.add_parser("show", help="Show the results of one run")
+    show_parser.add_argument("run_id", type=int)
+    compare_parser = subparsers.add_parser("compare", help="Compare a run against a baseline run")
+    compare_parser.add_argument("baseline", type=int, nargs="?", help="Baseline run id (default: second newest run)")
+    compare_parser.add_argument("candidate", type=int, nargs="?", help="Candidate run id (default: newest run)")
+    compare_parser.add_argument("--experiment", type=str, help="Experiment of the default runs")
+    compare_parser.add_argument("--alpha", type=float, default=0.05, help="Significance level (default: 0.05)")
+    compare_parser.add_argument("--min-change", type=float, default=0.05,
+                                help="Smallest relative change flagged as a regression (default: 0.05)")
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db)
+    if args.action == "list":
+        runs = store.runs(args.experiment, args.limit)
+        print(tabulate([[run["id"], run["experiment"], run["started_at"], (run["git_commit"] or "")[:10]
+                         + ("+" if run["git_dirty"] else ""), run["node_count"], run["workers"], run["rate"] or "",
+                         run["workload"] or "", run["host"]] for run in runs],
+                       headers=["Run", "Experiment", "Started", "Commit", "Nodes", "Workers", "Rate", "Workload",
+                                "Host"], tablefmt="grid"))
+    elif args.action == "show":
+        rows = store.results(args.run_id)
+        print(tabulate([[row["replication_factor"], row["consistency"], row["label"]]
+                        + [row[field] for field in RESULT_FIELDS] for row in rows],
+                       headers=["RF", "Consistency", "Label"] + RESULT_FIELDS, tablefmt="grid"))
+    else:
+        baseline, candidate = args.baseline, args.candidate
+        if baseline is None or candidate is None:
+            pair = store.latest_pair(args.experiment)
+            if pair is None:
+                print("Need at least two stored runs to compare.")
+                exit(1)
+            baseline, candidate = pair
+        comparison = compare_runs(store, baseline, candidate, args.alpha, args.min_change)
+        print(f"Run {candidate} against baseline run {baseline}:")
+        print(tabulate([[c["replication_factor"], c["consistency"], c["label"], c["metric"], c["baseline"],
+                         c["candidate"], f"{c['change']:+.1%}", "" if c["p_value"] is None else c["p_value"],
+                         "REGRESSION" if c["regression"] else ""] for c in comparison],
+                       headers=["RF", "Consistency", "Label", "Metric", "Baseline", "Candidate", "Change", "p-value",
+                                ""], tablefmt="grid"))
+        regressions = [c for c in comparison if c["regression"]]
+        if regressions:
+            print(f"\n{len(regressions)} significant regression(s).")
+            exit(1)
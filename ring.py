@@ -0,0 +1,155 @@
+import bisect
+import functools
+import itertools
+import statistics
+
+from utils import hash_key
+
+RING_SIZE = 2 ** 64
+
+
+def vnode_ids(ip, port, count=1):
+    # the first virtual id is the plain node id, so a single vnode keeps the old placement
+    base = f"{ip}:{port}"
+    return [hash_key(base)] + [hash_key(f"{base}#{i}") for i in range(1, count)]
+
+
+@functools.lru_cache(maxsize=65536)
+def endpoint_id(endpoint):
+    # every refresh checks each token against its owner's plain id, memoized for rings of thousands of nodes
+    return hash_key(endpoint)
+
+
+def host_of(endpoint):
+    return endpoint.rsplit(":", 1)[0]
+
+
+def split_endpoint(endpoint):
+    ip, port = endpoint.rsplit(":", 1)
+    return ip, int(port)
+
+
+class TokenRing:
+    def __init__(self):
+        self.tokens = []
+        # token -> "ip:port" of the physical node that owns it
+        self.owners = {}
+        self.virtual = False
+
+    def copy(self):
+        ring = TokenRing()
+        ring.tokens = list(self.tokens)
+        ring.owners = dict(self.owners)
+        ring.virtual = self.virtual
+        return ring
+
+    def refresh(self):
+        self.tokens = sorted(self.owners)
+        # any node owning more than its plain node id switches placement to the token ring
+        self.virtual = any(token != endpoint_id(endpoint) for token, endpoint in self.owners.items())
+
+    def add(self, endpoint, tokens):
+        for token in tokens:
+            self.owners[int(token)] = endpoint
+        self.refresh()
+
+    def remove(self, endpoint):
+        self.owners = {token: owner for token, owner in self.owners.items() if owner != endpoint}
+        self.refresh()
+
+    def assign(self, token, endpoint):
+        self.owners[int(token)] = endpoint
+        self.refresh()
+
+    def endpoints(self):
+        return sorted(set(self.owners.values()))
+
+    def tokens_of(self, endpoint):
+        return [token for token in self.tokens if self.owners[token] == endpoint]
+
+    def owner(self, key_hash):
+        token = self.token_for(key_hash)
+        return self.owners[token] if token is not None else None
+
+    def token_for(self, key_hash):
+        if not self.tokens:
+            return None
+        idx = bisect.bisect_left(self.tokens, key_hash)
+        return self.tokens[idx % len(self.tokens)]
+
+    def preference_list(self, key_hash, count):
+        if not self.tokens:
+            return []
+        start = bisect.bisect_left(self.tokens, key_hash)
+        size = len(self.tokens)
+
+        def walk():
+            # clockwise from the key, lazily: the list is usually full after a few tokens
+            for i in range(size):
+                yield self.owners[self.tokens[(start + i) % size]]
+
+        if not self.virtual:
+            # plain chord placement: the owner followed by its successors
+            return list(itertools.islice(walk(), count))
+
+        # skip vnodes of nodes already on the list, and prefer nodes on other hosts
+        replicas = []
+        hosts = set()
+        for endpoint in walk():
+            if len(replicas) == count:
+                return replicas
+            if endpoint not in replicas and host_of(endpoint) not in hosts:
+                replicas.append(endpoint)
+                hosts.add(host_of(endpoint))
+        for endpoint in walk():
+            if len(replicas) == count:
+                break
+            if endpoint not in replicas:
+                replicas.append(endpoint)
+        return replicas
+
+    def next_replica(self, key_hash, endpoint, count):
+        replicas = self.preference_list(key_hash, count)
+        if endpoint in replicas and replicas.index(endpoint) + 1 < len(replicas):
+            return replicas[replicas.index(endpoint) + 1]
+        return None
+
+    def ownership(self):
+        # fraction of the hash space each node is the primary for
+        shares = {endpoint: 0 for endpoint in self.owners.values()}
+        for i, token in enumerate(self.tokens):
+            previous = self.tokens[i - 1]
+            shares[self.owners[token]] += ((token - previous) % RING_SIZE or RING_SIZE) / RING_SIZE
+        return shares
+
+    def single_token_ring(self):
+        ring = TokenRing()
+        for endpoint in self.endpoints():
+            ring.owners[hash_key(endpoint)] = endpoint
+        ring.refresh()
+        return ring
+
+    def to_json(self):
+        return [[token, self.owners[token]] for token in self.tokens]
+
+    @classmethod
+    def from_json(cls, tokens):
+        ring = cls()
+        for token, endpoint in tokens:
+            ring.owners[int(token)] = endpoint
+        ring.refresh()
+        return ring
+
+
+def load_stats(values):
+    values = list(values)
+    if not values:
+        return {"mean": 0, "variance": 0, "stddev": 0, "max_over_mean": 0}
+    mean = statistics.fmean(values)
+    variance = statistics.pvariance(values)
+    return {
+        "mean": round(mean, 4),
+        "variance": round(variance, 4),
+        "stddev": round(variance ** 0.5, 4),
+        "max_over_mean": round(max(values) / mean, 4) if mean else 0
+    }
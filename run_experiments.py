@@ -1,10 +1,20 @@
-import socket
+import argparse
 import json
 import time
 import pandas as pd
 from tqdm import tqdm
 from tabulate import tabulate
 import os
+import sys
+
+from client import shared_client
+from loadgen import run_load, sweep_offered_load, saturation_point, THROUGHPUT_WINDOW
+from workloads import Workload, WORKLOADS, read_insert_commands, read_query_commands
+from cluster import Cluster
+from results_store import ResultsStore
+from netproxy import add_link_arguments, link_settings
+from staleness import run_staleness
+from churn import run_scalability
 
 def save_results_to_csv(df, filename):
     df.to_csv(filename, index=False)
@@ -12,88 +22,38 @@ def save_results_to_csv(df, filename):
 
 def send_command(command, host='127.0.0.1', port=5000):
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
-            client.connect((host, port))
-            client.sendall(command.encode())
-            response = []
-            while True:
-                chunk = client.recv(4096).decode()
-                if not chunk:
-                    break
-                response.append(chunk)
-            return "".join(response)
+        return shared_client(host, port).send(command)
     except Exception as e:
         return f"Error: {e}"
 
 
-def process_insert_directory(directory):
-    if not os.path.exists(directory) or not os.path.isdir(directory):
-        return False, 0, None, 0
-
-    config_response = send_command("get_network_config").strip()
-    if ":" in config_response:
-        replication_factor, consistency = config_response.split(":")
-        network_config = f"Replication Factor: {replication_factor}, Consistency: {consistency}"
-    else:
-        network_config = "Failed to fetch network configuration"
-
-    insert_files = sorted(f for f in os.listdir(directory) if f.startswith("insert_") and f.endswith(".txt"))
-    if not insert_files:
-        return False, 0, network_config, 0
-
-    start_time = time.time()
-    key_counter = 0
-
-    for filename in insert_files:
-        filepath = os.path.join(directory, filename)
-        try:
-            with open(filepath, 'r', encoding='utf-8') as file:
-                value = filename.split('_')[1]
-                keys = [line.strip() for line in file if line.strip()]
-
-                for key in keys:
-                    key_counter += 1
-                    command = f"insert \"{key}\" {value}"
-                    response = send_command(command)
-        except Exception:
-            return False, 0, network_config, 0
-
-    elapsed_time = time.time() - start_time
-    return True, elapsed_time, network_config, key_counter
-
-def process_query_directory(directory):
-    if not os.path.exists(directory) or not os.path.isdir(directory):
-        return False, 0, None, 0
-
-    config_response = send_command("get_network_config").strip()
-    if ":" in config_response:
-        replication_factor, consistency = config_response.split(":")
-        network_config = f"Replication Factor: {replication_factor}, Consistency: {consistency}"
-    else:
-        network_config = "Failed to fetch network configuration"
-
-    query_files = sorted(f for f in os.listdir(directory) if f.startswith("query_") and f.endswith(".txt"))
-    if not query_files:
-        return False, 0, network_config, 0
+def run_load_setting(commands, workers, rate, desc):
+    with tqdm(total=len(commands), desc=desc, unit="req", leave=False) as pbar:
+        result = run_load(commands, workers=workers, rate=rate, progress=lambda: pbar.update(1))
+    return result.summary()
 
-    start_time = time.time()
-    key_counter = 0
+def load_row(repl_factor, consistency, summary):
+    return [repl_factor, consistency, summary["elapsed"], summary["throughput"], summary["p50_ms"],
+            summary["p95_ms"], summary["p99_ms"], summary["p999_ms"], summary["max_ms"], summary["error_rate"]]
 
-    for filename in query_files:
-        filepath = os.path.join(directory, filename)
-        try:
-            with open(filepath, 'r', encoding='utf-8') as file:
-                keys = [line.strip() for line in file if line.strip()]
+LATENCY_COLUMNS = ["p50 (ms)", "p95 (ms)", "p99 (ms)", "p999 (ms)", "Max (ms)", "Error Rate"]
 
-                for key in keys:
-                    key_counter += 1
-                    command = f"query \"{key}\""
-                    response = send_command(command)
-        except Exception:
-            return False, 0, network_config, 0
+def ring_size():
+    try:
+        return len(json.loads(send_command("overlay")))
+    except (json.JSONDecodeError, TypeError):
+        return None
 
-    elapsed_time = time.time() - start_time
-    return True, elapsed_time, network_config, key_counter
+def store_run(experiment, rows, workers=None, rate=None, workload=None, extra=None, node_count=None):
+    # keep every run with its commit, ring size and host, for results_store.py compare
+    try:
+        store = ResultsStore()
+        run_id = store.record_run(experiment, rows, node_count=node_count or ring_size(), workers=workers, rate=rate,
+                                  workload=workload, extra=extra)
+        store.close()
+        print(f"Stored as run {run_id} in {store.path}")
+    except Exception as e:
+        print(f"Could not store the results: {e}")
 
 def process_request_directory(request_directory):
     if not os.path.exists(request_directory) or not os.path.isdir(request_directory):
@@ -145,7 +105,7 @@ def run_freshness_experiment(request_directory):
             success, responses, network_config = process_request_directory(request_directory)
             if not success:
                 print(f"Failed to process requests from {request_directory}")
-                os._exit(1)
+                sys.exit(1)
 
             if consistency == "chain":
                 for key, value in responses:
@@ -165,6 +125,70 @@ def run_freshness_experiment(request_directory):
 
     input("\nSaved results to freshness_chain.csv and freshness_eventual.csv\nPress Enter to return to the menu...")
 
+def staleness_row(repl_factor, consistency, report):
+    visibility, read_lag = report["visibility_ms"], report["read_lag"]
+    return [repl_factor, consistency, report["writes"], visibility["p50"], visibility["p95"], visibility["p99"],
+            visibility["max"], report["probe_gap_ms"]["p50"], report["never_visible"],
+            read_lag.get("p_within", {}).get(0), read_lag.get("p_within", {}).get(1), read_lag.get("mean_lag"),
+            read_lag.get("max_lag"), report["replica_lag"].get("p_within", {}).get(0)]
+
+STALENESS_COLUMNS = ["Replication Factor", "Consistency", "Writes", "Visibility p50 (ms)", "Visibility p95 (ms)",
+                     "Visibility p99 (ms)", "Visibility Max (ms)", "Probe Gap p50 (ms)", "Never Visible",
+                     "P(Fresh Read)", "P(<=1 Behind)", "Mean Lag", "Max Lag", "P(Fresh Replica)"]
+
+def run_staleness_experiment(keys=8, writes_per_key=40, write_interval=0.02, readers=4, background_ops=0):
+    # versioned writes and concurrent replica polling instead of replaying the request files one by one
+    try:
+        settings = [
+            ("1", "chain"), ("3", "chain"), ("5", "chain"),
+            ("1", "eventual"), ("3", "eventual"), ("5", "eventual")
+        ]
+        results = []
+        freshness = []
+        background = [commands for _, commands in Workload("A", 500, background_ops, 20, seed=7).operations()] \
+            if background_ops else None
+
+        with tqdm(total=len(settings), desc="Running Staleness Benchmark", unit="config") as pbar:
+            for repl_factor, consistency in settings:
+                reset_status = reset_config(repl_factor, consistency)
+                tqdm.write(f"\nSetting Replication Factor={repl_factor}, Consistency={consistency}: {reset_status}")
+                if background:
+                    run_load_setting(Workload("A", 500, 0, 20, seed=7).load_commands(), 8, None, "Loading")
+
+                report = run_staleness(keys, writes_per_key, write_interval, readers, background=background)
+                results.append(staleness_row(repl_factor, consistency, report))
+                freshness.append([repl_factor, consistency] + list(report["p_fresh_by_age_ms"].values()))
+
+                pbar.update(1)
+                tqdm.write("Let the Conchord rest for 1 second.")
+                time.sleep(1)
+
+        df = pd.DataFrame(results, columns=STALENESS_COLUMNS)
+        print(f"\nStaleness ({keys} keys x {writes_per_key} versions, {readers} readers, "
+              f"{background_ops or 'no'} background operations):")
+        print(tabulate(df, headers='keys', tablefmt='grid', showindex=False))
+        save_results_to_csv(df, "staleness_experiment.csv")
+
+        df_freshness = pd.DataFrame(freshness, columns=["Replication Factor", "Consistency"]
+                                    + [f"P(Fresh) {age} ms" for age in report["p_fresh_by_age_ms"]])
+        print("\nProbability of reading the newest acknowledged version, by time since its acknowledgement:")
+        print(tabulate(df_freshness, headers='keys', tablefmt='grid', showindex=False))
+        save_results_to_csv(df_freshness, "staleness_by_age.csv")
+        input("\nPress Enter to return to the menu...")
+    except Exception as e:
+        print(f"Error on staleness benchmark: {e}")
+        sys.exit(1)
+
+def ask_staleness_settings():
+    keys = input("Keys written concurrently [8]: ").strip()
+    writes_per_key = input("Versions written per key [40]: ").strip()
+    write_interval = input("Pause between the versions of a key in ms [20]: ").strip()
+    readers = input("Concurrent readers [4]: ").strip()
+    background_ops = input("Background YCSB-A operations during the run [0]: ").strip()
+    return (int(keys) if keys else 8, int(writes_per_key) if writes_per_key else 40,
+            float(write_interval) / 1000 if write_interval else 0.02, int(readers) if readers else 4,
+            int(background_ops) if background_ops else 0)
+
 def reset_config(replication_factor, consistency_type):
     if not replication_factor.isdigit():
         return "Error: Replication factor must be a number."
@@ -180,82 +204,302 @@ def reset_config(replication_factor, consistency_type):
 
     return f"Error: {response}"
 
-def run_insert_experiment(directory):
+def run_insert_experiment(directory, workers=8, rate=None):
     try:
+        if not os.path.isdir(directory):
+            print(f"Directory '{directory}' does not exist.")
+            return
+        commands = read_insert_commands(directory)
         settings = [
             ("1", "chain"), ("3", "chain"), ("5", "chain"),
             ("1", "eventual"), ("3", "eventual"), ("5", "eventual")
         ]
         results = []
+        stored = []
 
         with tqdm(total=len(settings), desc="Running Experiment", unit="config") as pbar:
             for repl_factor, consistency in settings:
                 reset_status = reset_config(repl_factor, consistency)
                 tqdm.write(f"\nSetting Replication Factor={repl_factor}, Consistency={consistency}: {reset_status}")
 
-                success, elapsed_time, network_config, key_counter = process_insert_directory(directory)
-
-                if success:
-                    results.append([repl_factor, consistency, key_counter, f"{elapsed_time:.2f} sec"])
-                else:
-                    results.append([repl_factor, consistency, key_counter, "Failed"])
+                summary = run_load_setting(commands, workers, rate, "Inserting")
+                results.append(load_row(repl_factor, consistency, summary))
+                stored.append({"replication_factor": repl_factor, "consistency": consistency, "label": "insert",
+                               "summary": summary})
 
                 pbar.update(1)
                 tqdm.write("Let the Conchord rest for 1 second.")
                 time.sleep(1)
 
-        df = pd.DataFrame(results, columns=["Replication Factor", "Consistency", "Keys Inserted", "Time Taken (s)"])
-        df["Time Taken (s)"] = df["Time Taken (s)"].str.replace(" sec", "", regex=False).astype(float)
-        df["Throughput (Keys/sec)"] = df["Keys Inserted"] / df["Time Taken (s)"]
-        df = df.drop(columns=["Keys Inserted"])
-        print("\nExperiment Results:")
+        df = pd.DataFrame(results, columns=["Replication Factor", "Consistency", "Time Taken (s)", "Throughput (Keys/sec)"]
+                          + LATENCY_COLUMNS)
+        print(f"\nExperiment Results ({workers} workers, target rate: {rate or 'unlimited'}):")
         print(tabulate(df, headers='keys', tablefmt='grid', showindex=False))
         save_results_to_csv(df, "write_throughput_experiment.csv")
+        store_run("write_throughput", stored, workers, rate, workload=directory)
         input("\nPress Enter to return to the menu...")
     except Exception as e:
         print(f"Error on batch insert: {e}")
-        os._exit(1)
+        sys.exit(1)
 
-def run_query_experiment(insert_directory, queries_directory):
+def run_query_experiment(insert_directory, queries_directory, workers=8, rate=None):
     try:
+        if not os.path.isdir(insert_directory) or not os.path.isdir(queries_directory):
+            print(f"Directory '{insert_directory}' or '{queries_directory}' does not exist.")
+            return
+        insert_commands = read_insert_commands(insert_directory)
+        query_commands = read_query_commands(queries_directory)
         settings = [
             ("1", "chain"), ("3", "chain"), ("5", "chain"),
             ("1", "eventual"), ("3", "eventual"), ("5", "eventual")
         ]
         results = []
+        stored = []
 
         with tqdm(total=len(settings), desc="Running Query Experiment", unit="config") as pbar:
             for repl_factor, consistency in settings:
                 reset_status = reset_config(repl_factor, consistency)
                 tqdm.write(f"\nSetting Replication Factor={repl_factor}, Consistency={consistency}: {reset_status}")
 
-                success, elapsed_time, network_config, key_counter = process_insert_directory(insert_directory)
-                if not success:
+                fill = run_load_setting(insert_commands, workers, None, "Filling")
+                if fill["errors"] == fill["requests"]:
                     print(f"Failed to fill node with data")
-                    os._exit(1)
-
-                success, elapsed_time, network_config, key_counter = process_query_directory(queries_directory)
+                    sys.exit(1)
 
-                if success:
-                    results.append([repl_factor, consistency, key_counter, f"{elapsed_time:.2f} sec"])
-                else:
-                    results.append([repl_factor, consistency, key_counter, "Failed"])
+                summary = run_load_setting(query_commands, workers, rate, "Querying")
+                results.append(load_row(repl_factor, consistency, summary))
+                stored.append({"replication_factor": repl_factor, "consistency": consistency, "label": "query",
+                               "summary": summary})
 
                 pbar.update(1)
                 tqdm.write("Let the Conchord rest for 1 second.")
                 time.sleep(1)
 
-        df = pd.DataFrame(results, columns=["Replication Factor", "Consistency", "Keys Queried", "Time Taken (s)"])
-        df["Time Taken (s)"] = df["Time Taken (s)"].str.replace(" sec", "", regex=False).astype(float)
-        df["Read Throughput (Queries/sec)"] = df["Keys Queried"] / df["Time Taken (s)"]
-        df = df.drop(columns=["Keys Queried"])
-        print("\nQuery Experiment Results:")
+        df = pd.DataFrame(results, columns=["Replication Factor", "Consistency", "Time Taken (s)", "Read Throughput (Queries/sec)"]
+                          + LATENCY_COLUMNS)
+        print(f"\nQuery Experiment Results ({workers} workers, target rate: {rate or 'unlimited'}):")
         print(tabulate(df, headers='keys', tablefmt='grid', showindex=False))
         save_results_to_csv(df, "read_throughput_experiment.csv")
+        store_run("read_throughput", stored, workers, rate, workload=queries_directory)
         input("\nPress Enter to return to the menu...")
     except Exception as e:
         print(f"Error on batch query: {e}")
-        os._exit(1)
+        sys.exit(1)
+
+def ask_load_settings():
+    workers = input("Number of concurrent workers [8]: ").strip()
+    rate = input("Target request rate in req/s (blank for unlimited): ").strip()
+    return int(workers) if workers else 8, float(rate) if rate else None
+
+def run_open_loop_experiment(insert_directory, queries_directory, operation, rates, step_duration=5.0,
+                             arrival="poisson", slo_ms=None):
+    try:
+        if not os.path.isdir(insert_directory) or (operation == "query" and not os.path.isdir(queries_directory)):
+            print(f"Directory '{insert_directory}' or '{queries_directory}' does not exist.")
+            return
+        insert_commands = read_insert_commands(insert_directory)
+        commands = insert_commands if operation == "insert" else read_query_commands(queries_directory)
+        settings = [
+            ("1", "chain"), ("3", "chain"), ("5", "chain"),
+            ("1", "eventual"), ("3", "eventual"), ("5", "eventual")
+        ]
+        curves = []
+        saturation = []
+        stored = []
+
+        with tqdm(total=len(settings), desc="Running Open-Loop Sweep", unit="config") as pbar:
+            for repl_factor, consistency in settings:
+                reset_status = reset_config(repl_factor, consistency)
+                tqdm.write(f"\nSetting Replication Factor={repl_factor}, Consistency={consistency}: {reset_status}")
+                if operation == "query":
+                    run_load_setting(insert_commands, 8, None, "Filling")
+
+                def on_step(row):
+                    tqdm.write(f"  offered {row['offered']} req/s -> {row['throughput']} req/s, "
+                               f"p99 {row['p99_ms']} ms{' (saturated)' if row['saturated'] else ''}")
+
+                rows = sweep_offered_load(commands, rates, step_duration, arrival, slo_ms=slo_ms, on_step=on_step)
+                for row in rows:
+                    curves.append([repl_factor, consistency, row["offered"], row["throughput"], row["p50_ms"],
+                                   row["p95_ms"], row["p99_ms"], row["p999_ms"], row["max_ms"], row["error_rate"],
+                                   row["saturated"]])
+                    stored.append({"replication_factor": repl_factor, "consistency": consistency,
+                                   "label": f"{row['offered']:g} req/s", "summary": row})
+                saturation.append([repl_factor, consistency, saturation_point(rows),
+                                   max(row["throughput"] for row in rows)])
+
+                pbar.update(1)
+                tqdm.write("Let the Conchord rest for 1 second.")
+                time.sleep(1)
+
+        df = pd.DataFrame(curves, columns=["Replication Factor", "Consistency", "Offered Load (req/s)", "Throughput (req/s)"]
+                          + LATENCY_COLUMNS + ["Saturated"])
+        print(f"\nOpen-Loop {operation.capitalize()} Sweep ({arrival} arrivals, {step_duration}s per step):")
+        print(tabulate(df, headers='keys', tablefmt='grid', showindex=False))
+        save_results_to_csv(df, f"open_loop_{operation}_sweep.csv")
+
+        df_saturation = pd.DataFrame(saturation, columns=["Replication Factor", "Consistency",
+                                                          "Saturation Point (req/s)", "Peak Throughput (req/s)"])
+        print("\nSaturation Points:")
+        print(tabulate(df_saturation, headers='keys', tablefmt='grid', showindex=False))
+        save_results_to_csv(df_saturation, f"open_loop_{operation}_saturation.csv")
+        store_run(f"open_loop_{operation}", stored, workload=operation,
+                  extra={"arrival": arrival, "step_duration": step_duration, "slo_ms": slo_ms})
+        input("\nPress Enter to return to the menu...")
+    except Exception as e:
+        print(f"Error on open-loop sweep: {e}")
+        sys.exit(1)
+
+def run_ycsb_experiment(workload_names, record_count=1000, operation_count=1000, value_size=100, distribution=None,
+                        workers=8):
+    try:
+        settings = [
+            ("1", "chain"), ("3", "chain"), ("5", "chain"),
+            ("1", "eventual"), ("3", "eventual"), ("5", "eventual")
+        ]
+        results = []
+        stored = []
+
+        with tqdm(total=len(settings) * len(workload_names), desc="Running YCSB Workloads", unit="run") as pbar:
+            for repl_factor, consistency in settings:
+                for name in workload_names:
+                    # the same seed gives every setting the same keys and operation sequence
+                    workload = Workload(name, record_count, operation_count, value_size, distribution, seed=42)
+                    reset_status = reset_config(repl_factor, consistency)
+                    tqdm.write(f"\nSetting Replication Factor={repl_factor}, Consistency={consistency}, "
+                               f"Workload {workload.name} ({workload.distribution}): {reset_status}")
+
+                    fill = run_load_setting(workload.load_commands(), workers, None, "Loading")
+                    if fill["errors"] == fill["requests"]:
+                        print(f"Failed to load the records")
+                        sys.exit(1)
+
+                    operations = workload.operations()
+                    with tqdm(total=len(operations), desc=f"Workload {workload.name}", unit="op", leave=False) as bar:
+                        result = run_load([commands for _, commands in operations], workers=workers,
+                                          labels=[operation for operation, _ in operations],
+                                          progress=lambda: bar.update(1))
+                    summary = result.summary()
+                    stored.append({"replication_factor": repl_factor, "consistency": consistency,
+                                   "label": f"{workload.name}/all", "summary": summary})
+                    results.append([repl_factor, consistency, workload.name, workload.distribution, "all",
+                                    summary["requests"], summary["throughput"], summary["p50_ms"], summary["p95_ms"],
+                                    summary["p99_ms"], summary["p999_ms"], summary["max_ms"], summary["error_rate"]])
+                    for operation, latency in result.label_summaries().items():
+                        stored.append({"replication_factor": repl_factor, "consistency": consistency,
+                                       "label": f"{workload.name}/{operation}", "summary": {
+                                           "requests": latency["count"], "mean_ms": latency["mean"],
+                                           "stdev_ms": latency["stdev"], "p50_ms": latency["p50"],
+                                           "p95_ms": latency["p95"], "p99_ms": latency["p99"],
+                                           "p999_ms": latency["p999"], "max_ms": latency["max"]}})
+                        results.append([repl_factor, consistency, workload.name, workload.distribution, operation,
+                                        latency["count"], "", latency["p50"], latency["p95"], latency["p99"],
+                                        latency["p999"], latency["max"], ""])
+
+                    pbar.update(1)
+                    time.sleep(1)
+
+        df = pd.DataFrame(results, columns=["Replication Factor", "Consistency", "Workload", "Distribution",
+                                            "Operation", "Operations", "Throughput (ops/sec)"] + LATENCY_COLUMNS)
+        print(f"\nYCSB Results ({record_count} records, {operation_count} operations, {workers} workers):")
+        print(tabulate(df, headers='keys', tablefmt='grid', showindex=False))
+        save_results_to_csv(df, "ycsb_experiment.csv")
+        store_run("ycsb", stored, workers, workload=",".join(workload_names),
+                  extra={"record_count": record_count, "operation_count": operation_count, "value_size": value_size,
+                         "distribution": distribution})
+        input("\nPress Enter to return to the menu...")
+    except Exception as e:
+        print(f"Error on YCSB workload: {e}")
+        sys.exit(1)
+
+def ask_ycsb_settings():
+    for name, spec in WORKLOADS.items():
+        print(f"  {name}: {spec['description']}")
+    names = input("Workloads to run [A,B,C,D,E,F]: ").strip().upper() or "A,B,C,D,E,F"
+    record_count = input("Record count [1000]: ").strip()
+    operation_count = input("Operation count [1000]: ").strip()
+    value_size = input("Value size in bytes [100]: ").strip()
+    distribution = input("Key distribution, uniform, zipfian or latest (blank for workload default): ").strip().lower()
+    workers, _ = ask_load_settings()
+    return ([name.strip() for name in names.split(",") if name.strip()], int(record_count) if record_count else 1000,
+            int(operation_count) if operation_count else 1000, int(value_size) if value_size else 100,
+            distribution or None, workers)
+
+SCALABILITY_COLUMNS = ["Step", "Action", "Nodes", "Transition (s)", "Keys Moved", "Handoffs", "Longest Handoff (ms)",
+                       "Transition Throughput (req/s)", "Transition p99 (ms)", "Transition Errors",
+                       "Transition Misses", "Throughput (req/s)"] + LATENCY_COLUMNS + ["Misses"]
+
+def scalability_row(row):
+    summary = row["summary"]
+    return [row["step"], row["action"] if "error" not in row else f"{row['action']} (failed)", row["nodes"],
+            row["transition_s"], row.get("keys_moved"), row.get("transfer_calls"), row.get("transfer_max_ms"),
+            row.get("transition_throughput"), row.get("transition_p99_ms"), row.get("transition_errors"),
+            row.get("transition_misses"), summary["throughput"], summary["p50_ms"], summary["p95_ms"],
+            summary["p99_ms"], summary["p999_ms"], summary["max_ms"], summary["error_rate"], summary["misses"]]
+
+def run_scalability_experiment(min_nodes=2, max_nodes=8, step=2, step_duration=5.0, replication_factor="3",
+                               consistency="chain", records=1000, workload="B", workers=8, base_port=6000,
+                               network=None):
+    # its own ring on base_port and up, joins and departs need the node processes at hand
+    try:
+        def on_step(row):
+            if "error" in row:
+                tqdm.write(f"  step {row['step']}: {row['action']} failed, {row['error']}")
+                return
+            summary = row["summary"]
+            tqdm.write(f"  step {row['step']}: {row['action']} -> {row['nodes']} nodes, {row['keys_moved']} keys moved "
+                       f"in {row['transition_s']}s, then {summary['throughput']} req/s, p99 {summary['p99_ms']} ms")
+
+        print(f"Growing a ring on ports {base_port}+ from {min_nodes} to {max_nodes} nodes and back, "
+              f"{step} at a time, {step_duration}s per step...")
+        rows, events, timeline = run_scalability(min_nodes, max_nodes, step, step_duration, int(replication_factor),
+                                                 consistency, records, workload, workers, base_port=base_port,
+                                                 network=network, on_step=on_step)
+
+        df = pd.DataFrame([scalability_row(row) for row in rows], columns=SCALABILITY_COLUMNS)
+        print(f"\nScalability & Churn (workload {workload}, {records} records, {workers} workers, "
+              f"Replication Factor={replication_factor}, Consistency={consistency}):")
+        print(tabulate(df, headers='keys', tablefmt='grid', showindex=False))
+        save_results_to_csv(df, "scalability_experiment.csv")
+
+        # throughput over the whole run, with the joins and departs marked where they began
+        markers = {int(at / THROUGHPUT_WINDOW) * THROUGHPUT_WINDOW: event for at, event in events}
+        df_timeline = pd.DataFrame([[at, throughput, markers.get(at, "")] for at, throughput in timeline],
+                                   columns=["Time (s)", "Throughput (req/s)", "Event"])
+        save_results_to_csv(df_timeline, "scalability_timeline.csv")
+        store_run("scalability", [{"replication_factor": replication_factor, "consistency": consistency,
+                                   "label": f"{row['step']} {row['action']} ({row['nodes']} nodes)",
+                                   "summary": row["summary"]} for row in rows],
+                  workers, workload=workload, node_count=max_nodes,
+                  extra={"min_nodes": min_nodes, "max_nodes": max_nodes, "step": step,
+                         "step_duration": step_duration, "records": records, "network": network})
+        input("\nPress Enter to return to the menu...")
+    except Exception as e:
+        print(f"Error on scalability experiment: {e}")
+        sys.exit(1)
+
+def ask_scalability_settings():
+    min_nodes = input("Smallest ring [2]: ").strip()
+    max_nodes = input("Largest ring [8]: ").strip()
+    step = input("Nodes joining or departing per step [2]: ").strip()
+    step_duration = input("Seconds measured after each step [5]: ").strip()
+    replication_factor = input("Replication factor [3]: ").strip() or "3"
+    consistency = input("Consistency, chain or eventual [chain]: ").strip().lower() or "chain"
+    workload = input("YCSB workload driving the load [B]: ").strip().upper() or "B"
+    records = input("Record count [1000]: ").strip()
+    workers, _ = ask_load_settings()
+    return (int(min_nodes) if min_nodes else 2, int(max_nodes) if max_nodes else 8, int(step) if step else 2,
+            float(step_duration) if step_duration else 5.0, replication_factor, consistency,
+            int(records) if records else 1000, workload, workers)
+
+def ask_sweep_settings():
+    operation = input("Operation to sweep, insert or query [query]: ").strip().lower() or "query"
+    rates = input("Offered loads in req/s [50,100,200,400,800]: ").strip() or "50,100,200,400,800"
+    step_duration = input("Seconds per load step [5]: ").strip()
+    arrival = input("Arrivals, poisson or fixed [poisson]: ").strip().lower() or "poisson"
+    slo_ms = input("p99 latency SLO in ms (blank for none): ").strip()
+    return (operation, [float(rate) for rate in rates.split(",")], float(step_duration) if step_duration else 5.0,
+            arrival, float(slo_ms) if slo_ms else None)
 
 def print_menu():
     os.system('clear' if os.name == 'posix' else 'cls')
@@ -265,35 +509,86 @@ def print_menu():
     print("[1] ➤ Run 1st Experiment (Write Throughput)")
     print("[2] ➤ Run 2nd Experiment (Read Throughput)")
     print("[3] ➤ Run 3nd Experiment (Freshness)")
-    print("[4] ➤ Exit")
+    print("[4] ➤ Run Open-Loop Latency Sweep")
+    print("[5] ➤ Run YCSB Workloads")
+    print("[6] ➤ Run Staleness Benchmark")
+    print("[7] ➤ Run Scalability & Churn Experiment")
+    print("[8] ➤ Exit")
     print("=" * 30)
-    choice = input("Enter choice [1/2/3/4]: ")
+    choice = input("Enter choice [1/2/3/4/5/6/7/8]: ")
     return choice
 
 
 if __name__ == "__main__":
-    while True:
-        choice = print_menu()
-
-        if choice == "1":
-            insert_directory = input("Enter directory path for batch insert during experiment: ") or "insert"
-            print("Will run write throughput experiment for yall!")
-            run_insert_experiment(insert_directory)
-
-        elif choice == "2":
-            insert_directory = input("Enter directory path for batch insert during experiment: ") or "insert"
-            queries_directory = input("Enter directory path for batch queries during experiment: ") or "queries"
-            print("Will run read throughput experiment for yall!")
-            run_query_experiment(insert_directory, queries_directory)
-
-        elif choice == "3":
-            request_directory = input("Enter request directory path for freshness experiment: ") or "requests"
-            print("Will run freshness experiment for yall!")
-            run_freshness_experiment(request_directory)
-
-        elif choice == "4" or choice.lower() in ["exit", "quit", "q"]:
-            print("Exiting...")
-            break
-        else:
-            print("Invalid choice. Try again.")
+    parser = argparse.ArgumentParser(description="Run the Conchord experiments against the node on 127.0.0.1:5000")
+    parser.add_argument("--local-nodes", type=int, default=0,
+                        help="Start a ring of this many nodes on localhost ports 5000+ for the experiments (default: use a running ring)")
+    parser.add_argument("--local-mode", type=str, choices=["subprocess", "inprocess"], default="subprocess",
+                        help="Run the local nodes as separate processes or inside this process (default: subprocess)")
+    # a proxy in front of every local node, for WAN-like links between the nodes on one machine
+    add_link_arguments(parser, prefix="local-")
+    parser.add_argument("--local-network-seed", type=int, default=0,
+                        help="Seed of the local link delays and resets (default: 0)")
+    args = parser.parse_args()
+
+    cluster = None
+    network = link_settings(args, prefix="local-") or None
+    if args.local_nodes:
+        print(f"Starting a local ring of {args.local_nodes} nodes{f' with links {network}' if network else ''}...")
+        cluster = Cluster(args.local_nodes, mode=args.local_mode, node_options={"log_level": "warning"},
+                          network=network, network_seed=args.local_network_seed).start()
+
+    # the local ring goes down however the menu ends, also on Ctrl-C or a failed experiment
+    try:
+        while True:
+            choice = print_menu()
+
+            if choice == "1":
+                insert_directory = input("Enter directory path for batch insert during experiment: ") or "insert"
+                workers, rate = ask_load_settings()
+                print("Will run write throughput experiment for yall!")
+                run_insert_experiment(insert_directory, workers, rate)
+
+            elif choice == "2":
+                insert_directory = input("Enter directory path for batch insert during experiment: ") or "insert"
+                queries_directory = input("Enter directory path for batch queries during experiment: ") or "queries"
+                workers, rate = ask_load_settings()
+                print("Will run read throughput experiment for yall!")
+                run_query_experiment(insert_directory, queries_directory, workers, rate)
+
+            elif choice == "3":
+                request_directory = input("Enter request directory path for freshness experiment: ") or "requests"
+                print("Will run freshness experiment for yall!")
+                run_freshness_experiment(request_directory)
+
+            elif choice == "4":
+                insert_directory = input("Enter directory path for batch insert during experiment: ") or "insert"
+                queries_directory = input("Enter directory path for batch queries during experiment: ") or "queries"
+                operation, rates, step_duration, arrival, slo_ms = ask_sweep_settings()
+                print("Will run open-loop latency sweep for yall!")
+                run_open_loop_experiment(insert_directory, queries_directory, operation, rates, step_duration, arrival, slo_ms)
+
+            elif choice == "5":
+                names, record_count, operation_count, value_size, distribution, workers = ask_ycsb_settings()
+                print("Will run YCSB workloads for yall!")
+                run_ycsb_experiment(names, record_count, operation_count, value_size, distribution, workers)
+
+            elif choice == "6":
+                keys, writes_per_key, write_interval, readers, background_ops = ask_staleness_settings()
+                print("Will run staleness benchmark for yall!")
+                run_staleness_experiment(keys, writes_per_key, write_interval, readers, background_ops)
+
+            elif choice == "7":
+                settings = ask_scalability_settings()
+                print("Will run scalability & churn experiment for yall!")
+                run_scalability_experiment(*settings, network=network)
+
+            elif choice == "8" or choice.lower() in ["exit", "quit", "q"]:
+                print("Exiting...")
+                break
+            else:
+                print("Invalid choice. Try again.")
+    finally:
+        if cluster is not None:
+            cluster.stop()
 
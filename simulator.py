@@ -0,0 +1,451 @@
+import argparse
+import heapq
+import itertools
+import json
+import random
+import threading
+
+from tabulate import tabulate
+
+from logger import ERROR
+from metrics import Histogram
+from node import Node
+from ring import TokenRing, vnode_ids, load_stats
+from workloads import Workload
+
+# a handler runs the next node's handler inline, so deep routes recurse; every this many nested
+# deliveries continue on a fresh thread with a fresh stack
+NESTED_PER_THREAD = 40
+
+
+class SimServerSocket:
+    # the accepted connection handed to Node.handle_request
+    def __init__(self, request):
+        self.request = request
+        self.sent = []
+        self.closed = False
+
+    def settimeout(self, timeout):
+        pass
+
+    def recv(self, size):
+        data, self.request = self.request[:size], self.request[size:]
+        return data
+
+    def fileno(self):
+        return -1 if self.closed else 0
+
+    def sendall(self, data):
+        self.sent.append(data)
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def close(self):
+        self.closed = True
+
+
+class SimConnection:
+    # the client side: the request is delivered on the first recv, or on close for messages nobody answers
+    def __init__(self, network, source, target):
+        self.network = network
+        self.source = source
+        self.target = target
+        self.request = []
+        self.response = None
+
+    def settimeout(self, timeout):
+        pass
+
+    def sendall(self, data):
+        self.request.append(data)
+
+    def send(self, data):
+        self.request.append(data)
+
+    def recv(self, size):
+        if self.response is None:
+            self.response = self.network.deliver(self.source, self.target, b"".join(self.request))
+        data, self.response = self.response[:size], self.response[size:]
+        return data
+
+    def shutdown(self, how):
+        pass
+
+    def fileno(self):
+        return 0
+
+    def close(self):
+        if self.response is None and self.request:
+            self.response = b""
+            self.network.deliver(self.source, self.target, b"".join(self.request))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SimTransport:
+    # what a simulated node gets instead of transport.TcpTransport
+    def __init__(self, network, endpoint):
+        self.network = network
+        self.endpoint = endpoint
+
+    def connect(self, ip, port, timeout=None):
+        target = f"{ip}:{port}"
+        if target not in self.network.nodes:
+            raise ConnectionRefusedError(f"{target} is not on the simulated network")
+        return SimConnection(self.network, self.endpoint, target)
+
+    def spawn(self, target, *args, delay=0.0):
+        self.network.schedule(delay, target, args)
+
+
+class SimNetwork:
+    # every message is delivered synchronously and advances a virtual clock by the link's delay
+    def __init__(self, latency_ms=1.0, jitter_ms=0.0, bandwidth=None, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.bandwidth = bandwidth
+        self.random = random.Random(seed)
+        self.nodes = {}
+        # virtual seconds
+        self.now = 0.0
+        self.events = []
+        self.sequence = itertools.count()
+        self.running_events = False
+        # per command: [messages, request bytes, response bytes]
+        self.traffic = {}
+        # messages of the client request in progress, by command
+        self.counting = None
+        self.depth = 0
+        # ring updates applied to the same ring give the same ring, keep one copy for all nodes
+        self.ring_updates = {}
+
+    def link_delay(self, size):
+        delay = self.latency_ms + (self.random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0)
+        seconds = max(0.0, delay) / 1000
+        if self.bandwidth:
+            seconds += size / self.bandwidth
+        return seconds
+
+    def deliver(self, source, target, request):
+        node = self.nodes.get(target)
+        if node is None:
+            raise ConnectionResetError(f"{target} left the simulated network")
+        command = request.split(None, 1)[0].decode().lower() if request.strip() else ""
+        if source != target:
+            self.now += self.link_delay(len(request))
+        traffic = self.traffic.setdefault(command, [0, 0, 0])
+        traffic[0] += 1
+        traffic[1] += len(request)
+        if self.counting is not None and source is not None:
+            self.counting[command] = self.counting.get(command, 0) + 1
+
+        server = SimServerSocket(request)
+        ring = node.ring
+        self.depth += 1
+        try:
+            if self.depth % NESTED_PER_THREAD == 0:
+                thread = threading.Thread(target=node.handle_request, args=(server,))
+                thread.start()
+                thread.join()
+            else:
+                node.handle_request(server)
+        finally:
+            self.depth -= 1
+        if command in ("ring_add", "ring_remove") and node.ring is not ring:
+            self.share_ring(node, ring, request)
+
+        response = b"".join(server.sent)
+        traffic[2] += len(response)
+        if source != target:
+            self.now += self.link_delay(len(response))
+        if self.depth == 0:
+            # background work started by the request runs right away, as its thread would
+            self.run_until(self.now)
+        return response
+
+    def share_ring(self, node, ring, request):
+        # an announcement reaches every node, each would keep its own copy of a ring of n nodes
+        update = (id(ring), request)
+        if update in self.ring_updates:
+            node.ring = self.ring_updates[update][1]
+        else:
+            self.ring_updates[update] = (ring, node.ring)
+
+    def schedule(self, delay, target, args):
+        heapq.heappush(self.events, (self.now + delay, next(self.sequence), target, args))
+
+    def run_until(self, until=None):
+        # background work (eventual replication, key redistribution) due by then, in virtual time order
+        if self.running_events:
+            return
+        self.running_events = True
+        try:
+            while self.events and (until is None or self.events[0][0] <= until):
+                at, _, target, args = heapq.heappop(self.events)
+                self.now = max(self.now, at)
+                target(*args)
+        finally:
+            self.running_events = False
+        if until is not None:
+            self.now = max(self.now, until)
+
+    def traffic_since(self, before):
+        return {command: [count - before.get(command, [0, 0, 0])[0], sent - before.get(command, [0, 0, 0])[1],
+                          received - before.get(command, [0, 0, 0])[2]]
+                for command, (count, sent, received) in self.traffic.items()
+                if count != before.get(command, [0, 0, 0])[0]}
+
+    def snapshot(self):
+        return {command: list(counts) for command, counts in self.traffic.items()}
+
+
+class Simulation:
+    # node.Node objects on a simulated network: the real request handling, routing, replication and key
+    # transfers, without sockets or threads, in virtual time
+    def __init__(self, nodes=1000, replication_factor=3, consistency="chain", vnodes=1, latency_ms=1.0,
+                 jitter_ms=0.0, bandwidth=None, seed=0, node_options=None):
+        self.replication_factor = replication_factor
+        self.consistency = consistency
+        self.vnodes = vnodes
+        self.node_options = dict(node_options or {})
+        self.network = SimNetwork(latency_ms, jitter_ms, bandwidth, seed)
+        self.random = random.Random(seed)
+        self.created = 0
+        self.bootstrap = None
+        self.populate(nodes)
+
+    def next_endpoint(self):
+        # one host per node, replica placement with virtual ids prefers distinct hosts
+        index = self.created
+        self.created += 1
+        return f"10.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}", 5000
+
+    def make_node(self, ip, port, **kwargs):
+        options = dict({"log_level": ERROR, "vnodes": self.vnodes, "bloom_bits": 1024}, **self.node_options)
+        return Node(ip, port, transport=SimTransport(self.network, f"{ip}:{port}"), **options, **kwargs)
+
+    def populate(self, count):
+        # the ring a sequence of joins converges to, built directly: every join announces the new node
+        # to all others, which takes n^2 messages to build a ring of n nodes
+        nodes = []
+        for i in range(count):
+            ip, port = self.next_endpoint()
+            node = self.make_node(ip, port, bootstrap=i == 0, replication_factor=self.replication_factor,
+                                  consistency=self.consistency)
+            node.replication_factor, node.consistency = self.replication_factor, self.consistency
+            nodes.append(node)
+        ring = TokenRing()
+        for node in nodes:
+            for token in vnode_ids(node.ip, node.port, self.vnodes):
+                ring.owners[token] = node.endpoint
+        ring.refresh()
+        nodes.sort(key=lambda node: node.node_id)
+        for i, node in enumerate(nodes):
+            node.successor = nodes[(i + 1) % len(nodes)]
+            node.predecessor = nodes[i - 1]
+            node.ring = ring
+            self.network.nodes[node.endpoint] = node
+        self.bootstrap = next(node for node in nodes if node.bootstrap_node)
+
+    def endpoints(self):
+        return list(self.network.nodes)
+
+    def request(self, command, entry=None):
+        # one client request through a random entry node: (response, node-to-node messages, virtual seconds)
+        entry = entry or self.random.choice(self.endpoints())
+        self.network.counting = {}
+        began = self.network.now
+        try:
+            response = self.network.deliver(None, entry, command.encode()).decode()
+        except ConnectionError as e:
+            response = f"ERROR: {e}"
+        messages, self.network.counting = self.network.counting, None
+        return response, sum(messages.values()), self.network.now - began
+
+    def run(self, operations, interval=0.001):
+        # (label, [commands]) pairs, one every interval virtual seconds with the background work in between
+        hops, latency, errors = {}, {}, {}
+        for label, commands in operations:
+            self.network.run_until(self.network.now + interval)
+            total_hops, total_seconds = 0, 0.0
+            for command in commands:
+                response, messages, seconds = self.request(command)
+                total_hops += messages
+                total_seconds += seconds
+                if response.startswith("ERROR"):
+                    errors[label] = errors.get(label, 0) + 1
+            hops.setdefault(label, Histogram()).record(total_hops)
+            latency.setdefault(label, Histogram()).record(total_seconds * 1e6)
+        self.network.run_until()
+        return {
+            label: {"operations": hops[label].count, "errors": errors.get(label, 0),
+                    "hops": hops[label].summary(scale=1), "latency_ms": latency[label].summary()}
+            for label in hops
+        }
+
+    def join(self):
+        # a new node through the real join protocol, then the announcement start_server would send
+        ip, port = self.next_endpoint()
+        before = self.network.snapshot()
+        began = self.network.now
+        endpoint = f"{ip}:{port}"
+        node = self.make_node(ip, port, bootstrap_ip=self.bootstrap.ip, bootstrap_port=self.bootstrap.port)
+        self.network.nodes[endpoint] = node
+        if node.ring_announce:
+            node.announce_ring()
+        self.network.run_until()
+        self.network.ring_updates.clear()
+        return self.event_report("join", endpoint, len(node.data), before, began)
+
+    def depart(self, endpoint=None):
+        endpoint = endpoint or self.random.choice([e for e in self.endpoints() if e != self.bootstrap.endpoint])
+        node = self.network.nodes[endpoint]
+        keys = len(node.data)
+        before = self.network.snapshot()
+        began = self.network.now
+        node.depart()
+        del self.network.nodes[endpoint]
+        self.network.run_until()
+        self.network.ring_updates.clear()
+        return self.event_report("depart", endpoint, keys, before, began)
+
+    def event_report(self, action, endpoint, keys, before, began):
+        traffic = self.network.traffic_since(before)
+        return {
+            "action": action,
+            "endpoint": endpoint,
+            "nodes": len(self.network.nodes),
+            "keys_moved": keys,
+            "messages": sum(count for count, _, _ in traffic.values()),
+            "bytes": sum(sent + received for _, sent, received in traffic.values()),
+            "virtual_ms": round((self.network.now - began) * 1000, 3),
+            "traffic": {command: {"messages": count, "bytes": sent + received}
+                        for command, (count, sent, received) in sorted(traffic.items())},
+            "ring_closed": self.ring_closed()
+        }
+
+    def ring_closed(self):
+        # the successor pointers visit every node once
+        nodes = self.network.nodes
+        seen, endpoint = set(), self.bootstrap.endpoint
+        while endpoint not in seen and endpoint in nodes:
+            seen.add(endpoint)
+            endpoint = nodes[endpoint].successor.endpoint
+        return len(seen) == len(nodes) and endpoint == self.bootstrap.endpoint
+
+    def balance(self):
+        # keys per node, primaries alone and with their replicas, and the share of the hash space owned
+        nodes = list(self.network.nodes.values())
+        primaries = [sum(record["hop"] == 0 for record in node.data.values()) for node in nodes]
+        stored = [len(node.data) for node in nodes]
+        ownership = self.bootstrap.ring.ownership()
+        return {
+            "primary_keys": dict(load_stats(primaries), min=min(primaries), max=max(primaries)),
+            "stored_keys": dict(load_stats(stored), min=min(stored), max=max(stored)),
+            "ownership": load_stats(ownership.values())
+        }
+
+    def placement(self):
+        # copies per key across the ring, and whether the copies sit on distinct nodes with distinct hops
+        copies = {}
+        for node in self.network.nodes.values():
+            for key, record in node.data.items():
+                copies.setdefault(key, []).append(record["hop"])
+        expected = min(self.replication_factor, len(self.network.nodes))
+        counts = {}
+        for hops in copies.values():
+            counts[len(hops)] = counts.get(len(hops), 0) + 1
+        return {
+            "keys": len(copies),
+            "copies": dict(sorted(counts.items())),
+            "fully_replicated": round(sum(len(h) == expected for h in copies.values()) / len(copies), 4)
+            if copies else None,
+            "with_primary": round(sum(0 in h for h in copies.values()) / len(copies), 4) if copies else None,
+            "distinct_hops": round(sum(len(set(h)) == len(h) for h in copies.values()) / len(copies), 4)
+            if copies else None
+        }
+
+
+def simulate(nodes=1000, replication_factor=3, consistency="chain", vnodes=1, records=2000, operations=1000,
+             workload="B", joins=3, departs=3, latency_ms=1.0, jitter_ms=0.0, bandwidth=None, seed=0,
+             progress=None):
+    sim = Simulation(nodes, replication_factor, consistency, vnodes, latency_ms, jitter_ms, bandwidth, seed)
+    ycsb = Workload(workload, records, operations, 20, seed=seed)
+    report = {"settings": {"nodes": nodes, "replication_factor": replication_factor, "consistency": consistency,
+                           "vnodes": vnodes, "records": records, "operations": operations, "workload": workload,
+                           "latency_ms": latency_ms, "jitter_ms": jitter_ms, "bandwidth": bandwidth, "seed": seed}}
+    if progress:
+        progress(f"Loading {records} records into {nodes} nodes")
+    report["load"] = sim.run([("insert", [command]) for command in ycsb.load_commands()])
+    report["placement_after_load"] = sim.placement()
+    if progress:
+        progress(f"Running {operations} workload {workload} operations")
+    report["operations"] = sim.run(ycsb.operations())
+    report["balance"] = sim.balance()
+
+    events = []
+    for action in ["join"] * joins + ["depart"] * departs:
+        if progress:
+            progress(f"Simulating a {action}")
+        events.append(sim.join() if action == "join" else sim.depart())
+    report["events"] = events
+    report["placement"] = sim.placement()
+    report["balance_after_events"] = sim.balance()
+    report["traffic"] = {command: {"messages": count, "bytes": sent + received}
+                         for command, (count, sent, received) in sorted(sim.network.traffic.items())}
+    report["virtual_seconds"] = round(sim.network.now, 3)
+    return report
+
+
+def print_report(report):
+    rows = [[phase, label, stats["operations"], stats["errors"], stats["hops"]["mean"], stats["hops"]["p50"],
+             stats["hops"]["p99"], stats["hops"]["max"], stats["latency_ms"]["p50"], stats["latency_ms"]["p99"]]
+            for phase in ("load", "operations") for label, stats in report[phase].items()]
+    print(tabulate(rows, headers=["Phase", "Operation", "Count", "Errors", "Hops Mean", "Hops p50", "Hops p99",
+                                  "Hops Max", "Latency p50 (ms)", "Latency p99 (ms)"], tablefmt="grid"))
+    balance = report["balance"]
+    print(tabulate([[name, stats["mean"], stats["stddev"], stats.get("min", ""), stats.get("max", ""),
+                     stats["max_over_mean"]] for name, stats in balance.items()],
+                   headers=["Load Balance", "Mean", "Stddev", "Min", "Max", "Max / Mean"], tablefmt="grid"))
+    print(tabulate([[event["action"], event["endpoint"], event["nodes"], event["keys_moved"], event["messages"],
+                     event["bytes"], event["virtual_ms"], event["ring_closed"]] for event in report["events"]],
+                   headers=["Event", "Node", "Nodes After", "Keys Moved", "Messages", "Bytes", "Virtual ms",
+                            "Ring Closed"], tablefmt="grid"))
+    placement = report["placement"]
+    print(f"Replica placement: {placement['keys']} keys, copies per key {placement['copies']}, "
+          f"{placement['fully_replicated']} fully replicated, {placement['with_primary']} with a primary")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate a ring of node.py nodes in one process, in virtual time")
+    parser.add_argument("--nodes", type=int, default=1000, help="Ring size (default: 1000)")
+    parser.add_argument("--replication-factor", type=int, default=3, help="Replication factor (default: 3)")
+    parser.add_argument("--consistency", type=str, choices=["chain", "eventual"], default="chain",
+                        help="Consistency type (default: chain)")
+    parser.add_argument("--vnodes", type=int, default=1,
+                        help="Virtual ids per node; above 1 the owner is looked up directly instead of walking "
+                             "the successors (default: 1)")
+    parser.add_argument("--records", type=int, default=2000, help="Records loaded before the workload (default: 2000)")
+    parser.add_argument("--operations", type=int, default=1000, help="YCSB operations (default: 1000)")
+    parser.add_argument("--workload", type=str, default="B", help="YCSB workload A-F (default: B)")
+    parser.add_argument("--joins", type=int, default=3, help="Nodes joining after the workload (default: 3)")
+    parser.add_argument("--departs", type=int, default=3, help="Nodes departing after the joins (default: 3)")
+    parser.add_argument("--latency-ms", type=float, default=1.0, help="One-way delay of every message (default: 1)")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +- spread around the delay")
+    parser.add_argument("--bandwidth", type=float, help="Bytes per second of every link (default: unlimited)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the workload, entry nodes and jitter (default: 0)")
+    parser.add_argument("--output", type=str, default="simulation.json", help="File the JSON report is written to")
+    args = parser.parse_args()
+
+    report = simulate(args.nodes, args.replication_factor, args.consistency, args.vnodes, args.records,
+                      args.operations, args.workload, args.joins, args.departs, args.latency_ms, args.jitter_ms,
+                      args.bandwidth, args.seed, progress=lambda message: print(message, flush=True))
+    print_report(report)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=4)
+    print(f"\nReport saved to {args.output}")
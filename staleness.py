@@ -0,0 +1,216 @@
+import json
+import random
+import re
+import threading
+import time
+
+from loadgen import send_command, is_error, run_load
+from metrics import Histogram
+from ring import TokenRing
+from utils import hash_key
+
+VERSION = re.compile(r"^v(\d+)$")
+# buckets of the time since a version was acknowledged, for the probability of reading it
+VISIBILITY_BUCKETS_MS = [1, 5, 10, 50, 100, 500]
+
+
+def version_tag(seq):
+    # inserts append to an existing value, so the value of a key lists every version it received
+    return f"v{seq}"
+
+
+def latest_version(value):
+    versions = [int(match.group(1)) for match in map(VERSION.match, value.split(", ")) if match]
+    return max(versions) if versions else 0
+
+
+def split_endpoint(endpoint):
+    ip, port = endpoint.rsplit(":", 1)
+    return ip, int(port)
+
+
+def ring_endpoints(host="127.0.0.1", port=5000):
+    return sorted({endpoint for _, endpoint in json.loads(send_command("get_ring", host, port))})
+
+
+def key_placement(names, host="127.0.0.1", port=5000):
+    # the replicas the ring places each key on, the key hashed as the node sees it, quoted
+    ring = TokenRing.from_json(json.loads(send_command("get_ring", host, port)))
+    replication_factor = int(send_command("get_network_config", host, port).split(":")[0])
+    return {name: ring.preference_list(hash_key(f'"{name}"'), replication_factor) for name in names}
+
+
+def read_replica(endpoint, key):
+    response = send_command(f'local_query "{key}"', *split_endpoint(endpoint))
+    if response.startswith("{"):
+        return latest_version(json.loads(response)["value"])
+    return None
+
+
+class StalenessRecorder:
+    # writes and observations on one clock, the benchmark's perf_counter
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.writes = {}
+        self.observations = []
+
+    def write(self, key, seq, started, acked, error):
+        with self.lock:
+            self.writes.setdefault(key, {})[seq] = (started, acked, error)
+
+    def observe(self, key, source, at, version):
+        with self.lock:
+            self.observations.append((key, source, at, version))
+
+    def acked_version(self, key, at):
+        # the newest version acknowledged to its writer by time at
+        acked = [seq for seq, (_, ack, error) in self.writes.get(key, {}).items() if not error and ack <= at]
+        return max(acked) if acked else 0
+
+
+def run_staleness(keys=8, writes_per_key=40, write_interval=0.02, readers=4, host="127.0.0.1", port=5000,
+                  background=None, background_workers=4, prefix=None):
+    # every key has one writer inserting increasing versions; readers meanwhile poll each replica directly
+    # (local_query) and read through the ring (query) from random entry nodes
+    prefix = prefix or f"stale{random.randrange(10 ** 6)}"
+    endpoints = ring_endpoints(host, port)
+    names = [f"{prefix}-{i}" for i in range(keys)]
+    placement = key_placement(names, host, port)
+    recorder = StalenessRecorder()
+    writing = threading.Event()
+    writing.set()
+
+    def writer(key):
+        for seq in range(1, writes_per_key + 1):
+            started = time.perf_counter()
+            try:
+                error = is_error(send_command(f'insert "{key}" {version_tag(seq)}', host, port))
+            except OSError:
+                error = True
+            recorder.write(key, seq, started, time.perf_counter(), error)
+            time.sleep(write_interval)
+
+    def reader():
+        rng = random.Random()
+        while writing.is_set():
+            key = rng.choice(names)
+            # a read counts from when it was sent, versions acknowledged meanwhile are not expected of it
+            for endpoint in endpoints:
+                began = time.perf_counter()
+                try:
+                    version = read_replica(endpoint, key)
+                except OSError:
+                    continue
+                recorder.observe(key, endpoint, began, version)
+            entry = rng.choice(endpoints)
+            began = time.perf_counter()
+            try:
+                response = send_command(f'query "{key}"', *split_endpoint(entry))
+                recorder.observe(key, "query", began, latest_version(response))
+            except OSError:
+                pass
+
+    background_thread = None
+    if background:
+        # unrelated load on the same ring, so replication competes with other requests
+        background_thread = threading.Thread(target=run_load, args=(background,),
+                                             kwargs={"workers": background_workers, "host": host, "port": port},
+                                             daemon=True)
+        background_thread.start()
+    readers_threads = [threading.Thread(target=reader, daemon=True) for _ in range(readers)]
+    writers_threads = [threading.Thread(target=writer, args=(key,), daemon=True) for key in names]
+    for thread in readers_threads + writers_threads:
+        thread.start()
+    for thread in writers_threads:
+        thread.join()
+    # keep polling a little longer, so the last versions can become visible
+    time.sleep(max(0.5, write_interval * 5))
+    writing.clear()
+    for thread in readers_threads:
+        thread.join()
+    return analyze(recorder, placement)
+
+
+def analyze(recorder, placement):
+    # placement: key -> the endpoints holding its replicas, a replica that never shows a version still counts
+    replicas = {key: set(endpoints) for key, endpoints in placement.items()}
+    per_source = {}
+    for key, source, at, version in recorder.observations:
+        per_source.setdefault((key, source), []).append((at, version or 0))
+    # the time resolution of the visibility figures: how long between two polls of the same replica
+    probe_gap = Histogram()
+    for (key, source), seen in per_source.items():
+        seen.sort()
+        if source != "query":
+            for (before, _), (after, _) in zip(seen, seen[1:]):
+                probe_gap.record((after - before) * 1e6)
+
+    # time-to-visibility: from the write's acknowledgement until every replica of the key shows it,
+    # an upper bound that is at most one probe gap late
+    visibility = Histogram()
+    replica_visibility = Histogram()
+    invisible = 0
+    for key, writes in recorder.writes.items():
+        for seq, (started, acked, error) in writes.items():
+            if error:
+                continue
+            latest_seen = 0.0
+            for endpoint in replicas.get(key, ()):
+                seen = next((at for at, version in per_source.get((key, endpoint), []) if version >= seq), None)
+                if seen is None:
+                    latest_seen = None
+                    break
+                replica_visibility.record(max(0.0, seen - acked) * 1e6)
+                latest_seen = max(latest_seen, seen)
+            if latest_seen is None:
+                invisible += 1
+            else:
+                visibility.record(max(0.0, latest_seen - acked) * 1e6)
+
+    # version lag of every read against the newest acknowledged version
+    replica_lags, read_lags = {}, {}
+    fresh_by_age = {bucket: [0, 0] for bucket in VISIBILITY_BUCKETS_MS + [None]}
+    for key, source, at, version in recorder.observations:
+        if source != "query" and source not in replicas.get(key, ()):
+            continue
+        expected = recorder.acked_version(key, at)
+        if not expected:
+            continue
+        lag = max(0, expected - (version or 0))
+        lags = read_lags if source == "query" else replica_lags
+        lags[lag] = lags.get(lag, 0) + 1
+        if source == "query":
+            # probabilistically bounded staleness: chance of a fresh read, by time since the newest ack
+            age_ms = (at - recorder.writes[key][expected][1]) * 1000
+            bucket = next((b for b in VISIBILITY_BUCKETS_MS if age_ms < b), None)
+            fresh_by_age[bucket][0] += lag == 0
+            fresh_by_age[bucket][1] += 1
+
+    def lag_distribution(lags):
+        total = sum(lags.values())
+        if not total:
+            return {"reads": 0}
+        return {
+            "reads": total,
+            "mean_lag": round(sum(lag * count for lag, count in lags.items()) / total, 3),
+            "max_lag": max(lags),
+            # P(read is at most k versions behind)
+            "p_within": {k: round(sum(c for lag, c in lags.items() if lag <= k) / total, 4) for k in (0, 1, 2, 5)}
+        }
+
+    return {
+        "writes": sum(len(writes) for writes in recorder.writes.values()),
+        "write_errors": sum(error for writes in recorder.writes.values() for _, _, error in writes.values()),
+        "replicas_per_key": round(sum(map(len, replicas.values())) / len(replicas), 2) if replicas else 0,
+        "never_visible": invisible,
+        "visibility_ms": visibility.summary(),
+        "replica_visibility_ms": replica_visibility.summary(),
+        "probe_gap_ms": probe_gap.summary(),
+        "replica_lag": lag_distribution(replica_lags),
+        "read_lag": lag_distribution(read_lags),
+        "p_fresh_by_age_ms": {
+            (f"<{bucket}" if bucket is not None else f">={VISIBILITY_BUCKETS_MS[-1]}"):
+                round(fresh / total, 4) if total else None
+            for bucket, (fresh, total) in fresh_by_age.items()
+        }
+    }
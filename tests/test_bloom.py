@@ -0,0 +1,63 @@
+import time
+
+from bloom import BloomFilter
+from cluster import Cluster
+from utils import hash_key
+
+
+def test_added_keys_are_found():
+    bloom = BloomFilter(size=4096, hashes=4)
+    hashes = [hash_key(f'"key{i}"') for i in range(200)]
+    for key_hash in hashes:
+        bloom.add(key_hash)
+    assert all(bloom.might_contain(key_hash) for key_hash in hashes)
+    assert bloom.count == 200
+
+
+def test_remove_clears_bits_again():
+    bloom = BloomFilter(size=4096, hashes=4)
+    key_hash = hash_key('"gone"')
+    bloom.add(key_hash)
+    bloom.remove(key_hash)
+    assert not bloom.might_contain(key_hash)
+    assert bloom.set_bits == 0 and bloom.count == 0
+
+
+def test_false_positive_rate_is_low():
+    bloom = BloomFilter(size=16384, hashes=4)
+    for i in range(1000):
+        bloom.add(hash_key(f"present{i}"))
+    false_positives = sum(bloom.might_contain(hash_key(f"absent{i}")) for i in range(10000))
+    assert false_positives / 10000 < 0.01
+    assert bloom.false_positive_rate() < 0.01
+
+
+def test_encoded_filter_answers_the_same():
+    bloom = BloomFilter(size=2048, hashes=3)
+    hashes = [hash_key(f"k{i}") for i in range(100)]
+    for key_hash in hashes:
+        bloom.add(key_hash)
+    copy = BloomFilter.decode(bloom.size, bloom.hashes, bloom.encode(), bloom.count)
+    assert copy.set_bits == bloom.set_bits
+    for i in range(1000):
+        key_hash = hash_key(f"probe{i}")
+        assert copy.might_contain(key_hash) == bloom.might_contain(key_hash)
+
+
+def test_departed_node_is_never_the_next_hop():
+    with Cluster(4, 1, "eventual", base_port=7740, mode="inprocess",
+                 node_options={"log_level": "error", "bloom_interval": 0.2}) as cluster:
+        cluster.run([f'insert "k{i}" v' for i in range(100)])
+        time.sleep(1)
+        departed = cluster.members[cluster.ports[-1]]
+        lingering = dict(departed.peer_blooms)
+        lingering[departed.node_id] = {"ip": departed.ip, "port": departed.port, "seen": 0.0,
+                                       "filter": departed.bloom, "entry": departed.bloom_entry(False), "bits": ""}
+        cluster.remove_node()
+        for node in cluster.members.values():
+            assert departed.node_id not in node.peer_blooms
+            # a stale filter of the departed node, as if its removal had not reached this node's gossip yet
+            node.peer_blooms[departed.node_id] = lingering[departed.node_id]
+            for i in range(200):
+                candidate = node.next_bloom_candidate(hash_key(f'"k{i}"'), node.node_id)
+                assert candidate != (departed.ip, departed.port)
@@ -0,0 +1,48 @@
+import pytest
+
+from bulk_import import BulkImport, insert_command, load_checkpoint, save_checkpoint
+from client import ChordClient
+from cluster import Cluster
+from utils import hash_key
+
+
+def test_insert_command_quotes_the_key_and_hashes_it_as_sent():
+    assert insert_command("k", "v") == ('insert "k" v', hash_key('"k"'))
+    assert insert_command(" spaced key ", "two words")[0] == 'insert "spaced key" "two words"'
+    assert insert_command(7, 1.5)[0] == 'insert "7" 1.5'
+
+
+@pytest.mark.parametrize("key, value", [(None, "v"), ("k", None), ("", "v"), ('say "hi"', "v"), ("k", "a\nb"),
+                                        ("k", "v ::hash=1"), ("k", "[1]")])
+def test_records_the_protocol_cannot_carry_are_skipped(key, value):
+    assert insert_command(key, value) is None
+
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / "import.checkpoint")
+    save_checkpoint(path, ["a.csv", "b.csv"], 1200)
+    checkpoint = load_checkpoint(path, ["a.csv", "b.csv"])
+    assert checkpoint["records"] == 1200 and not checkpoint["complete"]
+    save_checkpoint(path, ["a.csv", "b.csv"], 5000, complete=True)
+    assert load_checkpoint(path, ["a.csv", "b.csv"])["complete"]
+    assert not (tmp_path / "import.checkpoint.tmp").exists()
+
+
+def test_checkpoint_of_other_inputs_is_refused(tmp_path):
+    path = str(tmp_path / "import.checkpoint")
+    save_checkpoint(path, ["a.csv"], 10)
+    with pytest.raises(ValueError):
+        load_checkpoint(path, ["b.csv"])
+
+
+def test_import_checkpoints_its_position():
+    records = [(f"bulk{i}", i) for i in range(300)] + [(None, "skipped")]
+    positions = []
+    with Cluster(3, 2, "chain", base_port=7730, mode="inprocess", node_options={"log_level": "error"}) as cluster:
+        importer = BulkImport("127.0.0.1", cluster.bootstrap_port, batch_size=50, window=4, timeout=10)
+        assert importer.run(records, checkpoint=positions.append, checkpoint_interval=0.01)
+        assert importer.imported == 300 and importer.skipped == 1
+        assert positions[-1] == len(records)
+        assert positions == sorted(positions)
+        with ChordClient("127.0.0.1", cluster.bootstrap_port) as client:
+            assert client.query("bulk123").endswith("123")
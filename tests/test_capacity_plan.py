@@ -0,0 +1,19 @@
+import pytest
+
+from capacity_plan import Placement, hash_keys, made_up_endpoints, topology
+from utils import hash_key
+from workloads import record_key
+
+
+@pytest.mark.parametrize("vnodes", [1, 4])
+def test_planned_placement_matches_the_ring(vnodes):
+    keys = [record_key(i) for i in range(2000)]
+    endpoints = made_up_endpoints(10)
+    ring = topology(endpoints, vnodes)
+    placement = Placement(ring, hash_keys(keys), 3, {endpoint: i for i, endpoint in enumerate(endpoints)})
+    replicas = placement.key_replicas(3)
+    for key, row in zip(keys, replicas):
+        # a client sends the key quoted, and the node hashes it as sent
+        key_hash = hash_key(f'"{key}"')
+        assert endpoints[row[0]] == ring.owner(key_hash)
+        assert [endpoints[i] for i in row] == ring.preference_list(key_hash, 3)
@@ -0,0 +1,35 @@
+import json
+import threading
+
+from capture import TrafficCapture, read_capture
+from node import Node
+
+
+def test_capture_restarted_while_stopping(tmp_path):
+    # a start right behind a stop must not take over the stopping capture's queue
+    capture = TrafficCapture()
+    first, second = str(tmp_path / "first.jsonl"), str(tmp_path / "second.jsonl")
+    assert capture.start(first, "127.0.0.1:7750")
+    for i in range(2000):
+        capture.record(capture.started, f'query "k{i}"', 0.001, False)
+    stopper = threading.Thread(target=capture.stop)
+    stopper.start()
+    while capture.active:
+        pass
+    assert capture.start(second, "127.0.0.1:7750")
+    stopper.join(5)
+    assert not stopper.is_alive()
+    capture.record(capture.started, 'query "after"', 0.001, False)
+    assert capture.stop()
+    assert len(read_capture(first)[1]) == 2000
+    assert [record["c"] for record in read_capture(second)[1]] == ['query "after"']
+
+
+def test_remote_capture_stays_in_the_capture_directory(tmp_path):
+    node = Node("127.0.0.1", 7750, bootstrap=True, capture_dir=str(tmp_path / "captures"))
+    for name in ("../escape.jsonl", "/tmp/escape.jsonl", "..", "sub/escape.jsonl"):
+        assert node.process_request(f"capture start {name}").startswith("ERROR")
+    assert not node.capture.active
+    status = json.loads(node.process_request("capture start run.jsonl"))
+    assert status["capturing"] and status["path"] == str(tmp_path / "captures" / "run.jsonl")
+    assert not json.loads(node.process_request("capture stop"))["capturing"]
@@ -0,0 +1,24 @@
+import time
+
+import pytest
+
+from cluster import Cluster
+
+
+def stored_keys(cluster):
+    return sum(stats["data"]["key_count"] for stats in cluster.stats().values())
+
+
+@pytest.mark.parametrize("consistency", ["chain", "eventual"])
+def test_inserted_keys_are_found(consistency):
+    with Cluster(3, 2, consistency, base_port=7720, mode="inprocess", node_options={"log_level": "error"}) as cluster:
+        inserts = cluster.run([f'insert "key{i}" value{i}' for i in range(50)], workers=4)
+        assert inserts.summary()["errors"] == 0
+        queries = cluster.run([f'query "key{i}"' for i in range(50)], workers=4, keep_responses=True)
+        assert queries.summary()["errors"] == 0
+        assert all(response.endswith(f"value{i}") for i, response in enumerate(queries.responses))
+        # every key on both of its replicas; eventual ones catch up in the background
+        deadline = time.time() + 10
+        while stored_keys(cluster) < 100 and time.time() < deadline:
+            time.sleep(0.05)
+        assert stored_keys(cluster) == 100
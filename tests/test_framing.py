@@ -0,0 +1,72 @@
+import socket
+import threading
+import time
+
+from client import ChordClient
+from cluster import Cluster
+from framing import FRAME_MAGIC, FRAME_HEADER, encode_frame, decode_frames
+from node import Node
+
+
+def test_frames_round_trip():
+    buffer = encode_frame(1, 'insert "a" 1') + encode_frame(2, "") + encode_frame(7, 'query "ключ"')
+    frames, rest = decode_frames(buffer)
+    assert frames == [(1, 'insert "a" 1'), (2, ""), (7, 'query "ключ"')]
+    assert rest == b""
+
+
+def test_incomplete_frame_is_kept():
+    frame = encode_frame(3, "overlay")
+    for cut in (1, FRAME_HEADER.size, len(frame) - 1):
+        frames, rest = decode_frames(frame[:cut])
+        assert frames == [] and rest == frame[:cut]
+        frames, rest = decode_frames(rest + frame[cut:])
+        assert frames == [(3, "overlay")] and rest == b""
+
+
+def test_written_keys():
+    node = Node("127.0.0.1", 7700, bootstrap=True)
+    assert node.written_keys('insert "k" v ::node=127.0.0.1:7701') == {'"k"'}
+    assert node.written_keys('batch ["insert \\"a\\" 1", "query \\"b\\"", "delete \\"c\\""]') == {'"a"', '"c"'}
+    assert node.written_keys('query "k"') == set()
+
+
+def test_same_key_writes_keep_their_order():
+    # the first write is slow, the second write to its key waits for it while a read goes ahead
+    node = Node("127.0.0.1", 7700, bootstrap=True, frame_workers=4)
+    applied = []
+
+    def answer(request, started=None):
+        if request.endswith("slow"):
+            time.sleep(0.3)
+        applied.append(request)
+        return "ok"
+    node.answer = answer
+    server, client = socket.socketpair()
+    threading.Thread(target=node.serve_framed, args=(server, b""), daemon=True).start()
+    try:
+        client.sendall(encode_frame(1, 'update "k" slow') + encode_frame(2, 'update "k" fast')
+                       + encode_frame(3, 'query "other"'))
+        buffer, answers = b"", []
+        while len(answers) < 3:
+            buffer += client.recv(4096)
+            if buffer.startswith(FRAME_MAGIC):
+                buffer = buffer[len(FRAME_MAGIC):]
+            frames, buffer = decode_frames(buffer)
+            answers += [request_id for request_id, _ in frames]
+        assert applied == ['query "other"', 'update "k" slow', 'update "k" fast']
+        assert answers == [3, 1, 2]
+    finally:
+        client.close()
+        node.close_connections()
+
+
+def test_client_node_round_trip():
+    with Cluster(1, 1, "chain", base_port=7710, mode="inprocess", node_options={"log_level": "error"}) as cluster:
+        with ChordClient("127.0.0.1", cluster.bootstrap_port) as client:
+            assert "Inserted" in client.insert("framed", 1)
+            assert "Updated" in client.update("framed", 2)
+            assert client.query("framed").endswith("2")
+            answers = client.send_many([f'insert "k{i}" {i}' for i in range(20)])
+            assert all("Inserted" in answer for answer in answers)
+            assert client.framed
@@ -0,0 +1,51 @@
+from memstats import record_bytes
+from metrics import Histogram
+from node import Node
+
+
+def test_small_values_are_exact():
+    histogram = Histogram()
+    for value in range(1, 101):
+        histogram.record(value)
+    assert histogram.count == 100
+    assert histogram.percentile(50) == 50
+    assert histogram.percentile(99) == 99
+    assert histogram.percentile(100) == 100
+    assert histogram.mean() == 50.5
+
+
+def test_large_values_stay_within_the_relative_error():
+    histogram = Histogram()
+    values = [int(1.37 ** exponent) for exponent in range(10, 60)]
+    for value in values:
+        histogram.record(value)
+    for q in (10, 50, 90):
+        expected = sorted(values)[max(0, round(q / 100 * len(values)) - 1)]
+        assert abs(histogram.percentile(q) - expected) <= expected / histogram.sub_buckets * 2
+
+
+def test_merge_matches_recording_everything():
+    first, second, both = Histogram(), Histogram(), Histogram()
+    for value in range(0, 5000, 7):
+        (first if value % 2 else second).record(value)
+        both.record(value)
+    first.merge(second)
+    assert first.summary() == both.summary()
+    assert first.min == 0
+
+
+def test_empty_summary():
+    summary = Histogram().summary()
+    assert summary["count"] == 0 and summary["p99"] == 0 and summary["max"] == 0
+
+
+def test_node_stats_keep_running_counts():
+    node = Node("127.0.0.1", 7760, bootstrap=True, replication_factor=2)
+    node.absorb_keys([[f'"k{i}"', f"v{i}", i % 2] for i in range(10)])
+    node.absorb_keys([['"k0"', "w", 1], ['"k1"', "w", 0]])
+    node.increment_hops(['"k2"', '"k3"'])
+    data = node.stats()["data"]
+    primaries = sum(record["hop"] == 0 for record in node.data.values())
+    assert data["key_count"] == len(node.data) == 9
+    assert (data["primary_keys"], data["replica_keys"]) == (primaries, len(node.data) - primaries)
+    assert data["data_bytes"] == sum(record_bytes(key, record) for key, record in node.data.items())
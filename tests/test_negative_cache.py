@@ -0,0 +1,39 @@
+import time
+
+from negative_cache import NegativeCache
+
+
+def test_miss_hit_and_expiry():
+    cache = NegativeCache(size=8, ttl=0.05)
+    assert not cache.get("k")
+    cache.put("k")
+    assert cache.get("k")
+    time.sleep(0.06)
+    assert not cache.get("k")
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_least_recently_used_is_evicted():
+    cache = NegativeCache(size=2, ttl=10)
+    cache.put("a")
+    cache.put("b")
+    cache.get("a")
+    cache.put("c")
+    assert cache.get("a") and cache.get("c")
+    assert not cache.get("b")
+    assert cache.evictions == 1
+
+
+def test_discard_invalidates():
+    cache = NegativeCache(size=8, ttl=10)
+    cache.put("k")
+    cache.discard("k")
+    cache.discard("never cached")
+    assert not cache.get("k")
+    assert cache.invalidations == 1
+
+
+def test_disabled_cache_never_answers():
+    for cache in (NegativeCache(size=0, ttl=10), NegativeCache(size=8, ttl=0)):
+        cache.put("k")
+        assert not cache.get("k")
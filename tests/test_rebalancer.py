@@ -0,0 +1,31 @@
+from rebalancer import plan_moves
+
+
+def report(tokens):
+    return {"tokens": {token: {"keys": keys, "requests": requests} for token, (keys, requests) in tokens.items()}}
+
+
+def test_moves_a_token_from_the_hot_node_to_the_cold_one():
+    before = {"a:1": report({"1": (0, 0), "2": (0, 0)}), "b:1": report({"3": (0, 0)})}
+    after = {"a:1": report({"1": (500, 0), "2": (300, 0)}), "b:1": report({"3": (200, 0)})}
+    plan = plan_moves(before, after, window=10)
+    assert plan["loads"] == {"a:1": 0.8, "b:1": 0.2}
+    # the token that evens the pair out best
+    assert [(move["token"], move["from"], move["to"]) for move in plan["moves"]] == [("2", "a:1", "b:1")]
+    assert plan["projected_loads"] == {"a:1": 0.5, "b:1": 0.5}
+    assert plan["projected_imbalance"] < plan["imbalance"]
+
+
+def test_request_rate_counts_towards_the_load():
+    # equal keys, but the requests all hit one token of a
+    before = {"a:1": report({"1": (100, 0), "2": (100, 0)}), "b:1": report({"3": (200, 0)})}
+    after = {"a:1": report({"1": (100, 1000), "2": (100, 0)}), "b:1": report({"3": (200, 0)})}
+    plan = plan_moves(before, after, window=10, key_weight=0.5)
+    assert plan["loads"]["a:1"] > plan["loads"]["b:1"]
+    assert plan["moves"] and plan["moves"][0]["token"] == "2"
+
+
+def test_a_node_keeps_its_last_token():
+    before = {"a:1": report({"1": (0, 0)}), "b:1": report({"2": (0, 0)})}
+    after = {"a:1": report({"1": (900, 0)}), "b:1": report({"2": (100, 0)})}
+    assert plan_moves(before, after, window=10)["moves"] == []
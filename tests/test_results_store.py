@@ -0,0 +1,25 @@
+import math
+
+import pytest
+
+from results_store import welch_t_test
+
+
+def test_identical_samples_do_not_differ():
+    assert welch_t_test(10.0, 2.0, 30, 10.0, 2.0, 30) == pytest.approx(1.0)
+
+
+def test_known_p_value():
+    # t = 2.0 with 58 degrees of freedom
+    stdev = math.sqrt(3.75)
+    assert welch_t_test(10.0, stdev, 30, 11.0, stdev, 30) == pytest.approx(0.0502, abs=0.0005)
+
+
+def test_far_apart_means_differ():
+    assert welch_t_test(100.0, 1.0, 20, 110.0, 1.0, 20) < 1e-10
+
+
+def test_degenerate_inputs():
+    assert welch_t_test(1.0, 0.0, 1, 2.0, 0.0, 5) is None
+    assert welch_t_test(1.0, 0.0, 5, 2.0, 0.0, 5) == 0.0
+    assert welch_t_test(1.0, 0.0, 5, 1.0, 0.0, 5) == 1.0
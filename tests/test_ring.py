@@ -0,0 +1,51 @@
+from ring import TokenRing, vnode_ids, split_endpoint
+from utils import hash_key
+
+
+def plain_ring(count):
+    ring = TokenRing()
+    for i in range(count):
+        endpoint = f"10.0.0.{i}:5000"
+        ring.add(endpoint, [hash_key(endpoint)])
+    return ring
+
+
+def virtual_ring(count, vnodes):
+    ring = TokenRing()
+    for i in range(count):
+        ip, port = f"10.0.0.{i}", 5000
+        ring.add(f"{ip}:{port}", vnode_ids(ip, port, vnodes))
+    return ring
+
+
+def test_plain_preference_list_is_owner_and_successors():
+    ring = plain_ring(5)
+    for i in range(50):
+        key_hash = hash_key(f'"key{i}"')
+        replicas = ring.preference_list(key_hash, 3)
+        assert replicas[0] == ring.owner(key_hash)
+        start = ring.tokens.index(ring.token_for(key_hash))
+        assert replicas == [ring.owners[ring.tokens[(start + step) % 5]] for step in range(3)]
+
+
+def test_virtual_preference_list_has_distinct_nodes():
+    ring = virtual_ring(5, 8)
+    assert ring.virtual
+    for i in range(200):
+        key_hash = hash_key(f'"key{i}"')
+        replicas = ring.preference_list(key_hash, 3)
+        assert replicas[0] == ring.owner(key_hash)
+        assert len(set(replicas)) == 3
+
+
+def test_preference_list_is_capped_by_the_ring():
+    ring = virtual_ring(2, 4)
+    assert sorted(ring.preference_list(hash_key("k"), 3)) == ring.endpoints()
+    assert TokenRing().preference_list(hash_key("k"), 3) == []
+
+
+def test_ring_survives_json():
+    ring = virtual_ring(4, 4)
+    copy = TokenRing.from_json(ring.to_json())
+    assert copy.tokens == ring.tokens and copy.owners == ring.owners and copy.virtual
+    assert split_endpoint("10.0.0.1:5000") == ("10.0.0.1", 5000)
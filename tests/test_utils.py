@@ -0,0 +1,21 @@
+from utils import split_meta, format_meta, custom_split
+
+
+def test_forwarded_metadata_is_peeled_off():
+    request = 'insert "k" v' + format_meta(hash=42, trace="ab-cd", node="127.0.0.1:5001")
+    assert split_meta(request) == ('insert "k" v', {"hash": "42", "trace": "ab-cd", "node": "127.0.0.1:5001"})
+
+
+def test_client_hash_is_not_trusted():
+    assert split_meta('query "k" ::hash=42') == ('query "k"', {})
+    assert split_meta('query "k" ::trace=ab') == ('query "k"', {"trace": "ab"})
+
+
+def test_unknown_tokens_stay_in_the_request():
+    assert split_meta('insert "k" a::b=c') == ('insert "k" a::b=c', {})
+    assert split_meta('insert "k" ::value=1') == ('insert "k" ::value=1', {})
+    assert split_meta("overlay") == ("overlay", {})
+
+
+def test_quoted_keys_stay_whole():
+    assert custom_split('insert "two words" value') == ["insert", '"two words"', "value"]
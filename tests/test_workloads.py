@@ -0,0 +1,31 @@
+import pytest
+
+from workloads import Workload, WORKLOADS
+
+
+def mix(name, count=4000):
+    counts = {}
+    for operation, _ in Workload(name, record_count=100, operation_count=count, seed=7).operations():
+        counts[operation] = counts.get(operation, 0) + 1
+    return {operation: n / count for operation, n in counts.items()}
+
+
+@pytest.mark.parametrize("name", sorted(WORKLOADS))
+def test_operation_mix_matches_the_spec(name):
+    shares = mix(name)
+    for operation, weight in WORKLOADS[name].items():
+        if isinstance(weight, float):
+            assert shares.get(operation, 0.0) == pytest.approx(weight, abs=0.03)
+
+
+def test_updates_overwrite_and_read_modify_write_reads_first():
+    operations = dict(Workload("F", record_count=10, operation_count=200, seed=1).operations())
+    query, update = operations["readmodifywrite"]
+    assert query.startswith('query "user') and update.startswith('update "user')
+    assert all(command.startswith("update ") for command in dict(Workload("A", seed=1).operations())["update"])
+
+
+def test_same_seed_gives_the_same_operations():
+    assert Workload("B", seed=3).operations() == Workload("B", seed=3).operations()
+    with pytest.raises(ValueError):
+        Workload("Z")
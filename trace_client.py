@@ -0,0 +1,92 @@
+import argparse
+import json
+import time
+from colorama import Fore, Style, init
+
+from client import shared_client
+from tracing import new_id, format_context
+from utils import format_meta
+
+init(autoreset=True)
+
+
+def send_command(ip, port, command, timeout=5):
+    return shared_client(ip, port).send(command, timeout)
+
+
+def collect_spans(ip, port, trace_id):
+    # every node keeps its own spans, so ask all of them
+    nodes = json.loads(send_command(ip, port, "overlay"))
+    spans = []
+    for details in nodes.values():
+        try:
+            spans += json.loads(send_command(details["ip"], details["port"], f"traces {trace_id}"))
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"{Fore.YELLOW}Could not fetch spans from {details['ip']}:{details['port']}: {e}{Style.RESET_ALL}")
+    return spans
+
+
+def print_waterfall(spans, width=50):
+    if not spans:
+        print("No spans recorded for this trace (was the request sampled?).")
+        return
+
+    span_ids = {span["span_id"] for span in spans}
+    children = {}
+    roots = []
+    for span in sorted(spans, key=lambda span: span["start"]):
+        if span["parent_id"] in span_ids:
+            children.setdefault(span["parent_id"], []).append(span)
+        else:
+            roots.append(span)
+
+    # offsets rely on the nodes' wall clocks, skew between machines shows up as shifted bars
+    begin = min(span["start"] for span in spans)
+    end = max(span["start"] + span["duration_ms"] / 1000 for span in spans)
+    total_ms = max((end - begin) * 1000, 0.001)
+    print(f"Trace {spans[0]['trace_id']}: {len(spans)} spans over {total_ms:.3f} ms")
+
+    def show(span, depth):
+        offset_ms = (span["start"] - begin) * 1000
+        left = int(offset_ms / total_ms * width)
+        length = max(1, int(span["duration_ms"] / total_ms * width))
+        bar = " " * left + "#" * min(length, width - left)
+        label = "  " * depth + span["name"]
+        color = Fore.RED if "error" in span["tags"] else ""
+        print(f"{color}{offset_ms:>9.3f} {span['duration_ms']:>9.3f} ms  {label:<40} {span['node']:<22}|{bar:<{width}}|")
+        for child in children.get(span["span_id"], []):
+            show(child, depth + 1)
+
+    print(f"{'start ms':>9} {'duration':>12}  {'span':<40} {'node':<22}")
+    for root in roots:
+        show(root, 0)
+
+
+def trace_command(ip, port, command):
+    trace_id = new_id()
+    started = time.perf_counter()
+    response = send_command(ip, port, command + format_meta(trace=format_context(trace_id)))
+    print(f"Response: {response} ({(time.perf_counter() - started) * 1000:.3f} ms)")
+    # eventual replication finishes after the response, give it a moment to land
+    time.sleep(0.3)
+    return trace_id
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trace a request around the Chord ring and show it as a waterfall")
+    parser.add_argument("command", nargs="?", help="Request to send traced, e.g. 'insert \"key\" value'")
+    parser.add_argument("--trace-id", type=str, help="Show an already recorded trace instead of sending a request")
+    parser.add_argument("--recent", action="store_true", help="List the traces recently started at the node")
+    parser.add_argument("--server-ip", type=str, default="127.0.0.1", help="The IP address of the entry node (default: 127.0.0.1)")
+    parser.add_argument("--server-port", type=int, default=5000, help="The port of the entry node (default: 5000)")
+    args = parser.parse_args()
+
+    if args.recent:
+        recent = json.loads(send_command(args.server_ip, args.server_port, "traces"))
+        for span in recent["recent"]:
+            print(f"{span['trace_id']}  {span['duration_ms']:>9.3f} ms  {span['tags'].get('request', span['name'])}")
+    elif args.trace_id or args.command:
+        trace_id = args.trace_id or trace_command(args.server_ip, args.server_port, args.command)
+        print_waterfall(collect_spans(args.server_ip, args.server_port, trace_id))
+    else:
+        parser.print_help()
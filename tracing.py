@@ -0,0 +1,115 @@
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+def new_id(bits=64):
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def format_context(trace_id, span_id=None):
+    # value of the "::trace=" metadata token: the trace id and the id of the calling span
+    return f"{trace_id}-{span_id}" if span_id else trace_id
+
+
+def parse_context(value):
+    trace_id, _, parent_id = value.partition("-")
+    return trace_id, parent_id or None
+
+
+class Tracer:
+    def __init__(self, node, sample_rate=0.0, capacity=10000):
+        self.node = node
+        self.sample_rate = sample_rate
+        # finished spans, the oldest are dropped once the buffer is full
+        self.spans = deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = 0
+
+    def sample(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def current(self):
+        return getattr(self.local, "context", None)
+
+    def outgoing(self):
+        # metadata for a message sent from inside the current span, None when not tracing
+        context = self.current()
+        return format_context(*context) if context else None
+
+    @contextmanager
+    def activate(self, context):
+        previous = self.current()
+        self.local.context = context
+        try:
+            yield
+        finally:
+            self.local.context = previous
+
+    def wrap(self, target):
+        # carry the current trace into a background thread
+        context = self.current()
+        if context is None:
+            return target
+
+        def traced(*args, **kwargs):
+            with self.activate(context):
+                return target(*args, **kwargs)
+        return traced
+
+    @contextmanager
+    def span(self, name, trace_id=None, parent_id=None, **tags):
+        # a child of the current span, or the root/remote-child span of trace_id
+        context = self.current()
+        if trace_id is None:
+            if context is None:
+                yield None
+                return
+            trace_id, parent_id = context
+        span_id = new_id(32)
+        start = time.time()
+        started = time.perf_counter()
+        with self.activate((trace_id, span_id)):
+            try:
+                yield span_id
+            except Exception as e:
+                tags["error"] = str(e)
+                raise
+            finally:
+                self.record({
+                    "trace_id": trace_id,
+                    "span_id": span_id,
+                    "parent_id": parent_id,
+                    "name": name,
+                    "node": self.node,
+                    "start": start,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                    "tags": tags
+                })
+
+    def record(self, span):
+        with self.lock:
+            self.spans.append(span)
+            if span["parent_id"] is None:
+                self.started += 1
+
+    def trace(self, trace_id):
+        with self.lock:
+            return [span for span in self.spans if span["trace_id"] == trace_id]
+
+    def recent(self, limit=20):
+        # the latest root spans seen at this node
+        with self.lock:
+            roots = [span for span in self.spans if span["parent_id"] is None]
+        return roots[-limit:]
+
+    def stats(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "spans": len(self.spans),
+            "capacity": self.spans.maxlen,
+            "traces_started": self.started
+        }
@@ -0,0 +1,24 @@
+import socket
+import threading
+import time
+
+
+class TcpTransport:
+    # how a node reaches its peers and runs work in the background; simulator.py swaps in a simulated network
+    def connect(self, ip, port, timeout=None):
+        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if timeout is not None:
+            client.settimeout(timeout)
+        try:
+            client.connect((ip, port))
+        except OSError:
+            client.close()
+            raise
+        return client
+
+    def spawn(self, target, *args, delay=0.0):
+        def run():
+            if delay:
+                time.sleep(delay)
+            target(*args)
+        threading.Thread(target=run).start()
@@ -1,12 +1,40 @@
 import hashlib
 import re
 
+META_PREFIX = "::"
+# the metadata tokens a request may end with: "node" marks a request forwarded by another node, and only
+# then is its "hash" taken; "trace" is also accepted from clients (trace_client.py)
+META_NAMES = ("hash", "trace", "node")
+
 def hash_key(key):
     key = key.lower().strip()
-    return int(hashlib.sha1(key.encode()).hexdigest(), 16) % (2 ** 64)
+    # the last 8 digest bytes are the sha1 value modulo 2 ** 64
+    return int.from_bytes(hashlib.sha1(key.encode()).digest()[-8:], "big")
+
+
+def format_meta(**meta):
+    # trailing "::name=value" tokens carried alongside a forwarded command
+    return "".join(f" {META_PREFIX}{name}={value}" for name, value in meta.items() if value is not None)
 
-def log(prefix, output):
-    print(f"{prefix}{output}")
+
+def split_meta(request):
+    meta = {}
+    request = request.strip()
+    marker = " " + META_PREFIX
+    # peel the known "::name=value" tokens off the end of the request, anything else is the request's own text
+    while True:
+        idx = request.rfind(marker)
+        if idx == -1:
+            break
+        name, sep, value = request[idx + len(marker):].partition("=")
+        if not sep or name not in META_NAMES or " " in value or '"' in value:
+            break
+        meta[name] = value
+        request = request[:idx]
+    if "node" not in meta:
+        # a client's hash is not trusted, a wrong one would place the key where no query finds it
+        meta.pop("hash", None)
+    return request, meta
 
 
 def custom_split(request):
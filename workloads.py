@@ -0,0 +1,176 @@
+import os
+import random
+import string
+
+# YCSB core workloads: operation mix and the default key chooser
+WORKLOADS = {
+    "A": {"description": "Update heavy", "read": 0.5, "update": 0.5, "distribution": "zipfian"},
+    "B": {"description": "Read mostly", "read": 0.95, "update": 0.05, "distribution": "zipfian"},
+    "C": {"description": "Read only", "read": 1.0, "distribution": "zipfian"},
+    "D": {"description": "Read latest", "read": 0.95, "insert": 0.05, "distribution": "latest"},
+    "E": {"description": "Short ranges", "scan": 0.95, "insert": 0.05, "distribution": "zipfian"},
+    "F": {"description": "Read-modify-write", "read": 0.5, "readmodifywrite": 0.5, "distribution": "zipfian"},
+}
+OPERATIONS = ["read", "update", "insert", "scan", "readmodifywrite"]
+ZIPFIAN_CONSTANT = 0.99
+
+
+def fnv_hash(value):
+    # 64-bit FNV-1a, used by YCSB to scatter the popular items over the key space
+    result = 0xCBF29CE484222325
+    for _ in range(8):
+        result ^= value & 0xFF
+        result = (result * 0x100000001B3) & 0xFFFFFFFFFFFFFFFF
+        value >>= 8
+    return result
+
+
+class ZipfianChooser:
+    # Gray et al., "Quickly generating billion-record synthetic databases", as in YCSB's ZipfianGenerator
+    def __init__(self, items, rng, theta=ZIPFIAN_CONSTANT):
+        self.rng = rng
+        self.theta = theta
+        self.zeta2 = self.zeta(2)
+        self.alpha = 1.0 / (1.0 - theta)
+        self.count = 0
+        self.zetan = 0.0
+        self.grow(items)
+
+    def zeta(self, n, start=0, total=0.0):
+        for i in range(start, n):
+            total += 1.0 / (i + 1) ** self.theta
+        return total
+
+    def grow(self, items):
+        # zeta is extended incrementally as records get inserted
+        self.zetan = self.zeta(items, self.count, self.zetan)
+        self.count = items
+        self.eta = (1 - (2.0 / items) ** (1 - self.theta)) / (1 - self.zeta2 / self.zetan) if items > 1 else 0.0
+
+    def next(self, items=None):
+        if items is not None and items > self.count:
+            self.grow(items)
+        u = self.rng.random()
+        uz = u * self.zetan
+        if uz < 1.0:
+            return 0
+        if uz < 1.0 + 0.5 ** self.theta:
+            return 1
+        return min(self.count - 1, int(self.count * (self.eta * u - self.eta + 1) ** self.alpha))
+
+
+class UniformChooser:
+    def __init__(self, items, rng):
+        self.rng = rng
+
+    def next(self, items):
+        return self.rng.randrange(items)
+
+
+class ScrambledZipfianChooser:
+    # zipfian popularity, but the popular items are spread over the key space instead of clustered at 0
+    def __init__(self, items, rng):
+        self.zipfian = ZipfianChooser(items, rng)
+
+    def next(self, items):
+        return fnv_hash(self.zipfian.next()) % items
+
+
+class LatestChooser:
+    # zipfian over recency: the most recently inserted records are the most popular
+    def __init__(self, items, rng):
+        self.zipfian = ZipfianChooser(items, rng)
+
+    def next(self, items):
+        return max(0, items - 1 - self.zipfian.next(items))
+
+
+CHOOSERS = {"uniform": UniformChooser, "zipfian": ScrambledZipfianChooser, "latest": LatestChooser}
+
+
+def record_key(index):
+    return f"user{index:010d}"
+
+
+class Workload:
+    def __init__(self, name, record_count=1000, operation_count=1000, value_size=100, distribution=None,
+                 scan_length=10, seed=None):
+        if name.upper() not in WORKLOADS:
+            raise ValueError(f"Unknown workload {name}, expected one of {', '.join(WORKLOADS)}")
+        self.name = name.upper()
+        self.spec = WORKLOADS[self.name]
+        self.record_count = record_count
+        self.operation_count = operation_count
+        self.value_size = value_size
+        self.distribution = distribution or self.spec["distribution"]
+        self.scan_length = scan_length
+        self.rng = random.Random(seed)
+
+    def value(self):
+        # values travel as a single protocol token, so no spaces or quotes
+        return "".join(self.rng.choices(string.ascii_letters + string.digits, k=self.value_size))
+
+    def load_commands(self):
+        return [f'insert "{record_key(index)}" {self.value()}' for index in range(self.record_count)]
+
+    def operations(self):
+        # (operation, commands) pairs; an update overwrites with the update command, an insert would append
+        chooser = CHOOSERS[self.distribution](self.record_count, self.rng)
+        mix = [(operation, self.spec[operation]) for operation in OPERATIONS if operation in self.spec]
+        names = [operation for operation, _ in mix]
+        weights = [weight for _, weight in mix]
+        inserted = self.record_count
+        ops = []
+        for _ in range(self.operation_count):
+            operation = self.rng.choices(names, weights)[0]
+            if operation == "insert":
+                ops.append((operation, [f'insert "{record_key(inserted)}" {self.value()}']))
+                inserted += 1
+                continue
+            key = record_key(chooser.next(inserted))
+            if operation == "read":
+                ops.append((operation, [f'query "{key}"']))
+            elif operation == "update":
+                ops.append((operation, [f'update "{key}" {self.value()}']))
+            elif operation == "readmodifywrite":
+                ops.append((operation, [f'query "{key}"', f'update "{key}" {self.value()}']))
+            elif operation == "scan":
+                # no range scans on a hash-partitioned ring: read a run of consecutive records instead
+                start = int(key[4:])
+                length = self.rng.randint(1, self.scan_length)
+                ops.append((operation, [f'query "{record_key(index)}"'
+                                        for index in range(start, min(start + length, inserted))]))
+        return ops
+
+
+def request_files(directory, prefix):
+    # the insert_*.txt / query_*.txt files of a request directory, in order
+    return sorted(f for f in os.listdir(directory) if f.startswith(prefix) and f.endswith(".txt"))
+
+
+def read_request_keys(directory, prefix):
+    # (file name, key) of every non-empty line, streamed file by file
+    for filename in request_files(directory, prefix):
+        with open(os.path.join(directory, filename), 'r', encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    yield filename, line.strip()
+
+
+def read_inserts(directory):
+    # the value of every key is the number in its file's name
+    for filename, key in read_request_keys(directory, "insert_"):
+        yield f"insert \"{key}\" {filename.split('_')[1]}"
+
+
+def read_queries(directory):
+    for _, key in read_request_keys(directory, "query_"):
+        yield f"query \"{key}\""
+
+
+def read_insert_commands(directory):
+    return list(read_inserts(directory))
+
+
+def read_query_commands(directory):
+    return list(read_queries(directory))